@@ -0,0 +1,368 @@
+"""
+End-to-end latency benchmark of a mix request.
+
+Drives `MCPOpenAIClient.process_query` against a scripted stand-in for the OpenAI chat
+completions API and the MCP server running in-process on the in-memory DAW backend,
+connected through the in-memory MCP transport. Reports per-phase timings (LLM wait,
+MCP transport, tool execution, REAPER calls, RAG lookup), payload sizes and p50/p95
+query latency, and saves the results as JSON to compare commits.
+
+    python benchmarks/bench_e2e.py --tracks 50 --repeat 10 --rpc-latency 0.0005
+"""
+import argparse
+import asyncio
+import functools
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+SRC = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src")
+sys.path.insert(0, SRC)
+# The benchmark provides its own knowledge base when DB_PATH is not set
+os.environ.setdefault("SERVER_WARMUP", "0")
+
+import daw  # noqa: E402
+import server  # noqa: E402
+from client import MCPOpenAIClient  # noqa: E402
+from daw import FakeBackend  # noqa: E402
+from mcp.shared.memory import create_connected_server_and_client_session  # noqa: E402
+from openai.types.chat import ChatCompletion, ChatCompletionChunk  # noqa: E402
+
+
+class Phases:
+    """
+    Accumulated time and counters of one query.
+
+    Times are summed over calls, so phases of concurrent tool calls can add up to more
+    than the wall-clock latency of the query.
+    """
+
+    def __init__(self):
+        self.seconds = {"llm_wait": 0.0, "mcp_call": 0.0, "tool_execution": 0.0, "reaper_calls": 0.0, "rag_lookup": 0.0}
+        self.counts = {"llm_calls": 0, "tool_calls": 0, "reaper_calls": 0, "rag_lookups": 0}
+        self.bytes = {"prompt": 0, "tool_results": 0}
+
+    def to_dict(self) -> dict:
+        seconds = dict(self.seconds)
+        # Time spent in the MCP layer itself: serialization, transport and dispatch
+        seconds["mcp_transport"] = max(seconds.pop("mcp_call") - seconds["tool_execution"], 0.0)
+        return {"seconds": seconds, "counts": self.counts, "bytes": self.bytes}
+
+
+class TimedFakeBackend(FakeBackend):
+    phases: Phases = None
+
+    def _rpc(self):
+        start = time.perf_counter()
+        super()._rpc()
+        if self.phases is not None:
+            self.phases.seconds["reaper_calls"] += time.perf_counter() - start
+            self.phases.counts["reaper_calls"] += 1
+
+
+class FakeKnowledgeBase:
+    """Stand-in for the Chroma store when DB_PATH is not set."""
+
+    def __init__(self, latency: float):
+        self.latency = latency
+
+    def search(self, query: str, k: int = 3) -> tuple:
+        time.sleep(self.latency)
+        return tuple(f"Advice {i} about '{query}': cut mud around 250-500 Hz, add air above 10 kHz." for i in range(k))
+
+    def stats(self) -> dict:
+        return {}
+
+
+def _tool_call(turn: int, index: int, name: str, arguments: dict) -> dict:
+    return {
+        "id": f"call_{turn}_{index}",
+        "type": "function",
+        "function": {"name": name, "arguments": json.dumps(arguments)},
+    }
+
+
+class Scenario:
+    """A scripted conversation: the assistant message of each turn."""
+
+    name = ""
+    query = ""
+    fast_path = False
+
+    def __init__(self, track_names: list[str], use_plan: bool):
+        self.track_names = track_names
+        self.use_plan = use_plan
+
+    def respond(self, turn: int) -> dict:
+        raise NotImplementedError
+
+
+class BalanceVolumes(Scenario):
+    name = "balance_volumes"
+    query = "Balance the volumes of all tracks, keep the first track at the front."
+
+    def respond(self, turn):
+        # The project state comes with the query, no get_project_info turn
+        if turn == 0:
+            changes = [(name, -1.5 if i else 1.0) for i, name in enumerate(self.track_names)]
+            if self.use_plan:
+                operations = [{"track_name": name, "action": "volume", "db_change": db} for name, db in changes]
+                calls = [_tool_call(turn, 0, "apply_mix_plan", {"operations": operations})]
+            else:
+                calls = [
+                    _tool_call(turn, i, "set_track_volume", {"track_name": name, "db_change": db})
+                    for i, (name, db) in enumerate(changes)
+                ]
+            return {"role": "assistant", "content": "### Action\nAdjusting volumes.", "tool_calls": calls}
+        return {"role": "assistant", "content": "##Final answer\nVolumes balanced."}
+
+
+class EqEveryTrack(Scenario):
+    name = "eq_every_track"
+    query = "Apply EQ on all tracks in the session, tailored to each role."
+
+    def respond(self, turn):
+        if turn == 0:
+            return {"role": "assistant", "content": "### Thought\nChecking EQ best practices.",
+                    "tool_calls": [_tool_call(turn, 0, "get_information_query_chroma", {"query": "How to EQ each instrument?"})]}
+        if turn == 1:
+            settings = {"gain_band_2": -2.5, "freq_band_2": 350.0, "freq_high_pass_5": 80.0}
+            if self.use_plan:
+                operations = [
+                    {"track_name": name, "action": "fx", "fx_name": "ReaEQ", "settings": settings}
+                    for name in self.track_names
+                ]
+                calls = [_tool_call(turn, 0, "apply_mix_plan", {"operations": operations})]
+            else:
+                calls = [
+                    _tool_call(turn, i, "set_track_FX", {"track_name": name, "fx_name": "ReaEQ", "new_settings": settings})
+                    for i, name in enumerate(self.track_names)
+                ]
+            return {"role": "assistant", "content": "### Action\nApplying EQ.", "tool_calls": calls}
+        return {"role": "assistant", "content": "##Final answer\nEvery track is EQed."}
+
+
+class SimpleVolume(Scenario):
+    name = "simple_volume"
+    fast_path = True
+
+    @property
+    def query(self):
+        return f"lower the {self.track_names[0]} by 3 dB"
+
+    def respond(self, turn):
+        if turn == 0:
+            return {"role": "assistant", "content": None,
+                    "tool_calls": [_tool_call(turn, 0, "set_track_volume", {"track_name": self.track_names[0], "db_change": -3.0})]}
+        return {"role": "assistant", "content": "##Final answer\nDone."}
+
+
+SCENARIOS = {scenario.name: scenario for scenario in (BalanceVolumes, EqEveryTrack, SimpleVolume)}
+
+
+class ScriptedCompletions:
+    """Stand-in for `AsyncOpenAI().chat.completions`, answering from a scenario."""
+
+    def __init__(self, scenario: Scenario, phases: Phases, latency: float, per_token_latency: float):
+        self.scenario = scenario
+        self.phases = phases
+        self.latency = latency
+        self.per_token_latency = per_token_latency
+
+    async def create(self, *, model, messages, stream=False, **kwargs):
+        start = time.perf_counter()
+        prompt = json.dumps(messages, default=str, ensure_ascii=False)
+        self.phases.bytes["prompt"] += len(prompt.encode())
+        self.phases.counts["llm_calls"] += 1
+        turn = sum(1 for message in messages if message.get("role") == "assistant")
+        message = self.scenario.respond(turn)
+        await asyncio.sleep(self.latency + len(prompt) / 4 * self.per_token_latency)
+        self.phases.seconds["llm_wait"] += time.perf_counter() - start
+
+        finish_reason = "tool_calls" if message.get("tool_calls") else "stop"
+        if not stream:
+            return ChatCompletion.model_validate({
+                "id": "bench", "object": "chat.completion", "created": 0, "model": model,
+                "choices": [{"index": 0, "finish_reason": finish_reason, "message": message}],
+            })
+        return self._stream(model, message, finish_reason)
+
+    async def _stream(self, model, message, finish_reason):
+        def chunk(delta, finish=None):
+            return ChatCompletionChunk.model_validate({
+                "id": "bench", "object": "chat.completion.chunk", "created": 0, "model": model,
+                "choices": [{"index": 0, "delta": delta, "finish_reason": finish}],
+            })
+
+        for word in (message.get("content") or "").split(" "):
+            yield chunk({"content": word + " "})
+        for index, tool_call in enumerate(message.get("tool_calls") or []):
+            yield chunk({"tool_calls": [{"index": index, **tool_call}]})
+        yield chunk({}, finish_reason)
+
+
+class ScriptedOpenAI:
+    def __init__(self, completions: ScriptedCompletions):
+        self.chat = type("Chat", (), {"completions": completions})()
+
+
+def _instrument_tools(phases_ref: list):
+    """Time every server tool, once per process."""
+    for tool in server.mcp._tool_manager.list_tools():
+        if getattr(tool.fn, "_bench_timed", False):
+            continue
+
+        def timed(fn):
+            @functools.wraps(fn)
+            async def wrapper(*args, **kwargs):
+                start = time.perf_counter()
+                try:
+                    return await fn(*args, **kwargs)
+                finally:
+                    phases_ref[0].seconds["tool_execution"] += time.perf_counter() - start
+                    phases_ref[0].counts["tool_calls"] += 1
+
+            wrapper._bench_timed = True
+            return wrapper
+
+        tool.fn = timed(tool.fn)
+
+
+def _reset_server(backend: FakeBackend, knowledge_latency: float, phases: Phases):
+    daw.set_backend(backend)
+    server.reset_state()
+    if not os.getenv("DB_PATH"):
+        server._knowledge_base = FakeKnowledgeBase(knowledge_latency)
+
+    knowledge_base = server.get_knowledge_base()
+    if not getattr(knowledge_base.search, "_bench_timed", False):
+        search = knowledge_base.search
+
+        @functools.wraps(search)
+        def timed_search(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return search(*args, **kwargs)
+            finally:
+                timed_search.phases.seconds["rag_lookup"] += time.perf_counter() - start
+                timed_search.phases.counts["rag_lookups"] += 1
+
+        timed_search._bench_timed = True
+        knowledge_base.search = timed_search
+    knowledge_base.search.phases = phases
+
+
+async def run_query(scenario_cls, args, phases_ref: list) -> dict:
+    phases = Phases()
+    phases_ref[0] = phases
+    backend = TimedFakeBackend.synthetic(
+        n_tracks=args.tracks, fx_per_track=args.fx_per_track,
+        latency=args.rpc_latency, batched_latency=args.batched_rpc_latency,
+    )
+    backend.phases = phases
+    _reset_server(backend, args.rag_latency, phases)
+
+    track_names = [track._name for track in backend.project._tracks]
+    scenario = scenario_cls(track_names, use_plan=not args.no_plan)
+    client = MCPOpenAIClient(api_key="benchmark", stream=args.stream, fast_path=scenario.fast_path)
+    client.openai_client = ScriptedOpenAI(ScriptedCompletions(scenario, phases, args.llm_latency, args.llm_token_latency))
+
+    async with create_connected_server_and_client_session(server.mcp._mcp_server) as session:
+        client.session = session
+        call_tool = client.call_tool
+
+        async def timed_call_tool(name, arguments=None):
+            start = time.perf_counter()
+            try:
+                result = await call_tool(name, arguments)
+            finally:
+                phases.seconds["mcp_call"] += time.perf_counter() - start
+            phases.bytes["tool_results"] += sum(len(getattr(c, "text", "").encode()) for c in result.content)
+            return result
+
+        client.call_tool = timed_call_tool
+        start = time.perf_counter()
+        answer = await client.process_query(scenario.query)
+        total = time.perf_counter() - start
+
+    return {"total_seconds": total, "answer": answer[:200], **phases.to_dict()}
+
+
+def _percentile(values: list[float], q: float) -> float:
+    values = sorted(values)
+    if len(values) == 1:
+        return values[0]
+    position = (len(values) - 1) * q
+    low = int(position)
+    high = min(low + 1, len(values) - 1)
+    return values[low] + (values[high] - values[low]) * (position - low)
+
+
+def summarize(runs: list[dict]) -> dict:
+    totals = [run["total_seconds"] for run in runs]
+    phases = runs[0]["seconds"].keys()
+    return {
+        "runs": len(runs),
+        "latency_seconds": {
+            "p50": _percentile(totals, 0.50),
+            "p95": _percentile(totals, 0.95),
+            "mean": statistics.mean(totals),
+        },
+        "phase_seconds_mean": {phase: statistics.mean(run["seconds"][phase] for run in runs) for phase in phases},
+        "counts_mean": {key: statistics.mean(run["counts"][key] for run in runs) for key in runs[0]["counts"]},
+        "bytes_mean": {key: statistics.mean(run["bytes"][key] for run in runs) for key in runs[0]["bytes"]},
+    }
+
+
+def _git_revision() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True, cwd=SRC
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scenario", action="append", choices=list(SCENARIOS), help="Default: all scenarios")
+    parser.add_argument("--tracks", type=int, default=50)
+    parser.add_argument("--fx-per-track", type=int, default=2)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--rpc-latency", type=float, default=0.0005, help="Seconds per REAPER call")
+    parser.add_argument("--batched-rpc-latency", type=float, default=0.00002, help="Seconds per call inside a batch")
+    parser.add_argument("--llm-latency", type=float, default=0.5, help="Fixed seconds per completion")
+    parser.add_argument("--llm-token-latency", type=float, default=0.00002, help="Seconds per prompt token")
+    parser.add_argument("--rag-latency", type=float, default=0.02, help="Seconds per knowledge-base lookup")
+    parser.add_argument("--stream", action="store_true", help="Use the streaming client")
+    parser.add_argument("--no-plan", action="store_true", help="Script one tool call per change instead of apply_mix_plan")
+    parser.add_argument("--output", help="Default: benchmarks/results/<git revision>.json")
+    args = parser.parse_args()
+
+    phases_ref = [Phases()]
+    _instrument_tools(phases_ref)
+
+    revision = _git_revision()
+    results = {"revision": revision, "config": vars(args), "scenarios": {}}
+    for name in args.scenario or list(SCENARIOS):
+        runs = [await run_query(SCENARIOS[name], args, phases_ref) for _ in range(args.repeat)]
+        summary = summarize(runs)
+        results["scenarios"][name] = {"summary": summary, "runs": runs}
+        latency = summary["latency_seconds"]
+        print(
+            f"{name:>16}: p50 {latency['p50'] * 1000:8.1f} ms  p95 {latency['p95'] * 1000:8.1f} ms  | "
+            + "  ".join(f"{phase} {seconds * 1000:.1f} ms" for phase, seconds in summary["phase_seconds_mean"].items())
+        )
+
+    output = args.output or os.path.join(os.path.dirname(os.path.abspath(__file__)), "results", f"{revision}.json")
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"results saved to {output}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
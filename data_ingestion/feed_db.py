@@ -1,5 +1,12 @@
+
 import asyncio
+import hashlib
+import json
 import os
+import resource
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, as_completed
 
 from langchain_community.document_loaders import PyPDFLoader
 from langchain.text_splitter import RecursiveCharacterTextSplitter
@@ -8,54 +15,280 @@ from langchain.embeddings import FastEmbedEmbeddings
 
 
 db_path = os.getenv("DB_PATH")
+MANIFEST_NAME = "ingestion_manifest.json"
+
+# Pipeline config
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", os.cpu_count() or 1))
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", "256"))
 
-# Embeddings + split config
-embedding = FastEmbedEmbeddings()
+# Split config
 text_splitter = RecursiveCharacterTextSplitter(
     chunk_size=500,
     chunk_overlap=50,
     separators=["\n\n", "\n", " "],
 )
 
+_embedding = None
+
+
+def get_embedding():
+    """Embedding model, created in the parent process only so PDF workers stay light."""
+    global _embedding
+    if _embedding is None:
+        _embedding = FastEmbedEmbeddings(batch_size=EMBED_BATCH_SIZE, threads=os.cpu_count())
+    return _embedding
+
+
+def content_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def file_hash(file_path: str) -> str:
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def list_sources(path: str) -> list[str]:
+    """
+    Args:
+        path: A PDF file, or a directory searched recursively for PDF files.
+
+    Returns:
+        list[str]: Absolute paths of the PDF files, sorted.
+    """
+    if os.path.isfile(path):
+        return [os.path.abspath(path)]
+
+    sources = []
+    for root, _, files in os.walk(path):
+        sources.extend(os.path.abspath(os.path.join(root, f)) for f in files if f.lower().endswith(".pdf"))
+    return sorted(sources)
+
+
+def load_manifest() -> dict:
+    manifest_path = os.path.join(db_path, MANIFEST_NAME)
+    if not os.path.exists(manifest_path):
+        return {}
+    with open(manifest_path) as f:
+        return json.load(f)
+
+
+def save_manifest(manifest: dict):
+    os.makedirs(db_path, exist_ok=True)
+    manifest_path = os.path.join(db_path, MANIFEST_NAME)
+    with open(manifest_path + ".tmp", "w") as f:
+        json.dump(manifest, f)
+    os.replace(manifest_path + ".tmp", manifest_path)
+
+
+def split_page(page) -> tuple[list, list[str]]:
+    """
+    Split a page into chunks.
+
+    Returns:
+        tuple: The chunks, and the hashes of their content.
+    """
+    chunks = text_splitter.split_documents([page])
+    hashes = []
+    for chunk in chunks:
+        chunk.metadata["content_hash"] = content_hash(chunk.page_content)
+        hashes.append(chunk.metadata["content_hash"])
+    return chunks, hashes
+
+
+def chunk_id(source: str, chunk_hash: str, occurrence: int) -> str:
+    """
+    Id of a chunk: its content hash, and how many identical chunks come before it in the
+    guide, since the same text may appear several times. It does not depend on the page,
+    so pages inserted or removed elsewhere in the guide leave it unchanged.
+    """
+    return content_hash(f"{source}|{chunk_hash}|{occurrence}")
+
 
-async def get_pdf_text(file_path):
+def entry_ids(entry: dict) -> list[str]:
+    """Chunk ids of a manifest entry, including entries written before ids were per content."""
+    if "chunks" in entry:
+        return entry["chunks"]
+    return [cid for page in entry.get("pages", {}).values() for cid in page["chunks"]]
 
-    loader = PyPDFLoader(file_path)
-    docs = loader.load()
-    await store_chunks(docs)
 
-    text = ""
-    for doc in docs:
-        text += doc.page_content + "\n"
+def load_pdf(file_path: str, previous_hash) -> tuple:
+    """
+    Parse a PDF, in a worker process.
 
-    return text
+    Returns:
+        tuple: (file hash, pages), pages being None when the file did not change.
+    """
+    source_hash = file_hash(file_path)
+    if source_hash == previous_hash:
+        return source_hash, None
+    return source_hash, PyPDFLoader(file_path).load()
+
+
+def diff_pages(file_path: str, source_hash: str, docs: list, previous: dict) -> tuple:
+    """
+    Find the chunks of a PDF that are not in the store yet.
+
+    Chunks are identified by their content (see `chunk_id`), so only new or edited text is
+    embedded again. Pages seen in the previous run are not split again.
+
+    Args:
+        file_path: Path of the PDF.
+        source_hash: Hash of the PDF file.
+        docs: The pages of the PDF.
+        previous: Manifest entry of the file from the previous run, or an empty dict.
+
+    Returns:
+        tuple: (new manifest entry, chunks to embed, their ids, ids of removed chunks).
+    """
+    known_pages = previous.get("page_chunks", {})
+    page_chunks = {}
+    split = {}
+    order = []
+    for index, doc in enumerate(docs):
+        page_hash = content_hash(doc.page_content)
+        if page_hash in known_pages:
+            page_chunks[page_hash] = known_pages[page_hash]
+        elif page_hash not in page_chunks:
+            split[index] = split_page(doc)
+            page_chunks[page_hash] = split[index][1]
+        order.extend((index, position, chunk_hash) for position, chunk_hash in enumerate(page_chunks[page_hash]))
+
+    old_ids = set(entry_ids(previous))
+    occurrences = {}
+    ids = []
+    new_chunks, new_ids = [], []
+    for index, position, chunk_hash in order:
+        occurrences[chunk_hash] = occurrences.get(chunk_hash, -1) + 1
+        cid = chunk_id(file_path, chunk_hash, occurrences[chunk_hash])
+        ids.append(cid)
+        if cid in old_ids:
+            continue
+        # Usually a page that was just split, or an earlier copy of a chunk was added
+        if index not in split:
+            split[index] = split_page(docs[index])
+        chunk = split[index][0][position]
+        chunk.metadata["page_hash"] = content_hash(docs[index].page_content)
+        new_chunks.append(chunk)
+        new_ids.append(cid)
+
+    kept = set(ids)
+    removed = [cid for cid in old_ids if cid not in kept]
+    return {"file_hash": source_hash, "page_chunks": page_chunks, "chunks": ids}, new_chunks, new_ids, removed
+
+
+class IngestionStats:
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.files = 0
+        self.pages = 0
+        self.chunks = 0
+
+    def report(self) -> str:
+        elapsed = max(time.perf_counter() - self.start, 1e-9)
+        # ru_maxrss is in kilobytes on Linux; children are only counted once the pool exited
+        own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+        workers = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024
+        return (
+            f"{self.files} files, {self.pages} pages, {self.chunks} chunks in {elapsed:.1f}s | "
+            f"{self.pages / elapsed:.1f} pages/s, {self.chunks / elapsed:.1f} chunks/s | "
+            f"peak memory {own:.0f} MB (largest worker {workers:.0f} MB)"
+        )
 
 
 async def query_chroma(query):
-    
-    vector_store = Chroma(persist_directory=db_path, embedding_function=embedding)
+
+    vector_store = Chroma(persist_directory=db_path, embedding_function=get_embedding())
     results = vector_store.similarity_search(query, k=8)
-   
+
     return results
 
 
-async def store_chunks(docs):
-    chunks = text_splitter.split_documents(docs)
- 
-    vector_store = Chroma(
-        embedding_function=embedding,
-        persist_directory=db_path
-    )
-    vector_store.add_documents(chunks)
+async def ingest(sources: list[str], manifest: dict, stats: IngestionStats):
+    """
+    Streaming ingestion: PDFs are parsed in a process pool, pages are split as soon as
+    their file is parsed, and chunks are embedded and written in fixed-size batches of
+    EMBED_BATCH_SIZE. A file is recorded in the manifest once all its chunks are stored.
+
+    Args:
+        sources: Paths of the PDFs to ingest.
+        manifest: Manifest of the previous run, updated in place.
+        stats: Counters of the run.
+    """
+    vector_store = Chroma(embedding_function=get_embedding(), persist_directory=db_path)
+    buffer_chunks, buffer_ids = [], []
+    pending = deque()
+    written = 0
+    queued = 0
+
+    def flush(limit: int):
+        nonlocal written
+        while len(buffer_chunks) >= limit and buffer_chunks:
+            batch, batch_ids = buffer_chunks[:EMBED_BATCH_SIZE], buffer_ids[:EMBED_BATCH_SIZE]
+            del buffer_chunks[:EMBED_BATCH_SIZE], buffer_ids[:EMBED_BATCH_SIZE]
+            vector_store.add_documents(batch, ids=batch_ids)
+            written += len(batch)
+            stats.chunks += len(batch)
+        while pending and pending[0][2] <= written:
+            doc, entry, _ = pending.popleft()
+            manifest[doc] = entry
+            save_manifest(manifest)
+
+    with ProcessPoolExecutor(max_workers=INGEST_WORKERS) as pool:
+        futures = {
+            pool.submit(load_pdf, doc, manifest.get(doc, {}).get("file_hash")): doc
+            for doc in sources
+        }
+        for future in as_completed(futures):
+            doc = futures[future]
+            source_hash, docs = future.result()
+            stats.files += 1
+            if docs is None:
+                continue
+
+            stats.pages += len(docs)
+            entry, chunks, ids, removed = diff_pages(doc, source_hash, docs, manifest.get(doc, {}))
+            if removed:
+                vector_store.delete(ids=removed)
+            print(f"{doc}: {len(ids)} chunks to embed, {len(removed)} removed")
+
+            buffer_chunks.extend(chunks)
+            buffer_ids.extend(ids)
+            queued += len(ids)
+            pending.append((doc, entry, queued))
+            flush(EMBED_BATCH_SIZE)
+
+    flush(1)
     vector_store.persist()
 
 
+async def remove_source(entry: dict):
+    removed = entry_ids(entry)
+    if removed:
+        vector_store = Chroma(embedding_function=get_embedding(), persist_directory=db_path)
+        vector_store.delete(ids=removed)
+        vector_store.persist()
+
+
 async def main():
     ressources = os.getenv("RESSOURCES")
-    docs = [ressources]
-    for doc in docs:
+    manifest = load_manifest()
+    sources = list_sources(ressources)
+    stats = IngestionStats()
+
+    await ingest(sources, manifest, stats)
+
+    # Guides deleted from the resources directory
+    if os.path.isdir(ressources):
+        root = os.path.abspath(ressources)
+        for doc in [d for d in manifest if d.startswith(root + os.sep) and d not in sources]:
+            await remove_source(manifest.pop(doc))
+            save_manifest(manifest)
 
-        await get_pdf_text(doc)
+    print(stats.report())
 
     res = await query_chroma("What are good compression settings for vocals?")
 
@@ -0,0 +1,129 @@
+import time
+from collections import OrderedDict
+from typing import Optional
+
+from encoding import _SHORT_ATTRS, _encode_params, encode_track, fx_labels
+from snapshot import ProjectSnapshot, TrackSnapshot
+
+
+class ChangeFeed:
+    """
+    Monotonic version of the project state, and the states seen at the most recent versions.
+
+    The version moves by one every time `observe` sees a state different from the last
+    one. It starts from the clock, in milliseconds, so versions handed out before a
+    server restart are never reused. Recorded states share their unchanged tracks with
+    the state cache, so keeping many of them is cheap.
+    """
+
+    def __init__(self, history: int = 64):
+        self.history = history
+        self.version = int(time.time() * 1000)
+        self._states: OrderedDict[int, ProjectSnapshot] = OrderedDict()
+
+    def observe(self, snapshot: ProjectSnapshot) -> int:
+        """
+        Record the current project state.
+
+        Args:
+            snapshot (ProjectSnapshot): Current state, from the state cache.
+
+        Returns:
+            int: Version of the state.
+        """
+        if self._states:
+            last = self._states[self.version]
+            if not _project_changed(last, snapshot):
+                return self.version
+            self.version += 1
+        self._states[self.version] = snapshot
+        while len(self._states) > self.history:
+            self._states.popitem(last=False)
+        return self.version
+
+    def get(self, version: int) -> Optional[ProjectSnapshot]:
+        """The state at `version`, None if it is unknown or no longer kept."""
+        return self._states.get(version)
+
+
+def _project_changed(previous: ProjectSnapshot, current: ProjectSnapshot) -> bool:
+    if previous.tracks.keys() != current.tracks.keys():
+        return True
+    # Tracks the state cache did not read again are the same objects
+    return any(
+        track is not previous.tracks[name] and track != previous.tracks[name]
+        for name, track in current.tracks.items()
+    )
+
+
+def _track_changes(previous: TrackSnapshot, current: TrackSnapshot, fx_defaults: dict, digits: int) -> dict:
+    """
+    Attributes, FX and parameters of a track that changed, with short keys.
+
+    FX are matched by name and position among the FX of the same name on the track, and
+    their parameters are reported in the units of get_track_info.
+    """
+    changes = {
+        _SHORT_ATTRS[attr]: round(value, digits)
+        for attr, value in current.attributes.items()
+        if round(previous.attributes.get(attr, float("nan")), digits) != round(value, digits)
+    }
+    before, after = dict(fx_labels(previous)), dict(fx_labels(current))
+    fx_changes = {}
+    units = {}
+    for label, fx in after.items():
+        if label not in before:
+            # Parameters of a new FX are listed like in get_project_info
+            fx_changes[label] = _encode_params(fx, fx_defaults.get(fx.name), None, digits, units)
+            continue
+        fx_units = {}
+        old_values = _encode_params(before[label], None, {"*"}, digits, {})
+        new_values = _encode_params(fx, None, {"*"}, digits, fx_units)
+        params = {name: value for name, value in new_values.items() if old_values.get(name) != value}
+        if params:
+            fx_changes[label] = params
+            units.update({name: fx_units[name] for name in params if name in fx_units})
+    if fx_changes:
+        changes["fx"] = fx_changes
+    added = [label for label in after if label not in before]
+    removed = [label for label in before if label not in after]
+    if added:
+        changes["fx_added"] = added
+    if removed:
+        changes["fx_removed"] = removed
+    if units:
+        changes["units"] = units
+    return changes
+
+
+def encode_changes(previous: ProjectSnapshot, current: ProjectSnapshot, fx_defaults: Optional[dict] = None, digits: int = 3) -> dict:
+    """
+    What changed from one project state to another, with the keys of get_project_info.
+
+    Tracks are matched by their REAPER id, so a renamed track shows up in `renamed`
+    (old name -> new name) rather than as removed and added. Parameters are in physical
+    units where they have one, listed under `units` like in get_track_info.
+
+    Returns:
+        dict: `t` (track name -> changed `v` / `p` / `w`, `fx` with the changed parameters
+        of each FX, `fx_added`, `fx_removed`, `units`), `added` (new tracks, fully encoded),
+        `removed` and `renamed`, each only when not empty.
+    """
+    fx_defaults = fx_defaults or {}
+    before = {track.id: track for track in previous.tracks.values()}
+    after = {track.id: track for track in current.tracks.values()}
+    payload = {"t": {}, "added": {}, "removed": [], "renamed": {}}
+    for track_id, track in after.items():
+        old = before.get(track_id)
+        if old is None:
+            payload["added"][track.name] = encode_track(track, fx_defaults, digits=digits, physical=True)
+            continue
+        if old is track:
+            continue
+        if old.name != track.name:
+            payload["renamed"][old.name] = track.name
+        changes = _track_changes(old, track, fx_defaults, digits)
+        if changes:
+            payload["t"][track.name] = changes
+    payload["removed"] = [track.name for track_id, track in before.items() if track_id not in after]
+    return {key: value for key, value in payload.items() if value}
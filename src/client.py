@@ -2,20 +2,23 @@ import asyncio
 import nest_asyncio
 from mcp import ClientSession, StdioServerParameters
 from mcp.client.stdio import stdio_client
-import reapy
 import asyncio
 import json
 from contextlib import AsyncExitStack
 from typing import Any, Dict, List, Optional
 from dotenv import load_dotenv
 import os
+import time
+import uuid
 import nest_asyncio
 from dotenv import load_dotenv
 from mcp import ClientSession, StdioServerParameters
 from mcp.client.stdio import stdio_client
+from mcp import types
 from openai import AsyncOpenAI
-reapy.connect()
-project = reapy.Project()
+from dispatch import ToolCallDispatcher
+from conversation import ConversationContext
+from intent import parse_command
 
 PRE_PROMPT = (
     "You are a helpful assistant designed to control audio plugins on tracks in a DAW (Digital Audio Workstation). "
@@ -27,15 +30,22 @@ PRE_PROMPT = (
     "Select and call the most appropriate tool based on the current context. Use only the tools provided.\n\n"
     "**### Response**\n"
     "Summarize what has been done or what the next step is, based on the result of the tool call.\n\n"
-    "At the beginning of every new conversation or user request, you must start by calling the `get_project_info` tool. "
-    "This tool gives you the list of all available tracks, plugins, and their current settings.\n\n"
+    "Every user request comes with the current project state: all available tracks, plugins, and their current settings. "
+    "After each round of tool calls you are sent what changed in the project (`get_project_changes`), including edits "
+    "made by hand in REAPER, so only call `get_project_info` when the state was truncated or is missing.\n\n"
     "When applying audio FX such as EQ, compression, or reverb, first retrieve mixing best practices from the knowledge base "
     "by calling the appropriate tool (e.g. `get_information_query_chroma`). Use the information from the database as guidance and advice "
     "to apply the most suitable settings for the current context.\n\n"
-    "All EQ and frequency values must be normalized between 0.0 and 1.0."
-    "Gain values are scaled from -12 dB to +12 dB, and frequency values are log-scaled between 20 Hz and 20,000 Hz."
-    "Example: gain_db = 3.0 → normalized_gain = (3.0 + 12) / 24 = 0.625"
-    "Example: freq_hz = 60 → normalized_freq = log10(60 / 20) / log10(20000 / 20) ≈ 0.177"
+    "When a request touches several tracks or FX, apply all the changes at once with the `apply_mix_plan` tool "
+    "instead of calling `set_track_volume`, `set_track_pan` or `set_track_FX` once per change.\n\n"
+    "To compare mix versions or go back to an earlier one, use `save_mix_snapshot`, `diff_mix_snapshots` and "
+    "`recall_mix_snapshot` instead of undoing changes one by one.\n\n"
+    "When the user asks what is wrong with the mix or how tracks sound, call `analyze_tracks` to get "
+    "descriptors such as muddiness, masking or harshness before choosing settings.\n\n"
+    "Give FX settings in physical units: frequencies in Hz, gains and thresholds in dB, times in ms and "
+    "the compression ratio as N for N:1. The server converts them; `get_track_info`, `get_project_info` and `get_project_changes` "
+    "report values in the same units. "
+    "Other parameters (bandwidth, wet, dry, bypass) are normalized between 0.0 and 1.0.\n"
     "Do not make assumptions. Always act based on the actual project state.\n"
     "If any information is missing or unclear, ask follow-up questions.\n"
     "Always aim to be precise, cautious, and helpful.\n"
@@ -49,14 +59,26 @@ PRE_PROMPT = (
 load_dotenv()
 api_key = os.getenv("OPENAI_API_KEY")
 N_ITERATIONS_MAX = 8
+MAX_CONCURRENT_TOOL_CALLS = 8
+CONTEXT_TOKEN_BUDGET = 16000
+EXIT_COMMANDS = {"exit", "quit", "q"}
+# Append one JSON line per tool call to this file, with the trace id of its query
+CLIENT_TRACE_PATH = os.getenv("CLIENT_TRACE_PATH")
+# SSE endpoint of a server started with MCP_TRANSPORT=sse (e.g. http://127.0.0.1:8000/sse),
+# shared with other clients; a private stdio server is started when unset
+MCP_SERVER_URL = os.getenv("MCP_SERVER_URL")
 
 class MCPOpenAIClient:
 
-    def __init__(self, model: str = "gpt-4o", api_key: str  = None ):
+    def __init__(self, model: str = "gpt-4o", api_key: str  = None, stream: bool = False, fast_path: bool = True):
         """Initialize the OpenAI MCP client.
 
         Args:
             model: The OpenAI model to use.
+            stream: Stream the model responses, printing text as it arrives and
+                starting each tool call as soon as its arguments are complete.
+            fast_path: Run simple volume, pan and bypass commands directly,
+                without going through the model.
         """
         if not api_key:
             raise("No api Key set")
@@ -66,28 +88,50 @@ class MCPOpenAIClient:
         self.exit_stack = AsyncExitStack()
         self.openai_client = AsyncOpenAI(api_key=api_key)
         self.model = model
+        self.stream = stream
+        self.timings: List[Dict[str, Optional[float]]] = []
+        self.tokens_saved = 0
         self.stdio: Optional[Any] = None
         self.write: Optional[Any] = None
+        self._tools: Optional[List[Dict[str, Any]]] = None
+        self.fast_path = fast_path
+        self._track_list: Optional[Dict[str, Any]] = None
+        self.trace_id: Optional[str] = None
+        self.spans: List[Dict[str, Any]] = []
+        self.project_version: Optional[int] = None
+
+    async def __aenter__(self):
+        await self.connect_to_server()
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.cleanup()
 
     async def connect_to_server(self, server_script_path: str = "server.py"):
         """Connect to an MCP server.
 
         Args:
-            server_script_path: Path to the server script.
+            server_script_path: Path to the server script, started over stdio unless
+                MCP_SERVER_URL is set.
         """
-        # Server configuration
-        server_params = StdioServerParameters(
-            command="python",
-            args=[server_script_path],
-        )
+        if MCP_SERVER_URL:
+            from mcp.client.sse import sse_client
 
-        # Connect to the server
-        stdio_transport = await self.exit_stack.enter_async_context(
-            stdio_client(server_params)
-        )
-        self.stdio, self.write = stdio_transport
+            transport = await self.exit_stack.enter_async_context(sse_client(MCP_SERVER_URL))
+        else:
+            # Server configuration
+            server_params = StdioServerParameters(
+                command="python",
+                args=[server_script_path],
+            )
+
+            # Connect to the server
+            transport = await self.exit_stack.enter_async_context(
+                stdio_client(server_params)
+            )
+        self.stdio, self.write = transport
         self.session = await self.exit_stack.enter_async_context(
-            ClientSession(self.stdio, self.write)
+            ClientSession(self.stdio, self.write, message_handler=self._handle_message)
         )
 
         # Initialize the connection
@@ -100,12 +144,27 @@ class MCPOpenAIClient:
         #     print(f"  - {tool.name}: {tool.description}")
         
 
+    async def _handle_message(self, message) -> None:
+        """Drop the cached tool schema when the server signals a tool-list change."""
+        if isinstance(message, types.ServerNotification) and isinstance(
+            message.root, types.ToolListChangedNotification
+        ):
+            self._tools = None
+
     async def get_mcp_tools(self) -> List[Dict[str, Any]]:
         """Get available tools from the MCP server in OpenAI format.
 
+        The converted schema is cached for the whole session and only fetched
+        again after the server sends a tool-list change notification.
+
         Returns:
             A list of tools in OpenAI format.
         """
+        if self._tools is None:
+            self._tools = await self._list_tools()
+        return self._tools
+
+    async def _list_tools(self) -> List[Dict[str, Any]]:
         tools_result = await self.session.list_tools()
         return [
             {
@@ -119,50 +178,318 @@ class MCPOpenAIClient:
             for tool in tools_result.tools
         ]
 
+    async def call_tool(self, name: str, arguments: Optional[Dict[str, Any]] = None) -> types.CallToolResult:
+        """Call a tool, propagating the trace id of the current query to the server.
+
+        The trace id travels in the `_meta` of the request, so the server metrics
+        (`get_server_metrics`) can be matched with the client spans.
+
+        Args:
+            name: Name of the tool.
+            arguments: Arguments of the tool.
+
+        Returns:
+            The result of the tool call.
+        """
+        params = types.CallToolRequestParams.model_validate(
+            {"name": name, "arguments": arguments, "_meta": {"trace_id": self.trace_id}}
+        )
+        span = {"tool": name, "trace_id": self.trace_id, "start": time.time(), "error": None}
+        start = time.perf_counter()
+        try:
+            return await self.session.send_request(
+                types.ClientRequest(types.CallToolRequest(method="tools/call", params=params)),
+                types.CallToolResult,
+            )
+        except Exception as e:
+            span["error"] = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            span["duration_ms"] = (time.perf_counter() - start) * 1000
+            self.spans.append(span)
+            if CLIENT_TRACE_PATH:
+                with open(CLIENT_TRACE_PATH, "a") as f:
+                    f.write(json.dumps(span) + "\n")
+
+    def _new_dispatcher(self) -> ToolCallDispatcher:
+        """Dispatcher running the tool calls of one assistant message.
+
+        Calls on the same track keep their order, and at most
+        `MAX_CONCURRENT_TOOL_CALLS` run at once.
+        """
+        return ToolCallDispatcher(
+            self.call_tool,
+            MAX_CONCURRENT_TOOL_CALLS,
+        )
+
+    async def _complete(self, messages: list, tools: list) -> tuple:
+        """Run one model turn and dispatch its tool calls.
+
+        Returns:
+            The assistant message as a dict, one task per tool call, and the dispatcher
+            running them.
+        """
+        start = time.perf_counter()
+        response = await self.openai_client.chat.completions.create(
+            model=self.model,
+            temperature=0,
+            messages= messages,
+            tools=tools,
+            tool_choice="auto",
+        )
+        elapsed = time.perf_counter() - start
+        assistant_message = response.choices[0].message.model_dump(exclude_none=True)
+
+        if assistant_message.get("content"):
+            print("🧠🤖",assistant_message["content"])
+
+        dispatcher = self._new_dispatcher()
+        tasks = []
+        for tool_call in assistant_message.get("tool_calls", []):
+            name, arguments = tool_call["function"]["name"], tool_call["function"]["arguments"]
+            try:
+                tasks.append(dispatcher.submit(name, json.loads(arguments or "{}")))
+            except json.JSONDecodeError:
+                # Reported to the model as a failed tool call, like in streaming mode
+                tasks.append(asyncio.create_task(self._invalid_arguments(name, arguments)))
+        self.timings.append({"first_token": elapsed, "first_action": elapsed if tasks else None, "total": elapsed})
+        return assistant_message, tasks, dispatcher
+
+    async def _complete_streaming(self, messages: list, tools: list) -> tuple:
+        """Run one model turn in streaming mode.
+
+        Text is printed as it arrives and each tool call is dispatched as soon as its
+        arguments form a complete JSON object, while the model keeps generating.
+
+        Returns:
+            The assistant message as a dict, one task per tool call, and the dispatcher
+            running them.
+        """
+        start = time.perf_counter()
+        first_token = None
+        first_action = None
+        content = []
+        calls: Dict[int, Dict[str, Any]] = {}
+        dispatcher = self._new_dispatcher()
+
+        def dispatch(call):
+            nonlocal first_action
+            if call["task"] is not None or not call["name"]:
+                return
+            try:
+                arguments = json.loads(call["arguments"] or "{}")
+            except json.JSONDecodeError:
+                return
+            if first_action is None:
+                first_action = time.perf_counter() - start
+            call["task"] = dispatcher.submit(call["name"], arguments)
+
+        stream = await self.openai_client.chat.completions.create(
+            model=self.model,
+            temperature=0,
+            messages= messages,
+            tools=tools,
+            tool_choice="auto",
+            stream=True,
+        )
+        async for chunk in stream:
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].delta
+            if first_token is None and (delta.content or delta.tool_calls):
+                first_token = time.perf_counter() - start
+            if delta.content:
+                if not content:
+                    print("🧠🤖 ", end="")
+                print(delta.content, end="", flush=True)
+                content.append(delta.content)
+            for tool_call in delta.tool_calls or []:
+                call = calls.setdefault(tool_call.index, {"id": None, "name": "", "arguments": "", "task": None})
+                if tool_call.id:
+                    call["id"] = tool_call.id
+                if tool_call.function and tool_call.function.name:
+                    call["name"] += tool_call.function.name
+                if tool_call.function and tool_call.function.arguments:
+                    call["arguments"] += tool_call.function.arguments
+                    dispatch(call)
+        if content:
+            print()
+
+        ordered_calls = [calls[index] for index in sorted(calls)]
+        for call in ordered_calls:
+            # Calls without arguments, or whose arguments never parsed
+            dispatch(call)
+            if call["task"] is None:
+                call["task"] = asyncio.create_task(self._invalid_arguments(call["name"], call["arguments"]))
+
+        total = time.perf_counter() - start
+        print(f"⏱️ first token {first_token or total:.2f}s | first action "
+              f"{'-' if first_action is None else f'{first_action:.2f}s'} | total {total:.2f}s")
+        self.timings.append({"first_token": first_token, "first_action": first_action, "total": total})
+
+        assistant_message: Dict[str, Any] = {"role": "assistant", "content": "".join(content) or None}
+        if ordered_calls:
+            assistant_message["tool_calls"] = [
+                {
+                    "id": call["id"],
+                    "type": "function",
+                    "function": {"name": call["name"], "arguments": call["arguments"]},
+                }
+                for call in ordered_calls
+            ]
+        return assistant_message, [call["task"] for call in ordered_calls], dispatcher
+
+    @staticmethod
+    def _add_tool_results(context: ConversationContext, assistant_message: dict, results: list) -> list:
+        """Add the results of the tool calls of an assistant message to the conversation.
+
+        Returns:
+            The content added for each call, in the order of the calls.
+        """
+        contents = []
+        for tool_call, result in zip(assistant_message["tool_calls"], results):
+            name = tool_call["function"]["name"]
+            if isinstance(result, asyncio.CancelledError):
+                content = f"⏭️ Tool '{name}' not run: the final answer was given"
+            elif isinstance(result, BaseException):
+                content = f"❌ Tool '{name}' failed: {result}"
+            else:
+                content = f"✅ Tool '{name}' executed successfuly Result: {result.content[0].text}"
+            try:
+                arguments = json.loads(tool_call["function"]["arguments"] or "{}")
+            except json.JSONDecodeError:
+                arguments = None
+            context.add_tool_result(tool_call["id"], name, arguments, content)
+            contents.append(content)
+        return contents
+
+    @staticmethod
+    async def _invalid_arguments(name: str, arguments: str):
+        raise ValueError(f"invalid JSON arguments for tool '{name}': {arguments!r}")
+
+    async def _list_tracks(self) -> Dict[str, Any]:
+        result = await self.call_tool("list_tracks", {})
+        self._track_list = json.loads(result.content[0].text)
+        return self._track_list
+
+    async def _project_changes(self) -> Optional[str]:
+        """Fetch what changed in the project since the last call, the full state on the first.
+
+        Returns:
+            The JSON result, or None if nothing changed.
+        """
+        arguments = {} if self.project_version is None else {"since_version": self.project_version}
+        result = await self.call_tool("get_project_changes", arguments)
+        text = result.content[0].text
+        payload = json.loads(text)
+        self.project_version = payload["version"]
+        if not payload.get("full") and not set(payload) - {"version", "since"}:
+            return None
+        return text
+
+    async def try_fast_path(self, query: str) -> Optional[str]:
+        """Run a simple volume, pan or bypass command without the model.
+
+        The command is parsed against the cached track list. Anything the parser
+        is not sure about is left to the agent loop.
+
+        Args:
+            query: The user request.
+
+        Returns:
+            The tool result, or None if the query must go through the agent loop.
+        """
+        start = time.perf_counter()
+        if self._track_list is None:
+            await self._list_tracks()
+        intent = parse_command(query, self._track_list)
+        if intent is None:
+            return None
+
+        if intent.pan_target is not None or intent.tool == "set_track_FX":
+            # Current pan and FX chain are needed, read them fresh
+            track = (await self._list_tracks()).get(intent.arguments["track_name"])
+            if track is None:
+                return None
+            if intent.pan_target is not None:
+                intent.arguments["pan_change"] = intent.pan_target - track["p"]
+            elif not any(intent.arguments["fx_name"] in fx_name for fx_name in track["fx"]):
+                return None
+
+        result = await self.call_tool(intent.tool, intent.arguments)
+        text = result.content[0].text
+        if result.isError:
+            # Track renamed or removed by hand, FX missing, ...: let the assistant handle it
+            self._track_list = None
+            print(f"⚡ fast path failed, falling back to the assistant: {text}")
+            return None
+        print(f"⚡ {text} ({(time.perf_counter() - start) * 1000:.0f} ms)")
+        return text
+
     async def process_query(self, query: str) -> str:
-       
+
+        self.trace_id = uuid.uuid4().hex
+        if self.fast_path:
+            try:
+                answer = await self.try_fast_path(query)
+            except Exception as e:
+                print(f"⚡ fast path unavailable, falling back to the assistant: {e}")
+                answer = None
+            if answer is not None:
+                return answer
+
         tools = await self.get_mcp_tools()
 
-        messages = [{"role": "system", "content":PRE_PROMPT}, {"role": "user", "content": query}]
+        context = ConversationContext(PRE_PROMPT, token_budget=CONTEXT_TOKEN_BUDGET)
+        # Each query starts from a fresh context, so from the full state
+        self.project_version = None
+        try:
+            state = await self._project_changes()
+        except Exception as e:
+            print(f"📋 project state unavailable, the assistant will read it: {e}")
+            state = None
+        context.add_user(query if state is None else f"{query}\n\nCurrent project state: {state}")
         n = 0
-        while n < N_ITERATIONS_MAX:
-            response = await self.openai_client.chat.completions.create(
-                model=self.model,
-                temperature=0,
-                messages= messages,
-                tools=tools,
-                tool_choice="auto",
-            )           
-                
-            
-            assistant_message = response.choices[0].message
-            messages.append(assistant_message)
-
-            if assistant_message.content:
-                print("🧠🤖",assistant_message.content)
-                if "Final answer" in assistant_message.content:
-                    return assistant_message.content
-                   
-          
-            if assistant_message.tool_calls :
-                for tool_call in assistant_message.tool_calls:
-                    # Execute tool call
-                    result = await self.session.call_tool(
-                        tool_call.function.name,
-                        arguments=json.loads(tool_call.function.arguments),
-                    )
-                   
-
-                    # Add tool response to conversation
-                    messages.append(
-                        {
-                            "role": "tool",
-                            "tool_call_id": tool_call.id,
-                            "content": f"✅ Tool '{tool_call.function.name}' executed successfuly Result: {result.content[0].text}"
-                        }
-                    )          
-            
-            n+=1
+        try:
+            while n < N_ITERATIONS_MAX:
+                messages = context.for_completion()
+                if self.stream:
+                    assistant_message, tasks, dispatcher = await self._complete_streaming(messages, tools)
+                else:
+                    assistant_message, tasks, dispatcher = await self._complete(messages, tools)
+                context.add_assistant(assistant_message)
+
+                content = assistant_message.get("content")
+                if content and "Final answer" in content:
+                    if tasks:
+                        # Calls already sent may have written to the project: wait for them
+                        # and show what they did, drop the others
+                        dispatcher.cancel_unsent()
+                        results = await asyncio.gather(*tasks, return_exceptions=True)
+                        for result in self._add_tool_results(context, assistant_message, results):
+                            print(result)
+                    return content
+
+                if tasks:
+                    results = await asyncio.gather(*tasks, return_exceptions=True)
+                    # Add tool responses to conversation, in the order of the calls
+                    self._add_tool_results(context, assistant_message, results)
+
+                    if self.project_version is not None:
+                        # Effect of the tool calls and of any hand edit, as a delta
+                        try:
+                            changes = await self._project_changes()
+                        except Exception as e:
+                            print(f"📋 project changes unavailable: {e}")
+                            self.project_version = changes = None
+                        if changes is not None:
+                            context.add_user(f"Project changes since the last state: {changes}")
+
+                n+=1
+        finally:
+            self.tokens_saved = context.tokens_saved
+            if context.tokens_saved:
+                print(f"🧹 context compaction saved ~{context.tokens_saved} prompt tokens")
         return "FAILED"
     
     async def cleanup(self):
@@ -173,23 +500,36 @@ class MCPOpenAIClient:
 
 
 async def main():
-    """Main entry point for the client."""
-    client = MCPOpenAIClient(api_key=api_key)
+    """Main entry point for the client.
+
+    Keeps one server process, and so one REAPER connection, open for the whole
+    session and answers queries until the user types `exit`.
+    """
+    client = MCPOpenAIClient(api_key=api_key, stream=os.getenv("STREAM_RESPONSES", "1") == "1")
     await client.connect_to_server("server.py")
 
     # Example: Ask about company vacation policy
     """Let's start by balancing the volume of my tracks. I want the main lead to sit clearly at the front. Push all of the secondary leads like lead pan right or left extrem or mid slightly, harmonie, behind it in volume and space. Add some stereo width to theses secondary leads by panning it slightly off-center. And adjust the guitar volume assuming this change. """
 
     """"Apply EQ on all tracks in the session. Each track should have its own EQ tailored to its role: For the lead vocal, make it clear and present in the mix, make sure to  cut around 250–500 Hz For backing vocals (like lead pan, harmonies, doubles), carve out space so they support the lead without clashing—consider slight EQ cuts where the lead is boosted.For guitars, shape them to sit well in the mix without masking vocals. For any other tracks (ambient layers, synths, pads, percussions, etc.), apply appropriate EQ so they fit in the overall balance and don't conflict with the main elements. Make sure nothing is overlooked—every track should be EQed based on its role and frequency content." """
-    query = input("🤖 I'm your AI Assistant AUDIO, let's make this track sound fire:")
+    try:
+        prompt = "🤖 I'm your AI Assistant AUDIO, let's make this track sound fire:"
+        while True:
+            try:
+                query = await asyncio.to_thread(input, prompt)
+            except EOFError:
+                break
+            if query.strip().lower() in EXIT_COMMANDS:
+                break
+            if not query.strip():
+                continue
 
-
-    response = await client.process_query(query)
-    # print(f"\nResponse: {response}")
-  
-    await client.cleanup()
+            response = await client.process_query(query)
+            # print(f"\nResponse: {response}")
+            prompt = "🤖 What's next? (type 'exit' to quit):"
+    finally:
+        await client.cleanup()
  
 
 if __name__ == "__main__":
     asyncio.run(main())
-
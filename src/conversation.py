@@ -0,0 +1,117 @@
+import json
+from typing import Any, Dict, List, Optional
+
+from encoding import estimate_tokens
+
+# Tools whose result is a dump of the project state, superseded by any later dump
+STATE_TOOLS = {"get_project_info", "get_track_info", "get_project_changes"}
+
+
+def _message_tokens(message: Dict[str, Any]) -> int:
+    tokens = estimate_tokens(message.get("content") or "")
+    for tool_call in message.get("tool_calls") or []:
+        tokens += estimate_tokens(tool_call["function"]["arguments"])
+    return tokens
+
+
+class ConversationContext:
+    """
+    Messages of the agent loop, kept under a token budget.
+
+    - The system prompt is the first message and is never rewritten, so the prompt
+      prefix stays byte-stable and provider-side prompt caching keeps hitting.
+    - A project state dump is replaced by a short reference as soon as a later dump
+      covers the same tracks.
+    - When the conversation grows over the budget, tool results older than the last
+      `keep_recent` turns are compacted into short summaries.
+
+    Every rewrite is applied once, so the rewritten prefix is itself stable for the
+    following completions.
+    """
+
+    def __init__(self, system_prompt: str, token_budget: int = 16000, keep_recent: int = 2, summary_chars: int = 240):
+        self.messages: List[Dict[str, Any]] = [{"role": "system", "content": system_prompt}]
+        self.token_budget = token_budget
+        self.keep_recent = keep_recent
+        self.summary_chars = summary_chars
+        self.tokens_saved = 0
+        self._reduction = 0
+        self._turn = 0
+        # index in messages -> (turn, tool name, arguments)
+        self._tool_messages: Dict[int, tuple] = {}
+        self._rewritten: set = set()
+
+    def add_user(self, content: str):
+        self.messages.append({"role": "user", "content": content})
+
+    def add_assistant(self, message: Dict[str, Any]):
+        self._turn += 1
+        self.messages.append(message)
+
+    def add_tool_result(self, tool_call_id: str, name: str, arguments: Optional[dict], content: str):
+        """
+        Append a tool result and mark the state dumps it supersedes.
+
+        Args:
+            tool_call_id: Id of the tool call answered.
+            name: Name of the tool.
+            arguments: Arguments of the tool call.
+            content: Tool result sent to the model.
+        """
+        arguments = arguments or {}
+        if name in STATE_TOOLS:
+            self._supersede(name, arguments)
+        self._tool_messages[len(self.messages)] = (self._turn, name, arguments)
+        self.messages.append({"role": "tool", "tool_call_id": tool_call_id, "content": content})
+
+    def _supersede(self, name: str, arguments: dict):
+        if (name == "get_project_info" and arguments.get("diff")) or (
+            name == "get_project_changes" and arguments.get("since_version") is not None
+        ):
+            # A diff only makes sense on top of the earlier dumps
+            return
+        for index, (_, old_name, old_arguments) in self._tool_messages.items():
+            if old_name not in STATE_TOOLS or index in self._rewritten:
+                continue
+            # A full project dump covers every track; a track dump only covers its own track
+            if name in ("get_project_info", "get_project_changes"):
+                covered = True
+            else:
+                covered = old_name == name and old_arguments.get("track_name") == arguments.get("track_name")
+            if covered:
+                self._rewrite(index, f"[{old_name} result superseded by a later {name} call]")
+
+    def _rewrite(self, index: int, content: str):
+        message = self.messages[index]
+        self._reduction += estimate_tokens(message["content"]) - estimate_tokens(content)
+        message["content"] = content
+        self._rewritten.add(index)
+
+    def _compact(self):
+        total = sum(_message_tokens(message) for message in self.messages)
+        for index, (turn, name, arguments) in sorted(self._tool_messages.items()):
+            if total <= self.token_budget:
+                return
+            if index in self._rewritten or turn > self._turn - self.keep_recent:
+                continue
+            content = self.messages[index]["content"]
+            if len(content) <= self.summary_chars:
+                continue
+            summary = (
+                f"[compacted {name}({json.dumps(arguments, ensure_ascii=False)[:80]}), "
+                f"{len(content)} chars] {content[:self.summary_chars]}…"
+            )
+            before = estimate_tokens(content)
+            self._rewrite(index, summary)
+            total -= before - estimate_tokens(summary)
+
+    def for_completion(self) -> List[Dict[str, Any]]:
+        """
+        Messages to send with the next completion, compacted to the token budget.
+
+        Returns:
+            The messages, system prompt first.
+        """
+        self._compact()
+        self.tokens_saved += self._reduction
+        return self.messages
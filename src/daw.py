@@ -0,0 +1,412 @@
+import contextlib
+import functools
+import os
+import random
+import threading
+import time
+from typing import Optional
+
+from metrics import record_rpc
+from model import FX_SETTINGS
+
+
+class DAWBackend:
+    """
+    What the server needs from the DAW.
+
+    The project returned by `get_project` exposes the reapy surface used by the tools:
+    `name`, `id`, `tracks`, `_get_track_by_name`; tracks expose `id`, `name`, `index`,
+    `get_info_value`, `set_info_value`, `fxs` and `add_fx`; FX expose `name` and
+    `params`, a list of float parameters with `name`, `formatted`, `normalized` and
+    `range`, writable by index.
+    """
+
+    def get_project(self):
+        raise NotImplementedError
+
+    def inside_reaper(self):
+        """Context manager running the enclosed calls as one batch inside the DAW."""
+        raise NotImplementedError
+
+    def undo_block(self, undo_name: str):
+        """Context manager grouping the enclosed edits into one undo point."""
+        raise NotImplementedError
+
+    def state_change_count(self, project) -> int:
+        """Counter that moves whenever the project changes."""
+        raise NotImplementedError
+
+
+class ReapyBackend(DAWBackend):
+    """REAPER through reapy, connected on first use."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._project = None
+
+    def get_project(self):
+        # `import reapy` already reaches out to REAPER, so it is deferred until a tool
+        # actually needs the DAW
+        with self._lock:
+            if self._project is None:
+                import reapy
+
+                reapy.connect()
+                _count_requests()
+                self._project = reapy.Project()
+        return self._project
+
+    def inside_reaper(self):
+        import reapy
+
+        return reapy.inside_reaper()
+
+    def undo_block(self, undo_name: str):
+        import reapy
+
+        return reapy.undo_block(undo_name)
+
+    def state_change_count(self, project) -> int:
+        import reapy
+
+        return reapy.reascript_api.GetProjectStateChangeCount(project.id)
+
+
+def _count_requests():
+    """Count every request reapy sends to REAPER in the metrics of the current tool call."""
+    try:
+        from reapy.tools.network.client import Client
+    except ImportError:
+        return
+    if getattr(Client.request, "_counted", False):
+        return
+    request = Client.request
+
+    @functools.wraps(request)
+    def counted_request(self, *args, **kwargs):
+        record_rpc()
+        return request(self, *args, **kwargs)
+
+    counted_request._counted = True
+    Client.request = counted_request
+
+
+class FakeParam(float):
+    """A parameter value, with the attributes reapy reads from REAPER."""
+
+    def __new__(cls, value: float, fx: "FakeFX", index: int):
+        param = super().__new__(cls, value)
+        param._fx = fx
+        param._index = index
+        return param
+
+    @property
+    def name(self) -> str:
+        self._fx._backend._rpc()
+        return self._fx._param_names[self._index]
+
+    @property
+    def formatted(self) -> str:
+        from units import param_scales, to_physical
+
+        self._fx._backend._rpc()
+        # Like REAPER, show the parameter in its unit
+        scale = param_scales(self._fx._name).get(self._fx._param_names[self._index])
+        if scale is None:
+            return f"{float(self):.2f}"
+        return f"{float(to_physical([scale], [float(self)])[0]):.1f}"
+
+    @property
+    def normalized(self) -> float:
+        self._fx._backend._rpc()
+        return float(self)
+
+    @property
+    def range(self) -> tuple:
+        self._fx._backend._rpc()
+        return (0.0, 1.0)
+
+
+class FakeParamsList:
+    def __init__(self, fx: "FakeFX"):
+        self._fx = fx
+
+    def __len__(self):
+        return len(self._fx._values)
+
+    def __getitem__(self, index: int) -> FakeParam:
+        self._fx._backend._rpc()
+        return FakeParam(self._fx._values[index], self._fx, index)
+
+    def __setitem__(self, index: int, value: float):
+        self._fx._backend._rpc()
+        self._fx._values[index] = float(value)
+        self._fx._track._project._changed()
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield self[index]
+
+
+class FakeFX:
+    def __init__(self, backend: "FakeBackend", track: "FakeTrack", name: str, param_names: list[str]):
+        self._backend = backend
+        self._track = track
+        self._name = name
+        self._param_names = list(param_names)
+        self._values = [backend._random.random() for _ in param_names]
+
+    @property
+    def name(self) -> str:
+        self._backend._rpc()
+        return self._name
+
+    @property
+    def index(self) -> int:
+        return self._track._fxs.index(self)
+
+    @property
+    def params(self) -> FakeParamsList:
+        self._backend._rpc()
+        return FakeParamsList(self)
+
+
+class FakeTrack:
+    def __init__(self, backend: "FakeBackend", project: "FakeProject", name: str):
+        self._backend = backend
+        self._project = project
+        self._name = name
+        self.id = f"(MediaTrack*)0x{id(self):016X}"
+        self._info = {"D_VOL": 1.0, "D_PAN": 0.0, "D_WIDTH": 1.0}
+        self._fxs: list[FakeFX] = []
+
+    @property
+    def name(self) -> str:
+        self._backend._rpc()
+        return self._name
+
+    @name.setter
+    def name(self, name: str):
+        self._backend._rpc()
+        self._name = name
+        self._project._changed()
+
+    @property
+    def index(self) -> int:
+        self._backend._rpc()
+        return self._project._tracks.index(self)
+
+    def get_info_value(self, param_name: str) -> float:
+        self._backend._rpc()
+        return self._info[param_name]
+
+    def set_info_value(self, param_name: str, param_value: float):
+        self._backend._rpc()
+        self._info[param_name] = float(param_value)
+        self._project._changed()
+
+    @property
+    def fxs(self) -> list[FakeFX]:
+        self._backend._rpc()
+        return list(self._fxs)
+
+    def add_fx(self, name: str) -> FakeFX:
+        self._backend._rpc()
+        fx_type = next((fx_type for fx_type in FX_SETTINGS if fx_type in name), None)
+        if fx_type is None:
+            raise ValueError(f"Could not find FX '{name}'")
+        fx = FakeFX(self._backend, self, f"VST: {fx_type} (Cockos)", _fake_param_names(fx_type))
+        self._fxs.append(fx)
+        self._project._changed()
+        return fx
+
+
+class FakeProject:
+    def __init__(self, backend: "FakeBackend", name: str):
+        self._backend = backend
+        self._name = name
+        self.id = f"(ReaProject*)0x{id(self):016X}"
+        self._tracks: list[FakeTrack] = []
+        self.state_change_count = 0
+
+    def _changed(self):
+        self.state_change_count += 1
+
+    @property
+    def name(self) -> str:
+        self._backend._rpc()
+        return self._name
+
+    @property
+    def tracks(self) -> list[FakeTrack]:
+        self._backend._rpc()
+        return list(self._tracks)
+
+    def _get_track_by_name(self, name: str) -> FakeTrack:
+        for track in self._tracks:
+            self._backend._rpc()
+            if track._name == name:
+                return track
+        raise KeyError(name)
+
+    def add_track(self, name: str) -> FakeTrack:
+        self._backend._rpc()
+        track = FakeTrack(self._backend, self, name)
+        self._tracks.append(track)
+        self._changed()
+        return track
+
+
+def _fake_param_names(fx_type: str) -> list[str]:
+    names = FX_SETTINGS[fx_type].PLUGIN_PARAMS
+    # REAPER appends these to every plugin
+    return [name for name in names if name not in ("Bypass", "Wet", "Delta")] + ["Bypass", "Wet", "Delta"]
+
+
+class FakeBackend(DAWBackend):
+    """
+    In-memory stand-in for REAPER, for benchmarks and profiling without a DAW.
+
+    Every read or write of the reapy surface counts as one call and sleeps `latency`
+    seconds, the cost of a distant API round trip. Inside `inside_reaper()` calls cost
+    `batched_latency` instead, and entering the batch costs one round trip.
+    """
+
+    def __init__(self, latency: float = 0.0, batched_latency: float = 0.0, seed: int = 0, project_name: str = "Fake project"):
+        self.latency = latency
+        self.batched_latency = batched_latency
+        self.calls = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.project = FakeProject(self, project_name)
+
+    @classmethod
+    def synthetic(cls, n_tracks: int = 100, fx_per_track: int = 3, seed: int = 0, **kwargs) -> "FakeBackend":
+        """
+        Build a backend holding a synthetic project.
+
+        Args:
+            n_tracks (int): Number of tracks.
+            fx_per_track (int): Number of FX on each track, drawn from the supported plugins.
+            seed (int): Seed of the random track settings and parameter values.
+            **kwargs: Passed to the constructor (latency, batched_latency, ...).
+
+        Returns:
+            FakeBackend: The backend, with its call counter reset.
+        """
+        backend = cls(seed=seed, **kwargs)
+        latency, backend.latency = backend.latency, 0.0
+        fx_types = list(FX_SETTINGS)
+        for i in range(n_tracks):
+            track = backend.project.add_track(f"Track {i + 1}")
+            track._info["D_VOL"] = backend._random.uniform(0.25, 1.5)
+            track._info["D_PAN"] = round(backend._random.uniform(-1.0, 1.0), 2)
+            for j in range(fx_per_track):
+                track.add_fx(fx_types[(i + j) % len(fx_types)])
+        backend.latency = latency
+        backend.calls = 0
+        return backend
+
+    def _rpc(self):
+        with self._lock:
+            self.calls += 1
+        record_rpc()
+        delay = self.batched_latency if getattr(self._local, "depth", 0) else self.latency
+        if delay:
+            time.sleep(delay)
+
+    def get_project(self):
+        return self.project
+
+    @contextlib.contextmanager
+    def inside_reaper(self):
+        if not getattr(self._local, "depth", 0):
+            self._rpc()
+        self._local.depth = getattr(self._local, "depth", 0) + 1
+        try:
+            yield
+        finally:
+            self._local.depth -= 1
+
+    @contextlib.contextmanager
+    def undo_block(self, undo_name: str):
+        self._rpc()
+        yield
+        self._rpc()
+        self.project._changed()
+
+    def state_change_count(self, project) -> int:
+        self._rpc()
+        return project.state_change_count
+
+
+_backend: Optional[DAWBackend] = None
+_writes = threading.local()
+
+
+def get_backend() -> DAWBackend:
+    """
+    The DAW backend of the process: DAW_BACKEND=fake selects a synthetic in-memory
+    project (FAKE_TRACKS tracks, FAKE_LATENCY seconds per call), anything else REAPER.
+    """
+    global _backend
+    if _backend is None:
+        if os.getenv("DAW_BACKEND", "reapy") == "fake":
+            _backend = FakeBackend.synthetic(
+                n_tracks=int(os.getenv("FAKE_TRACKS", "40")),
+                latency=float(os.getenv("FAKE_LATENCY", "0")),
+            )
+        else:
+            _backend = ReapyBackend()
+    return _backend
+
+
+def set_backend(backend: DAWBackend):
+    global _backend
+    _backend = backend
+
+
+def get_project():
+    """
+    Returns:
+        The project of the DAW backend.
+    """
+    return get_backend().get_project()
+
+
+def inside_reaper():
+    """Context manager running the enclosed calls inside REAPER."""
+    return get_backend().inside_reaper()
+
+
+def undo_block(undo_name: str):
+    """Context manager grouping the enclosed edits into one REAPER undo point."""
+    record_writes()
+    return get_backend().undo_block(undo_name)
+
+
+def record_writes(count: int = 1):
+    """Count edits made to the project by this thread, each moving the state change counter."""
+    _writes.count = getattr(_writes, "count", 0) + count
+
+
+def take_writes() -> int:
+    """
+    Returns:
+        int: Number of edits recorded by this thread since the last call.
+    """
+    count = getattr(_writes, "count", 0)
+    _writes.count = 0
+    return count
+
+
+def state_change_count(project) -> int:
+    """
+    Args:
+        project: The DAW project.
+
+    Returns:
+        int: REAPER's project state change counter.
+    """
+    return get_backend().state_change_count(project)
@@ -0,0 +1,87 @@
+import asyncio
+from typing import Any, Awaitable, Callable
+
+# Tools reading or writing every track, ordered against all the other calls. So are the
+# calls naming no track, e.g. `get_project_info`.
+PROJECT_WIDE_TOOLS = {"save_mix_snapshot", "recall_mix_snapshot", "diff_mix_snapshots"}
+# Tools that do not touch the project, never ordered
+PROJECT_INDEPENDENT_TOOLS = {"get_information_query_chroma", "get_server_metrics"}
+
+
+def _ordering_keys(arguments: dict) -> set:
+    """Tracks a tool call touches: its `track_name` or `track_names`, or the tracks of a mix plan."""
+    keys = set()
+    if "track_name" in arguments:
+        keys.add(arguments["track_name"])
+    for track_name in arguments.get("track_names") or []:
+        keys.add(track_name)
+    for operation in arguments.get("operations") or []:
+        if isinstance(operation, dict) and "track_name" in operation:
+            keys.add(operation["track_name"])
+    return keys
+
+
+class ToolCallDispatcher:
+    """
+    Run MCP tool calls concurrently, with a bounded number in flight.
+
+    Calls touching the same track run in the order they were submitted; calls on
+    different tracks overlap. Project-wide calls, and calls naming no track, wait for
+    every earlier call, and every later call waits for them.
+    """
+
+    def __init__(self, call_tool: Callable[[str, dict], Awaitable[Any]], max_concurrency: int = 8):
+        self._call_tool = call_tool
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._last_by_key = {}
+        self._tasks = []
+        self._sent = set()
+        self._barrier = None
+
+    def submit(self, name: str, arguments: dict) -> asyncio.Task:
+        """
+        Schedule a tool call.
+
+        Args:
+            name: Name of the tool.
+            arguments: Arguments of the tool call.
+
+        Returns:
+            asyncio.Task: Task resolving to the tool result.
+        """
+        keys = _ordering_keys(arguments)
+        if name in PROJECT_INDEPENDENT_TOOLS:
+            task = asyncio.create_task(self._run(name, arguments, set()))
+        elif name in PROJECT_WIDE_TOOLS or not keys:
+            task = asyncio.create_task(self._run(name, arguments, set(self._tasks)))
+            self._barrier = task
+        else:
+            previous = {self._last_by_key[key] for key in keys if key in self._last_by_key}
+            if self._barrier is not None:
+                previous.add(self._barrier)
+            task = asyncio.create_task(self._run(name, arguments, previous))
+            for key in keys:
+                self._last_by_key[key] = task
+        self._tasks.append(task)
+        return task
+
+    async def _run(self, name: str, arguments: dict, previous: set):
+        if previous:
+            # Only wait for the earlier calls, their errors belong to their own results
+            await asyncio.wait(previous)
+        async with self._semaphore:
+            self._sent.add(asyncio.current_task())
+            return await self._call_tool(name, arguments)
+
+    def cancel_unsent(self) -> int:
+        """
+        Cancel the calls not sent to the server yet. Calls already sent may have written to
+        the project, they are left to finish.
+
+        Returns:
+            int: Number of calls cancelled.
+        """
+        unsent = [task for task in self._tasks if not task.done() and task not in self._sent]
+        for task in unsent:
+            task.cancel()
+        return len(unsent)
@@ -0,0 +1,218 @@
+import json
+from typing import Optional
+
+from model import FX_SETTINGS
+from snapshot import FXSnapshot, ProjectSnapshot, TrackSnapshot
+from units import param_scales, scale_matches, to_physical, warn_scale_mismatch
+
+DEFAULT_TOKEN_BUDGET = 4000
+
+# Parameters that only matter when they are switched on
+_HOUSEKEEPING_PARAMS = {"Bypass": 0.0, "Delta": 0.0}
+
+_SHORT_ATTRS = {"D_VOL": "v", "D_PAN": "p", "D_WIDTH": "w"}
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count of a text, ~4 characters per token for JSON-like payloads."""
+    return len(text) // 4 + 1
+
+
+def dumps(payload) -> str:
+    return json.dumps(payload, separators=(",", ":"), ensure_ascii=False)
+
+
+def _settings_params(fx_name: str) -> Optional[set]:
+    for fx_type, settings_cls in FX_SETTINGS.items():
+        if fx_type in fx_name:
+            return set(settings_cls.PLUGIN_PARAMS)
+    return None
+
+
+def fx_labels(track: TrackSnapshot) -> list[tuple[str, FXSnapshot]]:
+    """
+    Key of each FX of a track in the encodings: its name, followed by " #2", " #3", ...
+    for the later FX with the same name on the track.
+    """
+    seen = {}
+    labels = []
+    for fx in track.fxs:
+        seen[fx.name] = seen.get(fx.name, 0) + 1
+        labels.append((fx.name if seen[fx.name] == 1 else f"{fx.name} #{seen[fx.name]}", fx))
+    return labels
+
+
+def _encode_params(fx, defaults: Optional[dict], requested: Optional[set], digits: int, units: Optional[dict] = None) -> dict:
+    """
+    Keep the parameters worth showing: the requested ones, and those that differ from the
+    plugin defaults. When the defaults of the plugin are unknown, keep the parameters the
+    settings models can write.
+
+    If `units` is given, parameters with a physical unit are reported in it (4 significant
+    digits) and their unit is recorded in `units`. When the conversion disagrees with the
+    value REAPER shows, the parameter is reported as REAPER formats it, a string.
+    """
+    known = _settings_params(fx.name) if defaults is None else None
+    params = {}
+    for param in fx.params:
+        value = round(param.value, digits)
+        if requested is not None and (param.name in requested or "*" in requested):
+            params[param.name] = value
+        elif param.name in _HOUSEKEEPING_PARAMS:
+            if value != _HOUSEKEEPING_PARAMS[param.name]:
+                params[param.name] = value
+        elif defaults is not None:
+            if param.name not in defaults or round(defaults[param.name], digits) != value:
+                params[param.name] = value
+        elif known is None or param.name in known:
+            params[param.name] = value
+
+    if units is not None:
+        scales = param_scales(fx.name)
+        converted = [param for param in fx.params if param.name in params and param.name in scales]
+        if converted:
+            values = to_physical([scales[param.name] for param in converted], [param.normalized for param in converted])
+            for param, value in zip(converted, values.tolist()):
+                scale = scales[param.name]
+                if scale_matches(scale, value, param.formatted):
+                    params[param.name] = float(f"{value:.4g}")
+                    units[param.name] = scale.unit
+                else:
+                    warn_scale_mismatch(fx.name, param.name, scale.unit, value, param.formatted)
+                    params[param.name] = param.formatted
+    return params
+
+
+def encode_track(
+    track: TrackSnapshot,
+    fx_defaults: Optional[dict] = None,
+    requested: Optional[set] = None,
+    digits: int = 3,
+    with_params: bool = True,
+    physical: bool = False,
+) -> dict:
+    """
+    Encode a track with short keys: v (linear volume, 1.0 = 0 dB), p (pan), w (width)
+    and fx (FX name -> parameter name -> value, see `fx_labels`).
+
+    Args:
+        track (TrackSnapshot): The track to encode.
+        fx_defaults (dict): FX name -> parameter name -> default value, when known.
+        requested (set): Parameter names to always include, "*" for all.
+        digits (int): Number of decimals kept on values.
+        with_params (bool): If False, only list the FX names.
+        physical (bool): Report FX parameters in physical units (Hz, dB, ms, ratio) where
+            they have one, and list those units under "units". Parameters whose conversion
+            disagrees with REAPER are reported as REAPER formats them.
+
+    Returns:
+        dict: The compact track encoding.
+    """
+    fx_defaults = fx_defaults or {}
+    units = {} if physical else None
+    encoded = {_SHORT_ATTRS[attr]: round(value, digits) for attr, value in track.attributes.items()}
+    if track.fxs:
+        if with_params:
+            encoded["fx"] = {
+                label: _encode_params(fx, fx_defaults.get(fx.name), requested, digits, units)
+                for label, fx in fx_labels(track)
+            }
+        else:
+            encoded["fx"] = [label for label, _ in fx_labels(track)]
+    if units:
+        encoded["units"] = units
+    return encoded
+
+
+def _diff(previous, current):
+    if not isinstance(previous, dict) or not isinstance(current, dict):
+        return None if previous == current else current
+    changes = {}
+    for key, value in current.items():
+        if key not in previous:
+            changes[key] = value
+        else:
+            change = _diff(previous[key], value)
+            if change is not None:
+                changes[key] = change
+    return changes or None
+
+
+def _track_diff(previous: dict, current: dict) -> Optional[dict]:
+    """What changed in an encoded track, FX that disappeared being listed in "fx_removed"."""
+    changes = _diff(previous, current) or {}
+    if isinstance(previous.get("fx"), dict) and isinstance(current.get("fx"), dict):
+        removed = [label for label in previous["fx"] if label not in current["fx"]]
+        if removed:
+            changes["fx_removed"] = removed
+    return changes or None
+
+
+def encode_project(
+    snapshot: ProjectSnapshot,
+    token_budget: int = DEFAULT_TOKEN_BUDGET,
+    fx_defaults: Optional[dict] = None,
+    previous: Optional[ProjectSnapshot] = None,
+    header: Optional[dict] = None,
+    physical: bool = False,
+) -> str:
+    """
+    Encode the project state as compact JSON that fits in a token budget.
+
+    The encoding degrades step by step until it fits: values rounded to 2 decimals,
+    then FX listed without parameters ("trunc": "params"), then only the first tracks
+    ("more": number of tracks left out).
+
+    Args:
+        snapshot (ProjectSnapshot): The project state to encode.
+        token_budget (int): Maximum number of tokens of the payload.
+        fx_defaults (dict): FX name -> parameter name -> default value, when known.
+        previous (ProjectSnapshot): If given, only encode what changed since this snapshot
+            ("diff": true, tracks that disappeared are listed in "removed", FX in the
+            "fx_removed" of their track).
+        header (dict): Extra keys to put first in the payload.
+        physical (bool): Report FX parameters in physical units, see `encode_track`.
+
+    Returns:
+        str: The JSON payload.
+    """
+    for digits, with_params in ((3, True), (2, True), (2, False)):
+        tracks = {
+            name: encode_track(track, fx_defaults, digits=digits, with_params=with_params, physical=physical)
+            for name, track in snapshot.tracks.items()
+        }
+        payload = {**(header or {}), "project": snapshot.name}
+        if previous is not None:
+            before = {
+                name: encode_track(track, fx_defaults, digits=digits, with_params=with_params, physical=physical)
+                for name, track in previous.tracks.items()
+            }
+            payload["diff"] = True
+            payload["t"] = {
+                name: change
+                for name, track in tracks.items()
+                if (change := _track_diff(before.get(name, {}), track)) is not None
+            }
+            removed = [name for name in before if name not in tracks]
+            if removed:
+                payload["removed"] = removed
+        else:
+            payload["t"] = tracks
+        if not with_params:
+            payload["trunc"] = "params"
+
+        text = dumps(payload)
+        if estimate_tokens(text) <= token_budget:
+            return text
+
+    kept = {}
+    budget = token_budget - estimate_tokens(dumps({**payload, "t": {}, "more": len(payload["t"])}))
+    for name, track in payload["t"].items():
+        cost = estimate_tokens(dumps({name: track}))
+        if cost > budget:
+            break
+        kept[name] = track
+        budget -= cost
+    payload["more"] = len(payload["t"]) - len(kept)
+    payload["t"] = kept
+    return dumps(payload)
@@ -0,0 +1,213 @@
+"""
+Memory-mapped store of track features and labels for training the track analysis model.
+
+A store is a directory with two raw float32 files, one row per sample, a key file and a
+manifest:
+
+- features.f32: (samples, NB_FEATURES) raw extractor output
+- labels.f32: (samples, n_labels) descriptor targets, 0-10 scale
+- keys.txt: the key of every sample (stem content hash), one per line
+- manifest.json: sample count, row sizes, and the feature set the rows were extracted with
+
+Rows and keys are only ever appended, and the manifest is replaced once they are on disk,
+so a store can grow across runs and training reads it without loading it in memory. A
+store only accepts, and only serves, features of the extractor's current FEATURE_SET.
+
+Usage:
+    python feature_store.py STORE add labels.csv  # CSV: path, then one column per descriptor
+"""
+
+import argparse
+import csv
+import json
+import os
+import time
+
+import numpy as np
+
+from features import FEATURE_SET, NB_FEATURES, extract_many, feature_matrix, stem_hash
+
+MANIFEST_NAME = "manifest.json"
+FEATURES_NAME = "features.f32"
+LABELS_NAME = "labels.f32"
+KEYS_NAME = "keys.txt"
+
+
+class FeatureStore:
+    def __init__(self, directory: str):
+        self.directory = directory
+        manifest_path = os.path.join(directory, MANIFEST_NAME)
+        if os.path.exists(manifest_path):
+            with open(manifest_path) as f:
+                self.manifest = json.load(f)
+        else:
+            self.manifest = {
+                "count": 0, "n_features": NB_FEATURES, "n_labels": None, "label_names": None,
+                "feature_set": FEATURE_SET, "keys_size": 0,
+            }
+        self._key_set = None
+
+    def __len__(self) -> int:
+        return self.manifest["count"]
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._keys
+
+    @property
+    def _keys(self) -> set[str]:
+        """Keys of the samples in the store, read from the key file on first use."""
+        if self._key_set is None:
+            self._key_set = set()
+            if self.manifest["keys_size"]:
+                with open(self._path(KEYS_NAME), "rb") as f:
+                    self._key_set.update(f.read(self.manifest["keys_size"]).decode().splitlines())
+        return self._key_set
+
+    @property
+    def n_features(self) -> int:
+        return self.manifest["n_features"]
+
+    @property
+    def n_labels(self) -> int:
+        return self.manifest["n_labels"]
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.directory, name)
+
+    def _check_feature_set(self):
+        feature_set = self.manifest.get("feature_set")
+        if feature_set != FEATURE_SET:
+            raise ValueError(
+                f"Feature store {self.directory} holds features of set {feature_set}, the extractor "
+                f"produces {FEATURE_SET}: rebuild the store with `add`"
+            )
+
+    def append(self, keys: list[str], features: np.ndarray, labels: np.ndarray, label_names: list[str] = None):
+        """
+        Append samples to the store.
+
+        Args:
+            keys (list[str]): Unique key of each sample, e.g. the stem content hash.
+            features (np.ndarray): (samples, n_features) raw features.
+            labels (np.ndarray): (samples, n_labels) targets.
+            label_names (list[str]): Names of the label columns, checked against the store.
+        """
+        self._check_feature_set()
+        features = np.ascontiguousarray(features, dtype=np.float32)
+        labels = np.ascontiguousarray(labels, dtype=np.float32)
+        if features.shape != (len(keys), self.n_features):
+            raise ValueError(f"Expected features of shape ({len(keys)}, {self.n_features}), got {features.shape}")
+        if self.n_labels is None:
+            self.manifest["n_labels"] = labels.shape[1]
+            self.manifest["label_names"] = label_names
+        if labels.shape != (len(keys), self.n_labels):
+            raise ValueError(f"Expected labels of shape ({len(keys)}, {self.n_labels}), got {labels.shape}")
+        if label_names is not None and self.manifest["label_names"] not in (None, list(label_names)):
+            raise ValueError(f"Label columns {label_names} do not match the store's {self.manifest['label_names']}")
+        if any("\n" in key for key in keys):
+            raise ValueError("Sample keys cannot contain line breaks")
+        duplicates = [key for key in keys if key in self._keys]
+        if duplicates or len(set(keys)) != len(keys):
+            raise ValueError(f"{len(duplicates) or 'Some'} samples are already in the store")
+
+        os.makedirs(self.directory, exist_ok=True)
+        count = len(self)
+        key_bytes = "".join(f"{key}\n" for key in keys).encode()
+        # Drop rows of an interrupted append that never made it to the manifest
+        for name, size in (
+            (FEATURES_NAME, count * self.n_features * 4),
+            (LABELS_NAME, count * self.n_labels * 4),
+            (KEYS_NAME, self.manifest["keys_size"]),
+        ):
+            with open(self._path(name), "ab") as f:
+                f.truncate(size)
+        with open(self._path(FEATURES_NAME), "ab") as f:
+            f.write(features.tobytes())
+        with open(self._path(LABELS_NAME), "ab") as f:
+            f.write(labels.tobytes())
+        with open(self._path(KEYS_NAME), "ab") as f:
+            f.write(key_bytes)
+
+        self.manifest["count"] = count + len(keys)
+        self.manifest["keys_size"] += len(key_bytes)
+        self._keys.update(keys)
+        manifest_path = self._path(MANIFEST_NAME)
+        with open(manifest_path + ".tmp", "w") as f:
+            json.dump(self.manifest, f)
+        os.replace(manifest_path + ".tmp", manifest_path)
+
+    def arrays(self) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Returns:
+            tuple: (features, labels), read-only memory maps of the whole store.
+        """
+        if not len(self):
+            raise ValueError(f"Feature store {self.directory} is empty")
+        self._check_feature_set()
+        features = np.memmap(self._path(FEATURES_NAME), dtype=np.float32, mode="r", shape=(len(self), self.n_features))
+        labels = np.memmap(self._path(LABELS_NAME), dtype=np.float32, mode="r", shape=(len(self), self.n_labels))
+        return features, labels
+
+    def add_stems(self, labels: dict[str, list[float]], label_names: list[str] = None) -> int:
+        """
+        Extract the features of labelled stems that are not in the store yet and append them.
+
+        Args:
+            labels (dict): Stem path -> targets.
+            label_names (list[str]): Names of the targets.
+
+        Returns:
+            int: Number of samples added.
+        """
+        keys = {path: stem_hash(path) for path in labels}
+        new = {}
+        for path, key in keys.items():
+            if key not in self._keys and key not in new.values():
+                new[path] = key
+        if not new:
+            return 0
+        features = extract_many(list(new))
+        self.append(
+            list(new.values()),
+            feature_matrix(features),
+            np.array([labels[path] for path in new], dtype=np.float32),
+            label_names,
+        )
+        return len(new)
+
+
+def read_labels(csv_path: str) -> tuple[list[str], dict[str, list[float]]]:
+    """
+    Args:
+        csv_path (str): CSV with a `path` column (relative to the CSV) and one column per target.
+
+    Returns:
+        tuple: (target names, stem path -> targets).
+    """
+    root = os.path.dirname(os.path.abspath(csv_path))
+    with open(csv_path, newline="") as f:
+        reader = csv.DictReader(f)
+        names = [name for name in reader.fieldnames if name != "path"]
+        labels = {
+            os.path.join(root, row["path"]): [float(row[name]) for name in names]
+            for row in reader
+        }
+    return names, labels
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("store", help="Directory of the feature store")
+    parser.add_argument("command", choices=["add"])
+    parser.add_argument("source", help="Labels CSV, see read_labels")
+    args = parser.parse_args()
+
+    store = FeatureStore(args.store)
+    start = time.perf_counter()
+    names, labels = read_labels(args.source)
+    added = store.add_stems(labels, names)
+    print(f"{added} samples added in {time.perf_counter() - start:.1f}s, {len(store)} in the store")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,533 @@
+import hashlib
+import math
+import multiprocessing
+import os
+import struct
+import sys
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import dataclass
+
+import numpy as np
+
+# Inputs of the track analysis model, in order
+FEATURE_NAMES = (
+    # Level and dynamics
+    "rms_db", "peak_db", "crest_db", "integrated_loudness", "loudness_range", "noise_floor_db",
+    "rms_std_db", "silence_ratio", "clipping_ratio",
+    # Spectral shape, averaged over the non-silent frames
+    "spectral_centroid", "spectral_bandwidth", "spectral_rolloff", "spectral_flatness",
+    "spectral_flux", "spectral_entropy", "zero_crossing_rate",
+    # Long-term spectrum
+    "spectral_slope", "spectral_crest_db",
+    "band_sub", "band_bass", "band_low_mid", "band_mid", "band_high_mid", "band_presence", "band_brilliance",
+    # Stereo image and transients
+    "stereo_width", "lr_correlation", "lr_balance_db", "onset_rate",
+)
+NB_FEATURES = len(FEATURE_NAMES)
+# Identifies what the extractor computes, bump the revision whenever a feature changes meaning
+FEATURE_REVISION = 1
+FEATURE_SET = f"{FEATURE_REVISION}-{hashlib.sha256(' '.join(FEATURE_NAMES).encode()).hexdigest()[:12]}"
+
+# Energy bands, in Hz, matching the band_* features
+BANDS = ((20, 60), (60, 250), (250, 500), (500, 2000), (2000, 4000), (4000, 6000), (6000, 20000))
+
+FEATURE_WORKERS = int(os.getenv("FEATURE_WORKERS", os.cpu_count() or 1))
+# STFT hops per block read from the file, bounds the memory of one extraction
+BLOCK_HOPS = 256
+
+SILENCE_DB = -60.0
+FLOOR_DB = -120.0
+_EPS = 1e-12
+
+# Level histograms: 0.1 dB bins, percentiles are read from them so memory does not grow
+# with the length of the song
+_HIST_LOW, _HIST_HIGH, _HIST_STEP = -120.0, 10.0, 0.1
+_HIST_BINS = int(round((_HIST_HIGH - _HIST_LOW) / _HIST_STEP))
+
+_WAVE_FORMAT_PCM = 1
+_WAVE_FORMAT_IEEE_FLOAT = 3
+_WAVE_FORMAT_EXTENSIBLE = 0xFFFE
+
+
+@dataclass
+class WavFile:
+    """A PCM or float WAV file, memory-mapped: blocks are decoded only when read."""
+
+    path: str
+    sample_rate: int
+    channels: int
+    bits: int
+    is_float: bool
+    n_frames: int
+    _data: np.ndarray
+
+    @classmethod
+    def open(cls, path: str) -> "WavFile":
+        with open(path, "rb") as f:
+            riff, _, wave = struct.unpack("<4sI4s", f.read(12))
+            if riff != b"RIFF" or wave != b"WAVE":
+                raise ValueError(f"{path} is not a RIFF/WAVE file")
+            fmt = None
+            while True:
+                header = f.read(8)
+                if len(header) < 8:
+                    raise ValueError(f"{path} has no data chunk")
+                chunk_id, size = struct.unpack("<4sI", header)
+                if chunk_id == b"fmt ":
+                    fmt = f.read(size + (size & 1))
+                elif chunk_id == b"data":
+                    offset = f.tell()
+                    break
+                else:
+                    f.seek(size + (size & 1), os.SEEK_CUR)
+        if fmt is None:
+            raise ValueError(f"{path} has no fmt chunk")
+
+        format_tag, channels, sample_rate, _, block_align, bits = struct.unpack("<HHIIHH", fmt[:16])
+        if format_tag == _WAVE_FORMAT_EXTENSIBLE and len(fmt) >= 26:
+            # The sub-format GUID starts with the actual format tag
+            format_tag = struct.unpack("<H", fmt[24:26])[0]
+
+        if format_tag not in (_WAVE_FORMAT_PCM, _WAVE_FORMAT_IEEE_FLOAT):
+            raise ValueError(f"{path}: unsupported WAV format tag {format_tag}")
+        is_float = format_tag == _WAVE_FORMAT_IEEE_FLOAT
+        if is_float:
+            dtype, shape = {32: "<f4", 64: "<f8"}.get(bits), (channels,)
+        elif bits == 24:
+            dtype, shape = np.uint8, (channels, 3)
+        else:
+            dtype, shape = {8: "u1", 16: "<i2", 32: "<i4"}.get(bits), (channels,)
+        if dtype is None:
+            raise ValueError(f"{path}: unsupported sample size of {bits} bits")
+
+        n_frames = min(size, os.path.getsize(path) - offset) // block_align
+        if n_frames:
+            data = np.memmap(path, dtype=dtype, mode="r", offset=offset, shape=(n_frames, *shape))
+        else:
+            data = np.zeros((0, *shape), dtype=dtype)
+        return cls(path, sample_rate, channels, bits, is_float, n_frames, data)
+
+    @property
+    def duration(self) -> float:
+        return self.n_frames / self.sample_rate
+
+    def read(self, start: int, stop: int) -> np.ndarray:
+        """
+        Returns:
+            np.ndarray: Frames [start, stop) as float32 in [-1, 1], shape (frames, channels).
+        """
+        block = self._data[start:stop]
+        if self.is_float:
+            return np.asarray(block, dtype=np.float32)
+        if self.bits == 24:
+            block = block.astype(np.int32)
+            samples = block[..., 0] | (block[..., 1] << 8) | (block[..., 2] << 16)
+            return ((samples << 8) >> 8).astype(np.float32) / float(1 << 23)
+        if self.bits == 8:
+            return (block.astype(np.float32) - 128.0) / 128.0
+        return block.astype(np.float32) / float(1 << (self.bits - 1))
+
+
+def _biquad_power(b, a, freqs: np.ndarray, sample_rate: int) -> np.ndarray:
+    z = np.exp(-1j * 2 * np.pi * freqs / sample_rate)
+    response = (b[0] + b[1] * z + b[2] * z**2) / (a[0] + a[1] * z + a[2] * z**2)
+    return np.abs(response) ** 2
+
+
+def k_weighting(freqs: np.ndarray, sample_rate: int) -> np.ndarray:
+    """
+    Power response of the ITU-R BS.1770 K-weighting (high shelf + high pass), applied
+    on the STFT bins instead of filtering the signal.
+    """
+    # Stage 1: +4 dB high shelf at 1.5 kHz
+    A, w0 = 10 ** (4.0 / 40), 2 * np.pi * 1500.0 / sample_rate
+    alpha, cos = np.sin(w0) / (2 * (1 / np.sqrt(2))), np.cos(w0)
+    shelf = _biquad_power(
+        (A * ((A + 1) + (A - 1) * cos + 2 * np.sqrt(A) * alpha),
+         -2 * A * ((A - 1) + (A + 1) * cos),
+         A * ((A + 1) + (A - 1) * cos - 2 * np.sqrt(A) * alpha)),
+        ((A + 1) - (A - 1) * cos + 2 * np.sqrt(A) * alpha,
+         2 * ((A - 1) - (A + 1) * cos),
+         (A + 1) - (A - 1) * cos - 2 * np.sqrt(A) * alpha),
+        freqs, sample_rate,
+    )
+    # Stage 2: high pass at 38 Hz
+    w0 = 2 * np.pi * 38.0 / sample_rate
+    alpha, cos = np.sin(w0) / (2 * 0.5), np.cos(w0)
+    high_pass = _biquad_power(
+        ((1 + cos) / 2, -(1 + cos), (1 + cos) / 2),
+        (1 + alpha, -2 * cos, 1 - alpha),
+        freqs, sample_rate,
+    )
+    return shelf * high_pass
+
+
+class _LevelHistogram:
+    """Counts (and summed linear power) of levels in dB, in fixed 0.1 dB bins."""
+
+    def __init__(self):
+        self.counts = np.zeros(_HIST_BINS, dtype=np.int64)
+        self.power = np.zeros(_HIST_BINS, dtype=np.float64)
+
+    def add(self, levels_db: np.ndarray, power: np.ndarray):
+        bins = np.clip(((levels_db - _HIST_LOW) / _HIST_STEP).astype(np.int64), 0, _HIST_BINS - 1)
+        self.counts += np.bincount(bins, minlength=_HIST_BINS)
+        self.power += np.bincount(bins, weights=power, minlength=_HIST_BINS)
+
+    def centers(self) -> np.ndarray:
+        return _HIST_LOW + (np.arange(_HIST_BINS) + 0.5) * _HIST_STEP
+
+    def percentile(self, q: float, above: float = -math.inf) -> float:
+        counts = np.where(self.centers() > above, self.counts, 0)
+        total = counts.sum()
+        if not total:
+            return FLOOR_DB
+        return float(self.centers()[np.searchsorted(np.cumsum(counts), q * total)])
+
+    def mean_power(self, above: float = -math.inf) -> float:
+        selected = self.centers() > above
+        count = self.counts[selected].sum()
+        return float(self.power[selected].sum() / count) if count else 0.0
+
+
+class FeatureAccumulator:
+    """
+    Running sums of a stem's features, updated block by block.
+
+    Everything kept between blocks is fixed-size (sums, histograms, the STFT overlap),
+    so memory does not depend on the length of the stem.
+    """
+
+    def __init__(self, sample_rate: int, channels: int):
+        self.sample_rate = sample_rate
+        self.channels = channels
+        self.n_fft = 2048 if sample_rate <= 48000 else 4096
+        self.hop = self.n_fft // 2
+        self.window = np.hanning(self.n_fft).astype(np.float32)
+        self.freqs = np.fft.rfftfreq(self.n_fft, 1.0 / sample_rate)
+        # rfft bins 1..N/2-1 stand for two bins of the full spectrum
+        bin_weights = np.full(len(self.freqs), 2.0)
+        bin_weights[[0, -1]] = 1.0
+        self._power_scale = bin_weights / (self.n_fft * float(np.sum(self.window**2)))
+        self._k_weights = k_weighting(self.freqs, sample_rate) * self._power_scale
+        self._bands = [(self.freqs >= low) & (self.freqs < high) for low, high in BANDS]
+
+        self._carry = np.zeros((0, channels), dtype=np.float32)
+        self._previous_magnitude = None
+        self._last_negative = None
+
+        self.samples = 0
+        self.sum_squares = np.zeros(channels, dtype=np.float64)
+        self.peak = 0.0
+        self.clipped = 0
+        self.zero_crossings = 0
+        self.sum_lr = 0.0
+        self.mid_energy = 0.0
+        self.side_energy = 0.0
+
+        self.frames = 0
+        self.active_frames = 0
+        self.onsets = 0
+        self.spectral_sums = np.zeros(6, dtype=np.float64)
+        self.power_sum = np.zeros(len(self.freqs), dtype=np.float64)
+        self.rms_hist = _LevelHistogram()
+        self.loudness_hist = _LevelHistogram()
+        self.active_rms_sum = 0.0
+        self.active_rms_squares = 0.0
+
+    def update(self, block: np.ndarray):
+        """
+        Args:
+            block (np.ndarray): Next samples of the stem, float32 of shape (frames, channels).
+        """
+        self._time_domain(block)
+        buffer = np.concatenate([self._carry, block]) if len(self._carry) else block
+        n_frames = (len(buffer) - self.n_fft) // self.hop + 1 if len(buffer) >= self.n_fft else 0
+        if n_frames:
+            self._frames(buffer, n_frames)
+        self._carry = buffer[n_frames * self.hop:].copy()
+
+    def _time_domain(self, block: np.ndarray):
+        block64 = block.astype(np.float64)
+        self.samples += len(block)
+        self.sum_squares += np.einsum("ij,ij->j", block64, block64)
+        if len(block):
+            magnitude = np.abs(block)
+            self.peak = max(self.peak, float(magnitude.max()))
+            self.clipped += int(np.count_nonzero(magnitude >= 0.999))
+        negative = np.signbit(block64.mean(axis=1))
+        if len(negative):
+            self.zero_crossings += int(np.count_nonzero(negative[1:] != negative[:-1]))
+            if self._last_negative is not None:
+                self.zero_crossings += int(self._last_negative != negative[0])
+            self._last_negative = bool(negative[-1])
+        if self.channels >= 2:
+            left, right = block64[:, 0], block64[:, 1]
+            self.sum_lr += float(left @ right)
+            self.mid_energy += float(np.sum(((left + right) / 2) ** 2))
+            self.side_energy += float(np.sum(((left - right) / 2) ** 2))
+
+    def _frames(self, buffer: np.ndarray, n_frames: int):
+        # (frames, channels, n_fft) strided view, no copy until the window is applied
+        frames = np.lib.stride_tricks.sliding_window_view(buffer, self.n_fft, axis=0)[: n_frames * self.hop : self.hop]
+        spectrum = np.fft.rfft(frames * self.window, axis=-1)
+        power = (spectrum.real**2 + spectrum.imag**2).astype(np.float64)  # (frames, channels, bins)
+        self.frames += n_frames
+
+        # Loudness: K-weighted mean square, summed over channels
+        weighted = np.einsum("fcb,b->f", power, self._k_weights)
+        loudness = -0.691 + 10 * np.log10(weighted + _EPS)
+        self.loudness_hist.add(loudness, weighted)
+
+        # Spectral features are computed on the power averaged over the channels
+        mono_power = power.mean(axis=1)
+        mean_square = mono_power @ self._power_scale
+        rms_db = 10 * np.log10(mean_square + _EPS)
+        self.rms_hist.add(rms_db, mean_square)
+
+        magnitude = np.sqrt(mono_power)
+        first = magnitude[0] if self._previous_magnitude is None else self._previous_magnitude
+        previous = np.vstack([first[None], magnitude[:-1]])
+        self._previous_magnitude = magnitude[-1]
+        flux = np.maximum(magnitude - previous, 0.0).sum(axis=1) / (magnitude.sum(axis=1) + _EPS)
+
+        active = rms_db > SILENCE_DB
+        if not active.any():
+            return
+        P = mono_power[active]
+        total = P.sum(axis=1) + _EPS
+        centroid = (P @ self.freqs) / total
+        bandwidth = np.sqrt(np.einsum("fb,fb->f", P, (self.freqs[None] - centroid[:, None]) ** 2) / total)
+        rolloff = self.freqs[np.argmax(np.cumsum(P, axis=1) >= 0.85 * total[:, None], axis=1)]
+        flatness = np.exp(np.log(P + _EPS).mean(axis=1)) / (P.mean(axis=1) + _EPS)
+        p = P / total[:, None]
+        entropy = -(p * np.log(p + _EPS)).sum(axis=1) / np.log(P.shape[1])
+        self.spectral_sums += [
+            centroid.sum(), bandwidth.sum(), rolloff.sum(), flatness.sum(), flux[active].sum(), entropy.sum(),
+        ]
+        self.power_sum += P.sum(axis=0)
+        self.active_frames += int(active.sum())
+        self.active_rms_sum += float(rms_db[active].sum())
+        self.active_rms_squares += float(np.sum(rms_db[active] ** 2))
+
+        # Onsets: local maxima of the flux well above its typical level in this block
+        threshold = 1.5 * np.median(flux) + 0.05
+        peaks = (flux[1:-1] > flux[:-2]) & (flux[1:-1] >= flux[2:]) & (flux[1:-1] > threshold) & active[1:-1]
+        self.onsets += int(peaks.sum())
+
+    def finish(self) -> dict[str, float]:
+        """
+        Returns:
+            dict[str, float]: The features, in FEATURE_NAMES order.
+        """
+        if len(self._carry) > self.n_fft - self.hop:
+            padding = np.zeros((self.n_fft - len(self._carry), self.channels), dtype=np.float32)
+            self._frames(np.concatenate([self._carry, padding]), 1)
+            self._carry = self._carry[:0]
+
+        samples = max(self.samples, 1)
+        mean_square = float(self.sum_squares.mean()) / samples
+        rms_db = _db(mean_square)
+        peak_db = _db(self.peak**2)
+
+        absolute = -0.691 + 10 * math.log10(self.loudness_hist.mean_power(-70.0) + _EPS)
+        relative_gate = absolute - 10.0
+        integrated = -0.691 + 10 * math.log10(self.loudness_hist.mean_power(relative_gate) + _EPS)
+        range_gate = absolute - 20.0
+        loudness_range = self.loudness_hist.percentile(0.95, range_gate) - self.loudness_hist.percentile(0.10, range_gate)
+
+        active = max(self.active_frames, 1)
+        rms_mean = self.active_rms_sum / active
+        rms_std = math.sqrt(max(self.active_rms_squares / active - rms_mean**2, 0.0))
+        centroid, bandwidth, rolloff, flatness, flux, entropy = (self.spectral_sums / active).tolist()
+
+        spectrum = self.power_sum / active
+        total = float(spectrum.sum()) + _EPS
+        audible = (self.freqs >= 20) & (self.freqs <= min(16000, self.sample_rate / 2))
+        if self.active_frames and audible.sum() > 1:
+            slope = float(np.polyfit(np.log2(self.freqs[audible]), 10 * np.log10(spectrum[audible] + _EPS), 1)[0])
+            crest = _db(float(spectrum[audible].max()) / (float(spectrum[audible].mean()) + _EPS))
+        else:
+            slope, crest = 0.0, 0.0
+
+        if self.channels >= 2:
+            left, right = self.sum_squares[0], self.sum_squares[1]
+            correlation = self.sum_lr / math.sqrt(left * right) if left * right > 0 else 1.0
+            width = self.side_energy / (self.mid_energy + self.side_energy + _EPS)
+            balance = 10 * math.log10((left + _EPS) / (right + _EPS))
+        else:
+            correlation, width, balance = 1.0, 0.0, 0.0
+
+        duration = self.samples / self.sample_rate
+        features = {
+            "rms_db": rms_db,
+            "peak_db": peak_db,
+            "crest_db": peak_db - rms_db,
+            "integrated_loudness": max(integrated, FLOOR_DB),
+            "loudness_range": loudness_range,
+            "noise_floor_db": self.rms_hist.percentile(0.10),
+            "rms_std_db": rms_std,
+            "silence_ratio": 1.0 - self.active_frames / max(self.frames, 1),
+            "clipping_ratio": self.clipped / (samples * self.channels),
+            "spectral_centroid": centroid,
+            "spectral_bandwidth": bandwidth,
+            "spectral_rolloff": rolloff,
+            "spectral_flatness": flatness,
+            "spectral_flux": flux,
+            "spectral_entropy": entropy,
+            "zero_crossing_rate": self.zero_crossings / samples,
+            "spectral_slope": slope,
+            "spectral_crest_db": crest,
+            **{name: float(spectrum[band].sum()) / total for name, band in zip(FEATURE_NAMES[18:25], self._bands)},
+            "stereo_width": width,
+            "lr_correlation": correlation,
+            "lr_balance_db": balance,
+            "onset_rate": self.onsets / duration if duration else 0.0,
+        }
+        return {name: float(features[name]) for name in FEATURE_NAMES}
+
+
+def _db(power: float) -> float:
+    return max(10 * math.log10(power + _EPS), FLOOR_DB)
+
+
+def extract_features(path: str) -> dict[str, float]:
+    """
+    Compute the features of a rendered stem, streaming it block by block from a
+    memory-mapped WAV file.
+
+    Args:
+        path (str): Path of a PCM (8/16/24/32-bit) or float WAV file.
+
+    Returns:
+        dict[str, float]: Feature name -> value, in FEATURE_NAMES order.
+    """
+    wav = WavFile.open(path)
+    accumulator = FeatureAccumulator(wav.sample_rate, wav.channels)
+    block_frames = BLOCK_HOPS * accumulator.hop
+    for start in range(0, wav.n_frames, block_frames):
+        accumulator.update(wav.read(start, start + block_frames))
+    return accumulator.finish()
+
+
+_pool_lock = threading.Lock()
+_pool = None
+
+
+def _process_pool(workers: int) -> ProcessPoolExecutor:
+    """
+    Return the feature extraction pool, started on first use and kept for later calls.
+
+    Workers are spawned rather than forked: the pool is used from the server's worker
+    threads, and forking a process that runs threads (torch, the MCP server) can deadlock.
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+        return _pool
+
+
+def shutdown_pool():
+    """Stop the feature extraction pool, if it was started. It is restarted on next use."""
+    global _pool
+    with _pool_lock:
+        pool, _pool = _pool, None
+    if pool is not None:
+        pool.shutdown(wait=True, cancel_futures=True)
+
+
+def extract_many(paths: list[str], workers: int = FEATURE_WORKERS) -> dict[str, dict[str, float]]:
+    """
+    Compute the features of many stems in a process pool, one stem per task.
+
+    Args:
+        paths (list[str]): Paths of the WAV files.
+        workers (int): Number of worker processes, used when the pool is first started.
+
+    Returns:
+        dict[str, dict[str, float]]: Path -> features, in the order of `paths`.
+    """
+    global _pool
+    if workers <= 1 or len(paths) <= 1:
+        return {path: extract_features(path) for path in paths}
+
+    pool = _process_pool(workers)
+    results = {}
+    try:
+        futures = {pool.submit(extract_features, path): path for path in paths}
+        for future in as_completed(futures):
+            results[futures[future]] = future.result()
+    except BrokenProcessPool:
+        # A worker died, start a new pool on the next call
+        with _pool_lock:
+            if _pool is pool:
+                _pool = None
+        raise
+    return {path: results[path] for path in paths}
+
+
+_hash_lock = threading.Lock()
+_hashes = {}
+
+
+def stem_hash(path: str) -> str:
+    """
+    Content hash of a stem, recomputed only when its size or modification time changed.
+    """
+    stat = os.stat(path)
+    key = (path, stat.st_size, stat.st_mtime_ns)
+    with _hash_lock:
+        if key in _hashes:
+            return _hashes[key]
+
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    with _hash_lock:
+        _hashes[key] = digest.hexdigest()
+    return _hashes[key]
+
+
+def feature_matrix(features: dict[str, dict[str, float]]) -> np.ndarray:
+    """
+    Returns:
+        np.ndarray: float32 array of shape (stems, NB_FEATURES), rows in the order of `features`.
+    """
+    return np.array([[stem[name] for name in FEATURE_NAMES] for stem in features.values()], dtype=np.float32)
+
+
+def list_stems(path: str) -> list[str]:
+    """
+    Args:
+        path: A WAV file, or a directory searched recursively for WAV files.
+
+    Returns:
+        list[str]: Absolute paths of the WAV files, sorted.
+    """
+    if os.path.isfile(path):
+        return [os.path.abspath(path)]
+
+    stems = []
+    for root, _, files in os.walk(path):
+        stems.extend(os.path.abspath(os.path.join(root, f)) for f in files if f.lower().endswith(".wav"))
+    return sorted(stems)
+
+
+def main():
+    stems = list_stems(sys.argv[1] if len(sys.argv) > 1 else os.getenv("STEMS_DIR", "."))
+    start = time.perf_counter()
+    features = extract_many(stems)
+    elapsed = time.perf_counter() - start
+    for path, values in features.items():
+        print(f"{os.path.basename(path)}: loudness {values['integrated_loudness']:.1f} LUFS, "
+              f"centroid {values['spectral_centroid']:.0f} Hz, width {values['stereo_width']:.2f}")
+    print(f"{len(stems)} stems in {elapsed:.2f}s")
+
+
+if __name__ == "__main__":
+    main()
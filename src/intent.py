@@ -0,0 +1,146 @@
+import re
+from dataclasses import dataclass
+from typing import Optional
+
+_VOLUME_DOWN = r"lower|reduce|decrease|cut|drop|turn down|bring down"
+_VOLUME_UP = r"raise|increase|boost|turn up|bring up|push"
+
+_VOLUME_PATTERNS = [
+    re.compile(
+        rf"^(?P<verb>{_VOLUME_DOWN}|{_VOLUME_UP})\s+(?:the\s+)?(?P<track>.+?)(?:\s+volume)?"
+        r"\s+by\s+(?P<amount>\d+(?:\.\d+)?)\s*db$"
+    ),
+    re.compile(
+        r"^turn\s+(?:the\s+)?(?P<track>.+?)(?:\s+volume)?\s+(?P<verb>up|down)"
+        r"\s+by\s+(?P<amount>\d+(?:\.\d+)?)\s*db$"
+    ),
+]
+_PAN_PATTERNS = [
+    re.compile(
+        r"^pan\s+(?:the\s+)?(?P<track>.+?)\s+(?:to\s+)?(?P<amount>\d+(?:\.\d+)?)\s*%\s*(?:to\s+the\s+)?(?P<side>left|right)$"
+    ),
+    re.compile(r"^pan\s+(?:the\s+)?(?P<track>.+?)\s+(?:to\s+the\s+)?(?P<side>hard left|hard right|center|centre)$"),
+    re.compile(r"^(?P<side>center|centre)\s+(?:the\s+)?(?P<track>.+?)$"),
+]
+_BYPASS_PATTERN = re.compile(
+    r"^(?P<verb>bypass|disable|turn off|enable|unbypass|re-?enable|turn on)\s+(?:the\s+)?"
+    r"(?P<fx>eq|equalizer|compressor|comp|compression|reverb|delay)\s+(?:on|of)\s+(?:the\s+)?(?P<track>.+?)$"
+)
+
+_FX_NAMES = {
+    "eq": "ReaEQ",
+    "equalizer": "ReaEQ",
+    "compressor": "ReaComp",
+    "comp": "ReaComp",
+    "compression": "ReaComp",
+    "reverb": "ReaVerbate",
+    "delay": "ReaDelay",
+}
+
+
+@dataclass
+class Intent:
+    tool: str
+    arguments: dict
+    # Absolute pan target, turned into a `pan_change` once the current pan is known
+    pan_target: Optional[float] = None
+
+
+def _normalize(text: str) -> str:
+    text = text.strip().lower().rstrip(".!")
+    return " ".join(text.split())
+
+
+def _singular(word: str) -> str:
+    if word.endswith("ies") and len(word) > 4:
+        return word[:-3] + "y"
+    if word.endswith("s") and not word.endswith("ss") and len(word) > 3:
+        return word[:-1]
+    return word
+
+
+def _tokens(text: str) -> tuple:
+    return tuple(_singular(word) for word in re.findall(r"[a-z0-9]+", text))
+
+
+def match_track(text: str, track_names) -> Optional[str]:
+    """
+    Resolve the track a command refers to.
+
+    Words are compared whole, after removing plurals: "bass" never matches "Backing
+    vocals", and "harmonies" matches "Harmony".
+
+    Args:
+        text: The track as written in the command (e.g. "harmonies", "lead vocal track").
+        track_names: Names of the tracks of the project.
+
+    Returns:
+        The track name, or None if no track or several tracks match.
+    """
+    words = _tokens(re.sub(r"\s+tracks?$", "", _normalize(text)))
+    if not words:
+        return None
+    candidates = {name: _tokens(_normalize(name)) for name in track_names}
+
+    exact = [name for name, tokens in candidates.items() if tokens == words]
+    if exact:
+        return exact[0] if len(exact) == 1 else None
+
+    # Every word of the command is a word of the track name
+    partial = [name for name, tokens in candidates.items() if set(words) <= set(tokens)]
+    return partial[0] if len(partial) == 1 else None
+
+
+def parse_command(query: str, track_names) -> Optional[Intent]:
+    """
+    Recognise simple volume, pan and bypass commands.
+
+    Args:
+        query: The user request.
+        track_names: Names of the tracks of the project.
+
+    Returns:
+        Intent: The tool call to run, or None when the command is not clearly one of
+        the supported forms or its track is ambiguous.
+    """
+    query = _normalize(query)
+
+    for pattern in _VOLUME_PATTERNS:
+        match = pattern.match(query)
+        if match:
+            track = match_track(match["track"], track_names)
+            if track is None:
+                return None
+            amount = float(match["amount"])
+            if re.fullmatch(_VOLUME_DOWN, match["verb"]) or match["verb"] == "down":
+                amount = -amount
+            return Intent("set_track_volume", {"track_name": track, "db_change": amount})
+
+    for pattern in _PAN_PATTERNS:
+        match = pattern.match(query)
+        if match:
+            track = match_track(match["track"], track_names)
+            if track is None:
+                return None
+            side = match["side"]
+            if side in ("center", "centre"):
+                target = 0.0
+            elif side.startswith("hard"):
+                target = -1.0 if side.endswith("left") else 1.0
+            else:
+                target = min(float(match["amount"]), 100.0) / 100
+                target = -target if side == "left" else target
+            return Intent("set_track_pan", {"track_name": track}, pan_target=target)
+
+    match = _BYPASS_PATTERN.match(query)
+    if match:
+        track = match_track(match["track"], track_names)
+        if track is None:
+            return None
+        bypass = 1.0 if match["verb"] in ("bypass", "disable", "turn off") else 0.0
+        return Intent(
+            "set_track_FX",
+            {"track_name": track, "fx_name": _FX_NAMES[match["fx"]], "new_settings": {"bypass": bypass}},
+        )
+
+    return None
@@ -0,0 +1,101 @@
+import threading
+from collections import OrderedDict
+
+from metrics import record_cache
+
+
+class LRUCache:
+    """Small least-recently-used cache with hit/miss counters, safe to share between threads."""
+
+    def __init__(self, maxsize: int = 256):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """
+        Args:
+            key: The key to look up.
+
+        Returns:
+            The cached value, or None if the key is not cached.
+        """
+        with self._lock:
+            if key not in self._data:
+                self.misses += 1
+                record_cache(False)
+                return None
+            self.hits += 1
+            record_cache(True)
+            self._data.move_to_end(key)
+            return self._data[key]
+
+    def put(self, key, value):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            if len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def __len__(self):
+        return len(self._data)
+
+
+class KnowledgeBase:
+    """
+    Long-lived handle on the mixing knowledge base.
+
+    The Chroma store is opened once per process, and both the query embeddings and the
+    top-k results are kept in LRU caches keyed on the normalized query, so repeated
+    questions do not re-embed nor re-search.
+    """
+
+    def __init__(self, persist_directory: str, embedding, cache_size: int = 256):
+        # chromadb is slow to import, only pay for it when the store is opened
+        from langchain_chroma import Chroma
+
+        self.embedding = embedding
+        self.vector_store = Chroma(persist_directory=persist_directory, embedding_function=embedding)
+        self.embeddings = LRUCache(cache_size)
+        self.results = LRUCache(cache_size)
+
+    @staticmethod
+    def normalize(query: str) -> str:
+        return " ".join(query.lower().split())
+
+    def search(self, query: str, k: int = 3) -> tuple[str, ...]:
+        """
+        Semantic search in the knowledge base.
+
+        Args:
+            query (str): A natural language question about mixing.
+            k (int): Number of documents to return.
+
+        Returns:
+            tuple[str, ...]: Content of the k most relevant documents.
+        """
+        key = self.normalize(query)
+        results = self.results.get((key, k))
+        if results is not None:
+            return results
+
+        vector = self.embeddings.get(key)
+        if vector is None:
+            vector = self.embedding.embed_query(key)
+            self.embeddings.put(key, vector)
+
+        docs = self.vector_store.similarity_search_by_vector(vector, k=k)
+        results = tuple(doc.page_content for doc in docs)
+        self.results.put((key, k), results)
+        return results
+
+    def stats(self) -> dict:
+        return {
+            "results_hits": self.results.hits,
+            "results_misses": self.results.misses,
+            "embedding_hits": self.embeddings.hits,
+            "embedding_misses": self.embeddings.misses,
+            "cached_queries": len(self.results),
+        }
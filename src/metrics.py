@@ -0,0 +1,176 @@
+import contextvars
+import functools
+import json
+import threading
+import time
+from collections import deque
+from dataclasses import asdict, dataclass, field
+from typing import Callable, Optional
+
+# Upper bounds of the latency histogram buckets, in milliseconds
+LATENCY_BUCKETS_MS = (1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+
+@dataclass
+class Span:
+    tool: str
+    trace_id: Optional[str]
+    start: float
+    duration_ms: float = 0.0
+    rpc_calls: int = 0
+    payload_bytes: int = 0
+    cache_hits: int = 0
+    cache_misses: int = 0
+    error: Optional[str] = None
+
+
+@dataclass
+class ToolStats:
+    calls: int = 0
+    errors: int = 0
+    total_ms: float = 0.0
+    max_ms: float = 0.0
+    rpc_calls: int = 0
+    payload_bytes: int = 0
+    cache_hits: int = 0
+    cache_misses: int = 0
+    histogram: list = field(default_factory=lambda: [0] * (len(LATENCY_BUCKETS_MS) + 1))
+
+    def add(self, span: Span):
+        self.calls += 1
+        self.errors += span.error is not None
+        self.total_ms += span.duration_ms
+        self.max_ms = max(self.max_ms, span.duration_ms)
+        self.rpc_calls += span.rpc_calls
+        self.payload_bytes += span.payload_bytes
+        self.cache_hits += span.cache_hits
+        self.cache_misses += span.cache_misses
+        bucket = next((i for i, bound in enumerate(LATENCY_BUCKETS_MS) if span.duration_ms <= bound), -1)
+        self.histogram[bucket] += 1
+
+    def to_dict(self) -> dict:
+        lookups = self.cache_hits + self.cache_misses
+        return {
+            "calls": self.calls,
+            "errors": self.errors,
+            "mean_ms": round(self.total_ms / self.calls, 3) if self.calls else 0.0,
+            "max_ms": round(self.max_ms, 3),
+            "rpc_calls": self.rpc_calls,
+            "payload_bytes": self.payload_bytes,
+            "cache_hit_rate": round(self.cache_hits / lookups, 3) if lookups else None,
+            "latency_histogram_ms": {
+                **{f"<={bound}": count for bound, count in zip(LATENCY_BUCKETS_MS, self.histogram)},
+                f">{LATENCY_BUCKETS_MS[-1]}": self.histogram[-1],
+            },
+        }
+
+
+_current_span: contextvars.ContextVar[Optional[Span]] = contextvars.ContextVar("current_span", default=None)
+
+
+def record_rpc(count: int = 1):
+    """Count a DAW round trip against the tool call being served, if any."""
+    span = _current_span.get()
+    if span is not None:
+        span.rpc_calls += count
+
+
+def record_cache(hit: bool):
+    """Count a cache lookup against the tool call being served, if any."""
+    span = _current_span.get()
+    if span is not None:
+        if hit:
+            span.cache_hits += 1
+        else:
+            span.cache_misses += 1
+
+
+class MetricsRegistry:
+    """Per-tool call statistics and the most recent spans."""
+
+    def __init__(self, recent_spans: int = 200):
+        self._lock = threading.Lock()
+        self._tools: dict[str, ToolStats] = {}
+        self._spans = deque(maxlen=recent_spans)
+        self._dumped = 0
+        self._recorded = 0
+
+    def record(self, span: Span):
+        with self._lock:
+            self._tools.setdefault(span.tool, ToolStats()).add(span)
+            self._spans.append(span)
+            self._recorded += 1
+
+    def instrument(self, trace_id: Callable[[], Optional[str]] = lambda: None):
+        """
+        Decorator recording a span for every call of an async tool: latency, DAW round
+        trips, cache lookups, size of the result and the trace id of the request.
+
+        Args:
+            trace_id: Returns the trace id propagated by the client for the current request.
+        """
+
+        def decorator(fn):
+            @functools.wraps(fn)
+            async def wrapper(*args, **kwargs):
+                span = Span(tool=fn.__name__, trace_id=trace_id(), start=time.time())
+                token = _current_span.set(span)
+                start = time.perf_counter()
+                try:
+                    result = await fn(*args, **kwargs)
+                    span.payload_bytes = len(str(result).encode())
+                    return result
+                except Exception as e:
+                    span.error = f"{type(e).__name__}: {e}"
+                    raise
+                finally:
+                    span.duration_ms = (time.perf_counter() - start) * 1000
+                    _current_span.reset(token)
+                    self.record(span)
+
+            return wrapper
+
+        return decorator
+
+    def snapshot(self, spans: int = 20) -> dict:
+        """
+        Args:
+            spans (int): Number of most recent spans to include.
+
+        Returns:
+            dict: Per-tool statistics and the most recent spans.
+        """
+        with self._lock:
+            return {
+                "tools": {name: stats.to_dict() for name, stats in self._tools.items()},
+                "recent_spans": [asdict(span) for span in list(self._spans)[-spans:]] if spans else [],
+            }
+
+    def dump(self, path: str):
+        """Append the statistics and the spans recorded since the last dump as one JSON line."""
+        with self._lock:
+            new = min(self._recorded - self._dumped, len(self._spans))
+            spans = [asdict(span) for span in list(self._spans)[len(self._spans) - new:]]
+            self._dumped = self._recorded
+            line = {
+                "time": time.time(),
+                "tools": {name: stats.to_dict() for name, stats in self._tools.items()},
+                "spans": spans,
+            }
+        with open(path, "a") as f:
+            f.write(json.dumps(line) + "\n")
+
+    def start_periodic_dump(self, path: str, interval: float) -> threading.Thread:
+        """Dump to `path` every `interval` seconds from a daemon thread."""
+
+        def run():
+            while True:
+                time.sleep(interval)
+                self.dump(path)
+
+        thread = threading.Thread(target=run, name="metrics-dump", daemon=True)
+        thread.start()
+        return thread
+
+
+metrics = MetricsRegistry()
@@ -0,0 +1,236 @@
+import os
+import re
+from dataclasses import dataclass
+
+import numpy as np
+
+from snapshot import ATTR_TRACK, ProjectSnapshot
+
+_SHORT_ATTRS = ["v", "p", "w"]
+
+# Values closer than this are considered equal, REAPER stores parameters as doubles
+# but rounds some of them on write
+TOLERANCE = 1e-6
+
+_NAME_PATTERN = re.compile(r"^[\w\- .]{1,64}$")
+
+
+@dataclass
+class MixSnapshot:
+    """
+    Mix state stored as flat NumPy arrays.
+
+    - tracks: track names; attributes: (n_tracks, 3) volume, pan and width
+    - fx_track: track index of each FX slot; fx_names: FX name of each slot
+    - fx_offsets: (n_fx + 1,) start of the parameters of each slot in `values`
+    - values: raw value of every FX parameter, slot after slot
+    - fx_types / type_offsets / param_names: parameter names, stored once per FX type
+    """
+
+    name: str
+    tracks: np.ndarray
+    attributes: np.ndarray
+    fx_track: np.ndarray
+    fx_names: np.ndarray
+    fx_offsets: np.ndarray
+    values: np.ndarray
+    fx_types: np.ndarray
+    type_offsets: np.ndarray
+    param_names: np.ndarray
+
+    @classmethod
+    def from_project(cls, name: str, project: ProjectSnapshot) -> "MixSnapshot":
+        """
+        Args:
+            name (str): Name of the snapshot.
+            project (ProjectSnapshot): The project state to store.
+
+        Returns:
+            MixSnapshot: The snapshot.
+        """
+        tracks = list(project.tracks.values())
+        fx_track, fx_names, sizes, values = [], [], [], []
+        type_params = {}
+        for track_index, track in enumerate(tracks):
+            for fx in track.fxs:
+                fx_track.append(track_index)
+                fx_names.append(fx.name)
+                sizes.append(len(fx.params))
+                values.extend(param.value for param in fx.params)
+                type_params.setdefault(fx.name, [param.name for param in fx.params])
+
+        return cls(
+            name=name,
+            tracks=np.array([track.name for track in tracks], dtype=str),
+            attributes=np.array(
+                [[track.attributes[attr] for attr in ATTR_TRACK] for track in tracks], dtype=np.float64
+            ).reshape(-1, len(ATTR_TRACK)),
+            fx_track=np.array(fx_track, dtype=np.int32),
+            fx_names=np.array(fx_names, dtype=str),
+            fx_offsets=np.concatenate([[0], np.cumsum(sizes, dtype=np.int64)]),
+            values=np.array(values, dtype=np.float64),
+            fx_types=np.array(list(type_params), dtype=str),
+            type_offsets=np.concatenate([[0], np.cumsum([len(p) for p in type_params.values()], dtype=np.int64)]),
+            param_names=np.array([n for params in type_params.values() for n in params], dtype=str),
+        )
+
+    @property
+    def n_params(self) -> int:
+        return len(self.values)
+
+    def save(self, directory: str) -> str:
+        """
+        Write the snapshot to `<directory>/<name>.npz`.
+
+        Returns:
+            str: Path of the file.
+        """
+        os.makedirs(directory, exist_ok=True)
+        path = snapshot_path(directory, self.name)
+        arrays = {key: value for key, value in self.__dict__.items() if key != "name"}
+        with open(path + ".tmp", "wb") as f:
+            np.savez_compressed(f, **arrays)
+        os.replace(path + ".tmp", path)
+        return path
+
+    @classmethod
+    def load(cls, directory: str, name: str) -> "MixSnapshot":
+        """
+        Raises:
+            KeyError: If there is no snapshot with this name.
+        """
+        path = snapshot_path(directory, name)
+        if not os.path.exists(path):
+            raise KeyError(f"Mix snapshot '{name}' not found")
+        with np.load(path, allow_pickle=False) as data:
+            return cls(name=name, **{key: data[key] for key in data.files})
+
+    def slots(self) -> dict:
+        """(track name, FX name, occurrence on the track) -> FX slot index."""
+        slots = {}
+        seen = {}
+        for slot, (track_index, fx_name) in enumerate(zip(self.fx_track.tolist(), self.fx_names.tolist())):
+            key = (str(self.tracks[track_index]), fx_name)
+            seen[key] = seen.get(key, -1) + 1
+            slots[(*key, seen[key])] = slot
+        return slots
+
+    def param_tables(self) -> dict[str, list[str]]:
+        """FX name -> parameter names, in parameter index order."""
+        offsets = self.type_offsets.tolist()
+        names = self.param_names.tolist()
+        return {fx_name: names[offsets[i]:offsets[i + 1]] for i, fx_name in enumerate(self.fx_types.tolist())}
+
+
+def snapshot_path(directory: str, name: str) -> str:
+    if not _NAME_PATTERN.match(name):
+        raise ValueError(f"Invalid snapshot name '{name}': use letters, digits, spaces, '-', '_' or '.'")
+    return os.path.join(directory, f"{name}.npz")
+
+
+@dataclass
+class MixChanges:
+    """
+    What differs from snapshot `a` to snapshot `b`, as parallel arrays.
+
+    Attribute changes are (track, attribute index, value in a, value in b); parameter
+    changes are (track, FX slot key, parameter index, value in a, value in b).
+    """
+
+    attr_tracks: list
+    attr_index: np.ndarray
+    attr_a: np.ndarray
+    attr_b: np.ndarray
+    param_slots: list
+    param_index: np.ndarray
+    param_a: np.ndarray
+    param_b: np.ndarray
+    only_a: list
+    only_b: list
+
+    def __len__(self) -> int:
+        return len(self.attr_tracks) + len(self.param_slots)
+
+
+def compare(a: MixSnapshot, b: MixSnapshot) -> MixChanges:
+    """
+    Compare two snapshots in one vectorized pass over the tracks and FX slots they share.
+
+    FX are matched by track name, FX name and position among the FX of the same name
+    on the track. Tracks and FX present in only one snapshot are listed in `only_a` /
+    `only_b`.
+
+    Returns:
+        MixChanges: The differences.
+    """
+    tracks_a = {name: i for i, name in enumerate(a.tracks.tolist())}
+    tracks_b = {name: i for i, name in enumerate(b.tracks.tolist())}
+    common = [name for name in tracks_a if name in tracks_b]
+    ia = np.array([tracks_a[name] for name in common], dtype=np.intp)
+    ib = np.array([tracks_b[name] for name in common], dtype=np.intp)
+    attr_a = a.attributes[ia].reshape(-1, len(ATTR_TRACK))
+    attr_b = b.attributes[ib].reshape(-1, len(ATTR_TRACK))
+    rows, cols = np.nonzero(np.abs(attr_a - attr_b) > TOLERANCE)
+
+    slots_a, slots_b = a.slots(), b.slots()
+    pairs = [
+        (key, slots_a[key], slots_b[key])
+        for key in slots_a
+        if key in slots_b
+        and a.fx_offsets[slots_a[key] + 1] - a.fx_offsets[slots_a[key]]
+        == b.fx_offsets[slots_b[key] + 1] - b.fx_offsets[slots_b[key]]
+    ]
+    starts_a = np.array([a.fx_offsets[sa] for _, sa, _ in pairs], dtype=np.int64)
+    starts_b = np.array([b.fx_offsets[sb] for _, _, sb in pairs], dtype=np.int64)
+    sizes = np.array([a.fx_offsets[sa + 1] - a.fx_offsets[sa] for _, sa, _ in pairs], dtype=np.int64)
+    # Parameter index within its FX, for every parameter of every shared slot
+    pair_of = np.repeat(np.arange(len(pairs)), sizes)
+    local = np.arange(int(sizes.sum())) - np.repeat(np.cumsum(sizes) - sizes, sizes)
+    values_a = a.values[starts_a[pair_of] + local] if len(local) else np.empty(0)
+    values_b = b.values[starts_b[pair_of] + local] if len(local) else np.empty(0)
+    changed = np.flatnonzero(np.abs(values_a - values_b) > TOLERANCE)
+
+    only_a = [name for name in tracks_a if name not in tracks_b]
+    only_b = [name for name in tracks_b if name not in tracks_a]
+    paired = {key for key, _, _ in pairs}
+    only_a += [f"{key[0]}/{key[1]}" for key in slots_a if key not in paired and key[0] in tracks_b]
+    only_b += [f"{key[0]}/{key[1]}" for key in slots_b if key not in paired and key[0] in tracks_a]
+
+    return MixChanges(
+        attr_tracks=[common[row] for row in rows.tolist()],
+        attr_index=cols,
+        attr_a=attr_a[rows, cols],
+        attr_b=attr_b[rows, cols],
+        param_slots=[pairs[i][0] for i in pair_of[changed].tolist()],
+        param_index=local[changed],
+        param_a=values_a[changed],
+        param_b=values_b[changed],
+        only_a=only_a,
+        only_b=only_b,
+    )
+
+
+def encode_changes(a: MixSnapshot, changes: MixChanges, digits: int = 3) -> dict:
+    """
+    Compact listing of the changes: one [track, key, value in a, value in b] row per change,
+    the key being v (volume), p (pan), w (width) or "<FX name>/<parameter name>".
+    """
+    rows = [
+        [track, _SHORT_ATTRS[index], round(va, digits), round(vb, digits)]
+        for track, index, va, vb in zip(
+            changes.attr_tracks, changes.attr_index.tolist(), changes.attr_a.tolist(), changes.attr_b.tolist()
+        )
+    ]
+    param_tables = a.param_tables()
+    rows += [
+        [track, f"{fx_name}/{param_tables[fx_name][index]}", round(va, digits), round(vb, digits)]
+        for (track, fx_name, _), index, va, vb in zip(
+            changes.param_slots, changes.param_index.tolist(), changes.param_a.tolist(), changes.param_b.tolist()
+        )
+    ]
+    encoded = {"changes": rows}
+    if changes.only_a:
+        encoded["only_a"] = changes.only_a
+    if changes.only_b:
+        encoded["only_b"] = changes.only_b
+    return encoded
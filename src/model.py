@@ -1,7 +1,7 @@
 
-from dataclasses import dataclass, field
-from typing import Optional
-from dataclasses import asdict
+import math
+from dataclasses import dataclass, fields
+from typing import ClassVar, Literal, Optional
 
 CompressorSettingsMapping = {
     'threshold': 'Threshold',
@@ -96,8 +96,110 @@ ReverbSettingsMapping = {
 
 
 
-@dataclass
-class CompressorSettings:
+class FXSettings:
+    """
+    Settings of an FX plugin, one optional value per REAPER parameter, normalized or in
+    the physical units of units.FIELD_SCALES. `to_vector` / `from_vector` convert them to
+    and from a NumPy vector in FIELDS order.
+
+    The lookup tables are class attributes, built once per FX type by `_fx_settings`; the
+    parameter indices depend on the plugin build and are read from REAPER (`param_index`):
+
+    - FIELDS: the settings fields, in declaration order
+    - PARAM_NAMES: REAPER parameter name of each field, in FIELDS order
+    - FIELD_PARAMS: field -> REAPER parameter name
+    - PLUGIN_PARAMS: every REAPER parameter of the plugin, in the plugin's order
+    """
+
+    __slots__ = ()
+
+    FIELDS: ClassVar[tuple] = ()
+    PARAM_NAMES: ClassVar[tuple] = ()
+    FIELD_PARAMS: ClassVar[dict] = {}
+    PLUGIN_PARAMS: ClassVar[tuple] = ()
+
+    @classmethod
+    def from_fields(cls, values: dict[str, Optional[float]]) -> "FXSettings":
+        """
+        Args:
+            values (dict): Field name -> value, None for the fields to leave unset.
+
+        Returns:
+            FXSettings: The settings.
+
+        Raises:
+            TypeError: If a field does not exist in this settings model.
+        """
+        unknown = values.keys() - cls.FIELD_PARAMS.keys()
+        if unknown:
+            raise TypeError(f"{cls.__name__} has no field {', '.join(sorted(unknown))}")
+        return cls(**values)
+
+    def set_fields(self) -> frozenset:
+        """Names of the fields that are set."""
+        return frozenset(name for name in self.FIELDS if getattr(self, name) is not None)
+
+    def to_vector(self):
+        """
+        Returns:
+            np.ndarray: The field values in FIELDS order, NaN for the fields that are not set.
+        """
+        import numpy as np
+
+        return np.array(
+            [math.nan if (value := getattr(self, name)) is None else value for name in self.FIELDS],
+            dtype=np.float64,
+        )
+
+    @classmethod
+    def from_vector(cls, vector) -> "FXSettings":
+        """
+        Args:
+            vector: Field values in FIELDS order, NaN for the fields to leave unset.
+
+        Returns:
+            FXSettings: The settings.
+        """
+        import numpy as np
+
+        vector = np.asarray(vector, dtype=np.float64)
+        if vector.shape != (len(cls.FIELDS),):
+            raise ValueError(f"{cls.__name__} expects a vector of {len(cls.FIELDS)} values, got shape {vector.shape}")
+        return cls(**{name: value for name, value in zip(cls.FIELDS, vector.tolist()) if not math.isnan(value)})
+
+    @classmethod
+    def param_index(cls, param_table: dict[str, int]):
+        """
+        Field -> parameter index table of an instance of the plugin.
+
+        Args:
+            param_table (dict): REAPER parameter name -> index, as read from the plugin.
+
+        Returns:
+            np.ndarray: Index of the parameter of each field in FIELDS order, -1 for the
+            fields whose parameter the plugin does not have.
+        """
+        import numpy as np
+
+        return np.array([param_table.get(name, -1) for name in cls.PARAM_NAMES], dtype=np.intp)
+
+
+def _fx_settings(mapping: dict):
+    """Build the lookup tables of a settings dataclass from its field -> REAPER name mapping."""
+
+    def decorate(cls):
+        cls.FIELDS = tuple(f.name for f in fields(cls))
+        cls.PARAM_NAMES = tuple(mapping[name] for name in cls.FIELDS)
+        cls.FIELD_PARAMS = dict(zip(cls.FIELDS, cls.PARAM_NAMES))
+        cls.PLUGIN_PARAMS = tuple(dict.fromkeys(mapping.values()))
+        return cls
+
+    return decorate
+
+
+@_fx_settings(CompressorSettingsMapping)
+@dataclass(slots=True)
+class CompressorSettings(FXSettings):
     threshold: Optional[float] = None
     ratio: Optional[float] = None
     attack: Optional[float] = None
@@ -110,14 +212,12 @@ class CompressorSettings:
     wet: Optional[float] = None
     rms_size: Optional[float] = None
     knee: Optional[float] = None
-    mapping: dict = field(default_factory=lambda: CompressorSettingsMapping.copy())
-
-    def _to_dict(self)-> dict:
-        return {self.mapping[k]: v for k, v in asdict(self).items() if v is not None and k != "mapping"}
+    bypass: Optional[float] = None
 
 
-@dataclass
-class EQSettings:
+@_fx_settings(EqSettingsMapping)
+@dataclass(slots=True)
+class EQSettings(FXSettings):
     freq_low_shelf: Optional[float] = None
     gain_low_shelf: Optional[float] = None
     bw_low_shelf: Optional[float] = None
@@ -140,17 +240,12 @@ class EQSettings:
 
     global_gain: Optional[float] = None
     wet: Optional[float] = None
-
-    mapping: dict = field(default_factory=lambda: EqSettingsMapping.copy())
-
-    def _to_dict(self)-> dict:
-        return {self.mapping[k]: v for k, v in asdict(self).items() if v is not None and k != "mapping"}
-    
-
+    bypass: Optional[float] = None
 
 
-@dataclass
-class ReverbSettings:
+@_fx_settings(ReverbSettingsMapping)
+@dataclass(slots=True)
+class ReverbSettings(FXSettings):
     wet: Optional[float]       = None
     dry: Optional[float]       = None
     room_size: Optional[float] = None
@@ -163,14 +258,9 @@ class ReverbSettings:
     delta: Optional[float]     = None
 
 
-    mapping: dict = field(default_factory=lambda: ReverbSettingsMapping.copy())
-
-    def _to_dict(self) -> dict:
- 
-        return {self.mapping[k]: v for k, v in asdict(self).items() if v is not None and k != "mapping"}
-    
-@dataclass
-class DelaySettings:
+@_fx_settings(DelaySettingsMapping)
+@dataclass(slots=True)
+class DelaySettings(FXSettings):
     wet: Optional[float] = None
     dry: Optional[float] = None
     enabled: Optional[float] = None
@@ -186,8 +276,21 @@ class DelaySettings:
     bypass: Optional[float] = None
     delta: Optional[float] = None
 
-    mapping: dict = field(default_factory=lambda: DelaySettingsMapping.copy())
 
-    def _to_dict(self) -> dict:
- 
-        return {self.mapping[k]: v for k, v in asdict(self).items() if v is not None and k != "mapping"}
\ No newline at end of file
+FX_SETTINGS = {
+    "ReaEQ": EQSettings,
+    "ReaComp": CompressorSettings,
+    "ReaVerbate": ReverbSettings,
+    "ReaDelay": DelaySettings,
+}
+
+
+@dataclass
+class MixOperation:
+    track_name: str
+    action: Literal["volume", "pan", "fx"]
+    db_change: Optional[float] = None
+    pan_change: Optional[float] = None
+    fx_name: Optional[str] = None
+    settings: Optional[dict[str, float]] = None
+    units: Literal["physical", "normalized"] = "physical"
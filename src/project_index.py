@@ -0,0 +1,161 @@
+import daw
+
+
+class ProjectIndex:
+    """
+    Maintained lookup tables for the write tools.
+
+    - track name -> track
+    - (track name, fx name) -> FX, resolved by substring like REAPER's own FX names
+    - FX type -> parameter name -> parameter index, read once per plugin type
+    - FX type -> raw value range of each parameter, read once per plugin type
+    - FX type -> parameter index of each field of its settings model
+
+    The track and FX tables are rebuilt when the state cache sees the project change
+    outside of our own writes (tracks or FX added, removed or renamed from REAPER).
+    FX added by our tools are registered directly, and the parameter values of the first
+    instance we add of a plugin are kept as that plugin's defaults.
+    """
+
+    def __init__(self, project, state_cache):
+        self.project = project
+        self.state_cache = state_cache
+        self.generation = None
+        self._tracks = {}
+        self._fxs = {}
+        self._param_tables = {}
+        self._param_ranges = {}
+        self._field_indices = {}
+        self.default_values = {}
+
+    def ensure_current(self):
+        """Rebuild the track and FX tables if the project changed since they were built."""
+        self.state_cache.check_version()
+        if self.generation != self.state_cache.generation:
+            self.rebuild()
+
+    def rebuild(self):
+        """Walk the project once, inside REAPER, and rebuild the track and FX tables."""
+        tracks = {}
+        fxs = {}
+        with daw.inside_reaper():
+            for track in self.project.tracks:
+                tracks[track.name] = track
+                fxs[track.name] = [(fx.name, fx) for fx in track.fxs]
+        self._tracks = tracks
+        self._fxs = fxs
+        self.generation = self.state_cache.generation
+
+    def get_track(self, track_name: str):
+        """
+        Args:
+            track_name (str): Name of the track.
+
+        Returns:
+            The reapy track.
+        """
+        if track_name not in self._tracks:
+            raise KeyError(f"Track '{track_name}' not found")
+        return self._tracks[track_name]
+
+    def get_fx(self, track_name: str, fx_name: str):
+        """
+        Find the first FX of a track whose name contains `fx_name`.
+
+        Args:
+            track_name (str): Name of the track.
+            fx_name (str): Name, or part of the name, of the FX plugin.
+
+        Returns:
+            tuple: (full FX name, reapy FX), or (None, None) if the track has no such FX.
+        """
+        for name, fx in self._fxs.get(track_name, []):
+            if fx_name in name:
+                return name, fx
+        return None, None
+
+    def get_fxs(self, track_name: str) -> list:
+        """
+        Args:
+            track_name (str): Name of the track.
+
+        Returns:
+            list: (full FX name, reapy FX) of every FX of the track, in chain order.
+        """
+        self.get_track(track_name)
+        return list(self._fxs.get(track_name, []))
+
+    def add_fx(self, track_name: str, fx_name: str):
+        """
+        Add an FX to a track and register it in the index.
+
+        Args:
+            track_name (str): Name of the track.
+            fx_name (str): Name of the FX plugin to add.
+
+        Returns:
+            tuple: (full FX name, reapy FX).
+        """
+        with daw.inside_reaper():
+            fx = self.get_track(track_name).add_fx(fx_name)
+            daw.record_writes()
+            name = fx.name
+            if name not in self.default_values:
+                params = list(fx.params)
+                self._param_tables[name] = {param.name: idx for idx, param in enumerate(params)}
+                self.default_values[name] = {param.name: float(param) for param in params}
+        self._fxs.setdefault(track_name, []).append((name, fx))
+        return name, fx
+
+    def get_param_table(self, fx_type: str, fx) -> dict[str, int]:
+        """
+        Return the parameter name -> index table of an FX type, reading it on first use.
+
+        Args:
+            fx_type (str): Full name of the FX plugin, shared by all its instances.
+            fx: An instance of the plugin, used to read the table the first time.
+
+        Returns:
+            dict[str, int]: Parameter name -> parameter index.
+        """
+        if fx_type not in self._param_tables:
+            with daw.inside_reaper():
+                self._param_tables[fx_type] = {param.name: idx for idx, param in enumerate(fx.params)}
+        return self._param_tables[fx_type]
+
+    def get_param_ranges(self, fx_type: str, fx) -> tuple:
+        """
+        Return the raw value range of every parameter of an FX type, reading it on first use.
+
+        Args:
+            fx_type (str): Full name of the FX plugin, shared by all its instances.
+            fx: An instance of the plugin, used to read the ranges the first time.
+
+        Returns:
+            tuple: (minimum values, maximum values), NumPy arrays indexed by parameter index.
+        """
+        if fx_type not in self._param_ranges:
+            import numpy as np
+
+            with daw.inside_reaper():
+                ranges = [param.range for param in fx.params]
+            bounds = np.array(ranges, dtype=np.float64).reshape(-1, 2)
+            self._param_ranges[fx_type] = (bounds[:, 0], bounds[:, 1])
+        return self._param_ranges[fx_type]
+
+    def get_field_index(self, fx_type: str, fx, settings_cls):
+        """
+        Return the parameter index of each field of a settings model, see
+        `FXSettings.param_index`.
+
+        Args:
+            fx_type (str): Full name of the FX plugin, shared by all its instances.
+            fx: An instance of the plugin, used to read its parameters the first time.
+            settings_cls: The settings model of the plugin.
+
+        Returns:
+            np.ndarray: Parameter index of each field in FIELDS order, -1 when missing.
+        """
+        if fx_type not in self._field_indices:
+            self._field_indices[fx_type] = settings_cls.param_index(self.get_param_table(fx_type, fx))
+        return self._field_indices[fx_type]
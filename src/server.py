@@ -1,28 +1,356 @@
+import time
 
+_T0 = time.perf_counter()
 
-import reapy
 import asyncio
+import contextvars
+import functools
+import json
+import logging
+import math
 import os 
-
-from model import EQSettings, CompressorSettings, ReverbSettings, DelaySettings
-from typing import Any
+import threading
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+
+import daw
+import encoding
+from model import EQSettings, CompressorSettings, ReverbSettings, DelaySettings, MixOperation, FX_SETTINGS
+from snapshot import ATTR_TRACK, ProjectStateCache
+from project_index import ProjectIndex
+from knowledge import KnowledgeBase
+from units import FIELD_SCALES, check_scale, from_normalized, fx_settings_type, known_scale_check, normalize_settings
+from metrics import metrics
+from write_queue import WriteQueue
+from change_feed import ChangeFeed, encode_changes
+from contextlib import asynccontextmanager
+from typing import Any, Literal, Optional
 from mcp.server.fastmcp import FastMCP
-from langchain_chroma import Chroma
-from langchain_community.embeddings import FastEmbedEmbeddings
 
-embedding = FastEmbedEmbeddings()
+logger = logging.getLogger("server")
+
+DB_PATH = os.getenv("DB_PATH")
+MIX_SNAPSHOT_DIR = os.getenv("MIX_SNAPSHOT_DIR", "mix_snapshots")
+# Track analysis: trained model, its feature normalization stats, and the rendered stems,
+# one "<track name>.wav" per track
+TRACK_MODEL_PATH = os.getenv("TRACK_MODEL_PATH")
+TRACK_STATS_PATH = os.getenv("TRACK_STATS_PATH")
+STEMS_DIR = os.getenv("STEMS_DIR")
+# Connect to REAPER and load the embedding model in the background once the server runs
+WARMUP = os.getenv("SERVER_WARMUP", "1") == "1"
+# Append the tool metrics as JSON lines to this file every METRICS_DUMP_INTERVAL seconds
+METRICS_DUMP_PATH = os.getenv("METRICS_DUMP_PATH")
+METRICS_DUMP_INTERVAL = float(os.getenv("METRICS_DUMP_INTERVAL", "60"))
+# "stdio" serves one client; "sse" and "streamable-http" serve many clients on
+# MCP_HOST:MCP_PORT, all sharing one REAPER connection
+MCP_TRANSPORT = os.getenv("MCP_TRANSPORT", "stdio")
+MCP_HOST = os.getenv("MCP_HOST", "127.0.0.1")
+MCP_PORT = int(os.getenv("MCP_PORT", "8000"))
+# Threads running the blocking REAPER reads of the tools, off the event loop
+READ_WORKERS = int(os.getenv("READ_WORKERS", "4"))
+# Number of past project versions get_project_changes can report changes from
+CHANGE_FEED_HISTORY = int(os.getenv("CHANGE_FEED_HISTORY", "64"))
+
+_reaper_lock = threading.RLock()
+_knowledge_lock = threading.Lock()
+_analyzer_lock = threading.Lock()
+_state_cache = None
+_project_index = None
+_knowledge_base = None
+_track_analyzer = None
+_last_project_snapshots = weakref.WeakKeyDictionary()
+_mix_snapshots = {}
+_change_feed = ChangeFeed(CHANGE_FEED_HISTORY)
+_started = False
+_sessions = 0
+
+
+def get_state_cache() -> ProjectStateCache:
+    """Connect to REAPER on first use and return the project state cache."""
+    global _state_cache
+    with _reaper_lock:
+        if _state_cache is None:
+            _state_cache = ProjectStateCache(daw.get_project())
+    return _state_cache
+
+
+def get_project_index() -> ProjectIndex:
+    """Return the track/FX index, built on first use."""
+    global _project_index
+    with _reaper_lock:
+        if _project_index is None:
+            state_cache = get_state_cache()
+            _project_index = ProjectIndex(state_cache.project, state_cache)
+    return _project_index
+
+
+def get_knowledge_base() -> KnowledgeBase:
+    """Load the embedding model and open the vector store on first use."""
+    global _knowledge_base
+    with _knowledge_lock:
+        if _knowledge_base is None:
+            from langchain_community.embeddings import FastEmbedEmbeddings
+
+            _knowledge_base = KnowledgeBase(DB_PATH, FastEmbedEmbeddings())
+    return _knowledge_base
+
+
+def get_track_analyzer():
+    """Load the track analysis model and its stats on first use."""
+    global _track_analyzer
+    with _analyzer_lock:
+        if _track_analyzer is None:
+            if not (TRACK_MODEL_PATH and TRACK_STATS_PATH):
+                raise RuntimeError("Track analysis needs TRACK_MODEL_PATH and TRACK_STATS_PATH")
+            from track_model import TrackAnalyzer
+
+            _track_analyzer = TrackAnalyzer(TRACK_MODEL_PATH, TRACK_STATS_PATH)
+    return _track_analyzer
+
+
+def _prepare_writes():
+    daw.take_writes()
+    get_project_index().ensure_current()
+
+
+def _writes_done(track_names: set):
+    writes = daw.take_writes()
+    if track_names or writes:
+        get_state_cache().invalidate_tracks(track_names, writes)
+
+
+def reset_state():
+    """
+    Forget everything read from the project: the state cache and index, the last state
+    sent to each client, the change feed and the mix snapshots loaded in memory. For a
+    new DAW backend, e.g. between benchmark runs.
+    """
+    global _state_cache, _project_index, _change_feed
+    with _reaper_lock:
+        _state_cache = None
+        _project_index = None
+        _last_project_snapshots.clear()
+        _mix_snapshots.clear()
+        _change_feed = ChangeFeed(CHANGE_FEED_HISTORY)
 
-reapy.connect()
-project = reapy.Project() 
 
-mcp = FastMCP("Track Management Server")
+# Every access to REAPER holds _reaper_lock: reapy has a single connection, and the state
+# cache and index are shared by all the sessions
+_read_pool = ThreadPoolExecutor(READ_WORKERS, thread_name_prefix="daw-read")
+_write_queue = WriteQueue(_reaper_lock, prepare=_prepare_writes, on_batch=_writes_done)
 
-ATTR_TRACK = ["D_VOL", "D_PAN", "D_WIDTH"]
 
-DB_PATH = os.getenv("DB_PATH")
+async def _read(fn, *args):
+    """Run a blocking REAPER read on the read pool, in the context of the calling tool."""
+    context = contextvars.copy_context()
+
+    def run():
+        with _reaper_lock:
+            return fn(*args)
+
+    return await asyncio.get_running_loop().run_in_executor(_read_pool, context.run, run)
+
+
+async def _write(apply, value=None, **kwargs):
+    """Queue a REAPER write behind the writes of every session and wait for its result."""
+    return await asyncio.wrap_future(_write_queue.submit(apply, value, **kwargs))
+
+
+def _warm_up():
+    steps = [
+        ("REAPER connection", get_state_cache),
+        ("knowledge base", get_knowledge_base),
+    ]
+    if TRACK_MODEL_PATH and TRACK_STATS_PATH:
+        steps.append(("track analysis model", get_track_analyzer))
+    for name, init in steps:
+        start = time.perf_counter()
+        try:
+            init()
+        except Exception:
+            logger.exception("warm-up: %s failed", name)
+            continue
+        logger.info("warm-up: %s ready in %.0f ms", name, (time.perf_counter() - start) * 1000)
+
+
+@asynccontextmanager
+async def _lifespan(server):
+    global _started, _sessions
+    # The HTTP transports enter the lifespan once per session
+    if not _started:
+        _started = True
+        logger.info("startup: serving after %.0f ms", (time.perf_counter() - _T0) * 1000)
+        if WARMUP:
+            threading.Thread(target=_warm_up, name="warm-up", daemon=True).start()
+        if METRICS_DUMP_PATH:
+            metrics.start_periodic_dump(METRICS_DUMP_PATH, METRICS_DUMP_INTERVAL)
+    _sessions += 1
+    try:
+        yield
+    finally:
+        _sessions -= 1
+        if not _sessions:
+            from features import shutdown_pool
+
+            # Stop the feature extraction workers with the last session
+            await asyncio.to_thread(shutdown_pool)
+
+
+mcp = FastMCP("Track Management Server", lifespan=_lifespan, host=MCP_HOST, port=MCP_PORT)
+
+
+def _trace_id() -> Optional[str]:
+    """Trace id sent by the client in the `_meta` of the current request, if any."""
+    try:
+        meta = mcp.get_context().request_context.meta
+    except (LookupError, ValueError):
+        return None
+    return getattr(meta, "trace_id", None) if meta is not None else None
+
+
+instrumented = metrics.instrument(trace_id=_trace_id)
+
+
+class _NoSession:
+    """Stands for the session of tool calls made outside of a request."""
+
+
+_NO_SESSION = _NoSession()
+
+
+def _session():
+    """The MCP session of the current request, the key of per-client state."""
+    try:
+        return mcp.get_context().request_context.session
+    except (LookupError, ValueError):
+        return _NO_SESSION
+
+
+def _compute_volume(current_volume: float, db_change: float) -> float:
+    multiplier = math.pow(10, db_change / 20)
+    new_volume = current_volume * multiplier
+
+    # Clamp between 0.0 and 4.0 to prevent clipping
+    return min(max(new_volume, 0.0), 4.0)
+
+
+def _compute_pan(current_pan: float, pan_change: float) -> float:
+    # Clamp the new pan value to stay within valid range
+    return max(-1.0, min(1.0, current_pan + pan_change))
+
+
+def _merge_relative(old: tuple, new: tuple) -> tuple:
+    """Merge two queued (current value, change) writes of a track attribute."""
+    # A given current value restarts from it, otherwise the changes add up
+    if new[0] is not None:
+        return new
+    return old[0], old[1] + new[1]
+
+
+def _write_relative(track_name: str, attribute: str, compute, change: tuple) -> float:
+    """
+    Apply a relative change to a track attribute, on the writer thread.
+
+    Args:
+        track_name (str): Name of the track.
+        attribute (str): "D_VOL" or "D_PAN".
+        compute: Returns the new value from the current value and the change.
+        change (tuple): (current value, or None to read it from the project, change).
+
+    Returns:
+        float: The value written.
+    """
+    current, delta = change
+    if current is None:
+        current = get_state_cache().get_track(track_name).attributes[attribute]
+    value = compute(current, delta)
+    get_project_index().get_track(track_name).set_info_value(attribute, value)
+    daw.record_writes()
+    return value
+
+
+def _scale_agrees(fx_type: str, fx, param_name: str, index: int, scale) -> bool:
+    """Check a unit scale against REAPER the first time a parameter of a plugin is written in it."""
+    known = known_scale_check(fx_type, param_name)
+    if known is not None:
+        return known
+    param = fx.params[index]
+    return check_scale(fx_type, param_name, scale, param.normalized, param.formatted)
+
+
+def _apply_fx_settings(track_name: str, fx_name: str, write: tuple) -> list[str]:
+    """
+    Write normalized settings to an FX of a track, adding the FX if needed.
+
+    Values are scaled to the raw range of their parameter; the parameter index of each
+    field and the ranges are read once per plugin. A field given in physical units is only
+    written if its scale agrees with the values REAPER formats (see `units.check_scale`).
+
+    Args:
+        track_name (str): Name of the track to modify.
+        fx_name (str): Name of the FX plugin (e.g. "ReaEQ").
+        write (tuple): (normalized FXSettings, names of the fields given in physical units).
+
+    Returns:
+        list[str]: One message per added FX and per written, refused or missing parameter,
+        with the value in physical units when the parameter has one.
+    """
+    import numpy as np
+
+    settings, physical = write
+    settings_cls = type(settings)
+    settings_type = fx_settings_type(fx_name)
+    scales = FIELD_SCALES.get(settings_type, {})
+    messages = []
+    project_index = get_project_index()
+    fx_type, fx = project_index.get_fx(track_name, fx_name)
+
+    if fx is None:
+        fx_type, fx = project_index.add_fx(track_name, fx_name)
+        messages.append(f"FX '{fx_name}' added to track '{track_name}'")
+
+    field_index = project_index.get_field_index(fx_type, fx, settings_cls)
+    low, high = project_index.get_param_ranges(fx_type, fx)
+    normalized = settings.to_vector()
+    indices = np.maximum(field_index, 0)
+    raw = low[indices] + normalized * (high[indices] - low[indices])
+    shown = from_normalized(settings_type, normalized)
+
+    for i in np.flatnonzero(~np.isnan(normalized)).tolist():
+        field, name, idx = settings_cls.FIELDS[i], settings_cls.PARAM_NAMES[i], int(field_index[i])
+        scale = scales.get(field)
+        if idx < 0:
+            messages.append(f"Parameter '{name}' not found in FX '{fx_type}'")
+        elif field in physical and scale is not None and not _scale_agrees(fx_type, fx, name, idx, scale):
+            messages.append(
+                f"{name} was not set: its {scale.unit} scale does not match REAPER's, "
+                f"give it with units=\"normalized\""
+            )
+        else:
+            fx.params[idx] = float(raw[i])
+            daw.record_writes()
+            if scale is not None and known_scale_check(fx_type, name) is not False:
+                value = f"{shown[i]:.4g} {scale.unit}"
+            else:
+                value = f"{normalized[i]:.4f}"
+            messages.append(f"{name} is set to {value}")
+
+    return messages
+
+
+def _merge_fx_writes(old: tuple, new: tuple) -> tuple:
+    """Merge two pending writes of `_apply_fx_settings` to the same FX, the new values winning."""
+    import numpy as np
+
+    (old_settings, old_physical), (new_settings, new_physical) = old, new
+    old_values, new_values = old_settings.to_vector(), new_settings.to_vector()
+    merged = type(new_settings).from_vector(np.where(np.isnan(new_values), old_values, new_values))
+    return merged, (old_physical - new_settings.set_fields()) | new_physical
+
 
 @mcp.tool()
-async def set_track_volume(track_name: str, current_volume: float, db_change: float) -> str:
+@instrumented
+async def set_track_volume(track_name: str, db_change: float, current_volume: Optional[float] = None) -> str:
     """
     Adjust the track's volume by a given amount in decibels (dB).
 
@@ -31,28 +359,27 @@ async def set_track_volume(track_name: str, current_volume: float, db_change: fl
 
     Args:
         track_name (str): Name of the track to modify.
-        current_volume (float): Current track volume in linear scale (e.g., 1.0 = 0 dB).
         db_change (float): Desired volume change in decibels. 
                            Positive values increase the volume, negative reduce it.
+        current_volume (float, optional): Current track volume in linear scale (e.g., 1.0 = 0 dB).
+                           Read from the project when omitted.
 
     Returns:
         str: A message summarizing the volume adjustment in dB.
     """
-    import math
-
-    multiplier = math.pow(10, db_change / 20)
-    new_volume = current_volume * multiplier
-
-    # Clamp between 0.0 and 4.0 to prevent clipping
-    new_volume = min(max(new_volume, 0.0), 4.0)
-
-    track = project._get_track_by_name(track_name)
-    track.set_info_value("D_VOL", new_volume)
+    await _write(
+        functools.partial(_write_relative, track_name, "D_VOL", _compute_volume),
+        (current_volume, db_change),
+        key=(track_name, "D_VOL"),
+        merge=_merge_relative,
+        tracks={track_name},
+    )
     return f"Volume changed by {db_change:+.2f} dB"
 
 
 @mcp.tool()
-async def set_track_pan(track_name: str, current_pan: float, pan_change: float) -> str:
+@instrumented
+async def set_track_pan(track_name: str, pan_change: float, current_pan: Optional[float] = None) -> str:
     """
     Adjusts the stereo pan of a specific track in the project.
 
@@ -69,28 +396,35 @@ async def set_track_pan(track_name: str, current_pan: float, pan_change: float)
 
     Args:
         track_name (str): The name of the track to update.
-        current_pan (float): The current pan value of the track (between -1.0 and 1.0).
         pan_change (float): The desired change to apply to the pan value 
                             (positive for right, negative for left).
+        current_pan (float, optional): The current pan value of the track (between -1.0 and 1.0).
+                            Read from the project when omitted.
 
     Returns:
         str: A message summarizing the pan adjustment in percentage terms.
     """
-
-    # Clamp the new pan value to stay within valid range
-    new_pan = max(-1.0, min(1.0, current_pan + pan_change))
-
-    track = project._get_track_by_name(track_name)
-    track.set_info_value("D_PAN", new_pan)
+    new_pan = await _write(
+        functools.partial(_write_relative, track_name, "D_PAN", _compute_pan),
+        (current_pan, pan_change),
+        key=(track_name, "D_PAN"),
+        merge=_merge_relative,
+        tracks={track_name},
+    )
 
     return f"Pan adjusted by {pan_change * 100:+.2f}%. New pan: {new_pan:.2f}"
 
 
 @mcp.tool()
-async def set_track_FX(track_name: str, new_settings: EQSettings | CompressorSettings | ReverbSettings | DelaySettings  , fx_name: str) -> str :
+@instrumented
+async def set_track_FX(track_name: str, new_settings: EQSettings | CompressorSettings | ReverbSettings | DelaySettings  , fx_name: str, units: Literal["physical", "normalized"] = "physical") -> str :
     """
     Set parameters of a specific audio FX on a given track. If the FX is not already present on the track, it will be added.
 
+    With `units="physical"` (the default), frequencies are given in Hz, gains and thresholds
+    in dB, times in ms and the compression ratio as N for N:1. Bandwidth, wet, dry, bypass
+    and the other parameters are normalized between 0.0 and 1.0.
+
     The `new_settings` argument must correspond to the type of FX specified by `fx_name`:
 
     - For `fx_name="ReaEQ"`: use an `EQSettings` object with fields like:
@@ -118,86 +452,443 @@ async def set_track_FX(track_name: str, new_settings: EQSettings | CompressorSet
         track_name (str): Name of the track to modify.
         new_settings (EQSettings | CompressorSettings): The settings to apply, depending on the FX type.
         fx_name (str): The name of the effect plugin (e.g., "ReaEQ", "ReaComp", "ReaVerb").
+        units (str): "physical" or "normalized", the units of the values in `new_settings`.
 
     Returns:
         str: A summary of the parameters that were updated, or an error message if something went wrong.
     """
   
-    track = project._get_track_by_name(track_name)
-    messages = []
-    fx_found = False
-    fx = None
-    
-    
-    for fx_candidate in track.fxs:
-        if fx_name in fx_candidate.name:
-            fx = fx_candidate
-            fx_found = True
-            break
-
-    if not fx_found:
-        
-        fx = track.add_fx(fx_name)
-        messages.append(f"FX '{fx_name}' added to track '{track.name}'")
+    # The settings model pydantic picked from the union may be another plugin's with the
+    # same field names, the FX name decides
+    fx_type = fx_settings_type(fx_name)
+    if fx_type is None:
+        raise ValueError(f"Unsupported FX '{fx_name}', expected one of {', '.join(FX_SETTINGS)}")
+    settings = FX_SETTINGS[fx_type].from_fields({name: getattr(new_settings, name) for name in new_settings.set_fields()})
+    physical = frozenset()
+    if units == "physical":
+        physical = settings.set_fields()
+        settings = normalize_settings(fx_type, [settings])[0]
+    messages = await _write(
+        functools.partial(_apply_fx_settings, track_name, fx_name),
+        (settings, physical),
+        key=(track_name, fx_name),
+        merge=_merge_fx_writes,
+        tracks={track_name},
+    )
 
-        
-    mapping_params_indx = {param.name: idx for idx, param in enumerate(fx.params)}
-    
-    
-    new_settings_dict = new_settings._to_dict()
-
-    for name, val in new_settings_dict.items():
-        if name in mapping_params_indx:
-            idx = mapping_params_indx[name]
-            fx.params[idx] = val
-            messages.append(f"{name} is set to {val:.4f}")
+    return '/n'.join(messages)
+
+
+def _plan_fx_params(operations: list[MixOperation]) -> dict:
+    """
+    Build the settings of the FX operations of a plan, converted in one vectorized pass
+    per FX type for the settings given in physical units.
+
+    Returns:
+        dict: Operation index -> write of `_apply_fx_settings`, or the error raised by
+        invalid settings.
+    """
+    fx_writes = {}
+    physical = {}
+    for i, op in enumerate(operations):
+        if op.action != "fx" or op.fx_name is None:
+            continue
+        fx_type = fx_settings_type(op.fx_name)
+        try:
+            if fx_type is None:
+                raise ValueError(f"Unsupported FX '{op.fx_name}', expected one of {', '.join(FX_SETTINGS)}")
+            settings = FX_SETTINGS[fx_type].from_fields(op.settings or {})
+        except (TypeError, ValueError) as e:
+            fx_writes[i] = e
+            continue
+        if op.units == "physical":
+            physical.setdefault(fx_type, []).append((i, settings))
         else:
-            messages.append(f"Parameter '{name}' not found in FX '{fx.name}'")
+            fx_writes[i] = (settings, frozenset())
+
+    for fx_type, planned in physical.items():
+        normalized = normalize_settings(fx_type, [settings for _, settings in planned])
+        for (i, settings), values in zip(planned, normalized):
+            fx_writes[i] = (values, settings.set_fields())
+    return fx_writes
+
+
+@mcp.tool()
+@instrumented
+async def apply_mix_plan(operations: list[MixOperation]) -> str:
+    """
+    Apply many volume, pan and FX changes across tracks in a single REAPER transaction.
+
+    Prefer this tool over repeated `set_track_volume` / `set_track_pan` / `set_track_FX`
+    calls whenever a request touches several tracks or FX (e.g. "EQ every track").
+    All operations are applied inside one REAPER undo block.
+
+    Each operation has a `track_name` and an `action`:
+    - `action="volume"`: `db_change` in dB, relative to the current volume.
+    - `action="pan"`: `pan_change` between -2.0 and 2.0, relative to the current pan.
+    - `action="fx"`: `fx_name` (e.g. "ReaEQ", "ReaComp", "ReaVerbate", "ReaDelay") and
+      `settings`, a mapping of field names of the matching settings model
+      (`EQSettings`, `CompressorSettings`, `ReverbSettings`, `DelaySettings`) to values,
+      in the physical units described in `set_track_FX` unless `units="normalized"`.
+      The FX is added to the track if it is not already present.
+
+    Args:
+        operations (list[MixOperation]): The operations to apply, in order.
+
+    Returns:
+        str: One line per operation, `[index] ok: ...` or `[index] error: ...`.
+    """
+    fx_params = _plan_fx_params(operations)
+    return await _write(functools.partial(_apply_mix_plan, fx_params=fx_params), operations)
+
+
+def _apply_mix_plan(operations: list[MixOperation], fx_params: dict) -> str:
+    """Apply a mix plan on the writer thread, see `apply_mix_plan`."""
+    state_cache = get_state_cache()
+    project_index = get_project_index()
+    snapshot = state_cache.get_project()
+    volumes = {name: track.attributes["D_VOL"] for name, track in snapshot.tracks.items()}
+    pans = {name: track.attributes["D_PAN"] for name, track in snapshot.tracks.items()}
+
+    results = []
+    touched = set()
+    with daw.inside_reaper(), daw.undo_block("Apply mix plan"):
+        for i, op in enumerate(operations):
+            try:
+                track = project_index.get_track(op.track_name)
+                if op.action == "volume":
+                    volumes[op.track_name] = _compute_volume(volumes[op.track_name], op.db_change or 0.0)
+                    track.set_info_value("D_VOL", volumes[op.track_name])
+                    daw.record_writes()
+                    message = f"volume changed by {op.db_change or 0.0:+.2f} dB"
+                elif op.action == "pan":
+                    pans[op.track_name] = _compute_pan(pans[op.track_name], op.pan_change or 0.0)
+                    track.set_info_value("D_PAN", pans[op.track_name])
+                    daw.record_writes()
+                    message = f"pan set to {pans[op.track_name]:.2f}"
+                elif op.action == "fx":
+                    if op.fx_name is None:
+                        raise ValueError("'fx_name' is required for action 'fx'")
+                    write = fx_params[i]
+                    if isinstance(write, Exception):
+                        raise write
+                    message = ", ".join(_apply_fx_settings(op.track_name, op.fx_name, write))
+                else:
+                    raise ValueError(f"Unknown action '{op.action}'")
+                touched.add(op.track_name)
+                results.append(f"[{i}] ok: {op.track_name} {message}")
+            except Exception as e:
+                results.append(f"[{i}] error: {op.track_name} {e}")
+
+    state_cache.invalidate_tracks(touched, daw.take_writes())
+
+    return "\n".join(results)
 
-    return '/n'.join(messages)
 
 @mcp.tool()
-async def get_track_info(track_name: str):
+@instrumented
+async def list_tracks() -> str:
+    """
+    List the tracks of the project with their pan and FX names, as compact JSON.
+
+    Much cheaper than `get_project_info`: use it when only track names are needed.
+
+    Returns:
+        str: JSON mapping each track name to `p` (pan) and `fx` (list of FX names).
+    """
+    snapshot = await _read(lambda: get_state_cache().get_project())
+    return encoding.dumps(
+        {name: {"p": round(track.attributes["D_PAN"], 3), "fx": [fx.name for fx in track.fxs]}
+         for name, track in snapshot.tracks.items()}
+    )
+
+
+@mcp.tool()
+@instrumented
+async def get_track_info(track_name: str, params: Optional[list[str]] = None, units: Literal["physical", "normalized"] = "physical"):
         """
         Retrieve volume, pan, width and FX parameters for the current track.
 
+        The result is compact JSON: `v` is the linear volume (1.0 = 0 dB), `p` the pan,
+        `w` the width and `fx` maps each FX name to its parameters. Only parameters that
+        differ from the plugin defaults are listed, plus the ones named in `params`.
+        With `units="physical"`, parameters with a unit are reported in it (the same units
+        `set_track_FX` takes) and `units` maps their names to that unit; a parameter whose
+        conversion disagrees with the value REAPER shows is given as REAPER formats it.
+
+        Args:
+            track_name (str): Name of the track.
+            params (list[str]): FX parameter names to always include, ["*"] for all of them.
+            units (str): "physical" or "normalized".
+
         Returns:
-            dict: Dictionary containing track-level attributes and FX parameters.
+            str: JSON with track-level attributes and FX parameters.
         """
-        track = project._get_track_by_name(track_name)
-        infos = {attr: track.get_info_value(attr) for attr in ATTR_TRACK}
-
-        if track.fxs:
-            fxs_dict = {}  
-            for fx in track.fxs:
-            
-                fxs_dict[fx.name] = {param.name : f"{param:.4f} | "
-                    f"formatted: {param.formatted} | "
-                    f"normalized: {param.normalized:.2f} | "
-                    f"range: {param.range}" for param in fx.params}
-                
-            infos.update(fxs_dict)
+        track, default_values = await _read(
+            lambda: (get_state_cache().get_track(track_name), get_project_index().default_values)
+        )
+        requested = set(params) if params else None
 
-        return f"infos on  track {track.name}: {infos}"
+        return encoding.dumps({track.name: encoding.encode_track(
+            track, default_values, requested, physical=units == "physical"
+        )})
 
 
 
 @mcp.tool()
-async def get_project_info():
+@instrumented
+async def get_project_info(token_budget: int = encoding.DEFAULT_TOKEN_BUDGET, diff: bool = False):
         """
-        Retrieve volume, pan, width and FX parameters for the current track.
+        Retrieve volume, pan, width and FX parameters for every track of the project.
+
+        The result is compact JSON: `t` maps each track name to `v` (linear volume, 1.0 = 0 dB),
+        `p` (pan), `w` (width) and `fx` (FX name -> parameters that differ from the plugin
+        defaults), in the units of `get_track_info` (`units` lists them per track). To fit
+        in `token_budget`, FX may be listed without parameters (`"trunc": "params"`, use
+        `get_track_info`) and tracks may be left out (`more`).
+
+        Args:
+            token_budget (int): Maximum size of the result, in tokens.
+            diff (bool): Only return what changed since the previous call of this tool by
+                the same client: tracks gone since then are listed in `removed`, FX in the
+                `fx_removed` of their track.
 
         Returns:
-            dict: Dictionary containing track-level attributes and FX parameters.
+            str: JSON with track-level attributes and FX parameters.
         """
-    
-             
-        infos = {track.name: await get_track_info(track.name) for track in project.tracks}
+        snapshot, default_values = await _read(
+            lambda: (get_state_cache().get_project(), get_project_index().default_values)
+        )
+        session = _session()
+        previous = _last_project_snapshots.get(session) if diff else None
+        _last_project_snapshots[session] = snapshot
+
+        return encoding.encode_project(snapshot, token_budget, default_values, previous, physical=True)
+
+
+@mcp.tool()
+@instrumented
+async def get_project_changes(since_version: Optional[int] = None, token_budget: int = encoding.DEFAULT_TOKEN_BUDGET) -> str:
+    """
+    Report what changed in the project since an earlier version, including edits made by
+    hand in REAPER. Much cheaper than calling `get_project_info` again.
+
+    The result is compact JSON with the current `version`, to pass as `since_version` on
+    the next call, and the same keys as `get_project_info`: `t` maps each changed track to
+    its changed `v` / `p` / `w` and `fx` (FX name -> changed parameters), plus `fx_added` /
+    `fx_removed`. `added` holds new tracks, `removed` and `renamed` (old -> new name) list
+    the others. Without `since_version`, or when it is too old, the full state is returned
+    with `"full": true`.
+
+    Args:
+        since_version (int): `version` of an earlier result.
+        token_budget (int): Maximum size of the result, in tokens.
+
+    Returns:
+        str: JSON with the version and the changes.
+    """
+    snapshot, default_values = await _read(
+        lambda: (get_state_cache().get_project(), get_project_index().default_values)
+    )
+    version = _change_feed.observe(snapshot)
+    previous = _change_feed.get(since_version) if since_version is not None else None
+    if previous is not None:
+        text = encoding.dumps(
+            {"version": version, "since": since_version, **encode_changes(previous, snapshot, default_values)}
+        )
+        if encoding.estimate_tokens(text) <= token_budget:
+            return text
+    return encoding.encode_project(
+        snapshot, token_budget, default_values, header={"version": version, "full": True}, physical=True
+    )
+
+
+def _get_mix_snapshot(name: str):
+    """A saved mix snapshot, kept in memory once loaded; "current" is the live project state."""
+    from mix_snapshot import MixSnapshot
+
+    if name == "current":
+        return MixSnapshot.from_project(name, get_state_cache().get_project())
+    if name not in _mix_snapshots:
+        _mix_snapshots[name] = MixSnapshot.load(MIX_SNAPSHOT_DIR, name)
+    return _mix_snapshots[name]
+
 
+@mcp.tool()
+@instrumented
+async def save_mix_snapshot(name: str) -> str:
+    """
+    Save the volume, pan, width and every FX parameter of all tracks under a name, to
+    compare with or come back to later (A/B).
+
+    Args:
+        name (str): Name of the snapshot, e.g. "A" or "before-eq". Overwrites a snapshot
+            with the same name.
+
+    Returns:
+        str: A summary of what was saved.
+    """
+    from mix_snapshot import MixSnapshot
+
+    if name == "current":
+        raise ValueError("'current' is reserved for the live project state")
+    snapshot = await _read(lambda: MixSnapshot.from_project(name, get_state_cache().get_project()))
+    path = await asyncio.to_thread(snapshot.save, MIX_SNAPSHOT_DIR)
+    _mix_snapshots[name] = snapshot
+    return (
+        f"Mix snapshot '{name}' saved: {len(snapshot.tracks)} tracks, {len(snapshot.fx_names)} FX, "
+        f"{snapshot.n_params} parameters ({os.path.getsize(path) / 1024:.1f} KB)"
+    )
 
-        return f"informations on project {project.name}: {infos}"
 
 @mcp.tool()
+@instrumented
+async def recall_mix_snapshot(name: str) -> str:
+    """
+    Bring the project back to a saved mix snapshot.
+
+    Only the values that differ from the current state are written, in one batch and one
+    REAPER undo point. Tracks and FX that are no longer in the project are skipped, FX
+    added since the snapshot are left as they are.
+
+    Args:
+        name (str): Name of the snapshot.
+
+    Returns:
+        str: How many values were written, and what could not be recalled.
+    """
+    target = await _read(_get_mix_snapshot, name)
+    return await _write(_recall_mix_snapshot, target)
+
+
+def _recall_mix_snapshot(target) -> str:
+    """Write what differs from a mix snapshot back to the project, on the writer thread."""
+    from mix_snapshot import compare
+
+    name = target.name
+    state_cache = get_state_cache()
+    project_index = get_project_index()
+    changes = compare(_get_mix_snapshot("current"), target)
+
+    touched = set()
+    if len(changes):
+        fxs = {}
+        with daw.inside_reaper(), daw.undo_block(f"Recall mix snapshot {name}"):
+            for track_name, index, value in zip(
+                changes.attr_tracks, changes.attr_index.tolist(), changes.attr_b.tolist()
+            ):
+                project_index.get_track(track_name).set_info_value(ATTR_TRACK[index], value)
+                touched.add(track_name)
+            for slot, index, value in zip(changes.param_slots, changes.param_index.tolist(), changes.param_b.tolist()):
+                if slot not in fxs:
+                    track_name, fx_name, occurrence = slot
+                    fxs[slot] = [fx for other, fx in project_index.get_fxs(track_name) if other == fx_name][occurrence]
+                fxs[slot].params[index] = value
+                touched.add(slot[0])
+            daw.record_writes(len(changes))
+        state_cache.invalidate_tracks(touched, daw.take_writes())
+
+    message = (
+        f"Mix snapshot '{name}' recalled: {len(changes.attr_tracks)} track settings and "
+        f"{len(changes.param_slots)} FX parameters written on {len(touched)} tracks"
+    )
+    if changes.only_b:
+        message += f". Not in the project anymore: {', '.join(changes.only_b)}"
+    return message
+
+
+@mcp.tool()
+@instrumented
+async def diff_mix_snapshots(a: str, b: str = "current") -> str:
+    """
+    List what differs between two mix snapshots, or between a snapshot and the current mix.
+
+    The result is compact JSON: `changes` holds one `[track, key, value in a, value in b]`
+    row per difference, the key being `v` (linear volume), `p` (pan), `w` (width) or
+    `FX name/parameter name` (normalized value). `only_a` / `only_b` list the tracks and
+    FX present in only one of them.
+
+    Args:
+        a (str): Name of the first snapshot, or "current".
+        b (str): Name of the second snapshot, or "current" (default).
+
+    Returns:
+        str: JSON listing of the differences.
+    """
+    from mix_snapshot import compare, encode_changes
+
+    snapshot_a, snapshot_b = await _read(lambda: (_get_mix_snapshot(a), _get_mix_snapshot(b)))
+    changes = compare(snapshot_a, snapshot_b)
+    return encoding.dumps({"a": a, "b": b, **encode_changes(snapshot_a, changes)})
+
+
+@mcp.tool()
+@instrumented
+async def get_server_metrics(recent_spans: int = 20) -> str:
+    """
+    Report per-tool statistics of this server: call count, errors, latency histogram,
+    REAPER round trips, result size and cache hit rate, plus the most recent calls
+    with the trace id of the request that made them.
+
+    Args:
+        recent_spans (int): Number of most recent calls to include.
+
+    Returns:
+        str: The statistics as JSON.
+    """
+    report = metrics.snapshot(recent_spans)
+    if _state_cache is not None:
+        report["state_cache"] = {"hits": _state_cache.hits, "misses": _state_cache.misses}
+    if _knowledge_base is not None:
+        report["knowledge_base"] = _knowledge_base.stats()
+    if _track_analyzer is not None:
+        report["track_analysis"] = _track_analyzer.stats()
+    report["write_queue"] = _write_queue.stats()
+    return json.dumps(report)
+
+
+def _find_stems(track_names: list[str]) -> dict[str, str]:
+    """Track name -> rendered stem in STEMS_DIR, matched on the file name without case."""
+    from features import list_stems
+
+    stems = {os.path.splitext(os.path.basename(path))[0].lower(): path for path in list_stems(STEMS_DIR)}
+    return {name: stems[name.lower()] for name in track_names if name.lower() in stems}
+
+
+@mcp.tool()
+@instrumented
+async def analyze_tracks(track_names: Optional[list[str]] = None) -> str:
+    """
+    Describe how tracks sound, from their rendered stems: loudness, harshness, compression,
+    clarity, bass, muddiness, noise_distortion, stereo_width, brightness, warmth, presence,
+    reverb_amount, balance and masking, each on a 0-10 scale.
+
+    Use it to decide what to fix (e.g. high muddiness -> cut around 250-500 Hz, high
+    masking -> carve space with EQ). Stems must be rendered again to reflect new settings.
+
+    Args:
+        track_names (list[str]): Tracks to analyze, all tracks of the project if omitted.
+
+    Returns:
+        str: JSON mapping each track name to its descriptors; tracks without a rendered
+        stem are listed in `no_stem`.
+    """
+    if not STEMS_DIR:
+        raise RuntimeError("Track analysis needs STEMS_DIR, the directory of the rendered stems")
+    if track_names is None:
+        track_names = list((await _read(lambda: get_state_cache().get_project())).tracks)
+
+    stems = _find_stems(track_names)
+    descriptors = await asyncio.to_thread(lambda: get_track_analyzer().analyze(stems)) if stems else {}
+    result = {"t": descriptors}
+    no_stem = [name for name in track_names if name not in stems]
+    if no_stem:
+        result["no_stem"] = no_stem
+    return encoding.dumps(result)
+
+
+@mcp.tool()
+@instrumented
 async def get_information_query_chroma( query:str):
     """
     Retrieve best practices for mixing (EQ, compression, reverb, etc.) from a custom knowledge base.
@@ -218,14 +909,17 @@ async def get_information_query_chroma( query:str):
         "How to use compression on drums?"
         "Tips for adding reverb to a lead synth"
     """
-   
-    vector_store = Chroma(persist_directory=DB_PATH, embedding_function=embedding)
+    # Embedding the query and searching the store are blocking, keep them off the event loop
+    results = await asyncio.to_thread(lambda: get_knowledge_base().search(query, k=3))
+
+    return "Advices \n".join(results)
 
-    results = vector_store.similarity_search(query, k=3)
 
-    return "Advices \n".join([doc.page_content for  doc in results])
 
+logger.info("startup: imports done in %.0f ms", (time.perf_counter() - _T0) * 1000)
 
 
 if __name__ == "__main__":
-    mcp.run()
\ No newline at end of file
+    # stdout carries the MCP protocol, keep logs on stderr
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(name)s %(message)s")
+    mcp.run(transport=MCP_TRANSPORT)
\ No newline at end of file
@@ -0,0 +1,232 @@
+from dataclasses import dataclass, field
+from typing import Optional
+
+import daw
+from metrics import record_cache
+
+ATTR_TRACK = ["D_VOL", "D_PAN", "D_WIDTH"]
+
+
+@dataclass
+class ParamSnapshot:
+    name: str
+    value: float
+    formatted: str
+    normalized: float
+    range: tuple
+
+
+@dataclass
+class FXSnapshot:
+    name: str
+    index: int
+    params: list[ParamSnapshot] = field(default_factory=list)
+
+
+@dataclass
+class TrackSnapshot:
+    id: str
+    name: str
+    index: int
+    attributes: dict[str, float] = field(default_factory=dict)
+    fxs: list[FXSnapshot] = field(default_factory=list)
+
+
+@dataclass
+class ProjectSnapshot:
+    name: str
+    tracks: dict[str, TrackSnapshot] = field(default_factory=dict)
+
+    def get_track(self, track_name: str) -> TrackSnapshot:
+        if track_name not in self.tracks:
+            raise KeyError(f"Track '{track_name}' not found in project '{self.name}'")
+        return self.tracks[track_name]
+
+
+def _snapshot_track(track, index: int) -> TrackSnapshot:
+    fxs = []
+    for fx_index, fx in enumerate(track.fxs):
+        params = [
+            ParamSnapshot(
+                name=param.name,
+                value=float(param),
+                formatted=param.formatted,
+                normalized=param.normalized,
+                range=tuple(param.range),
+            )
+            for param in fx.params
+        ]
+        fxs.append(FXSnapshot(name=fx.name, index=fx_index, params=params))
+
+    return TrackSnapshot(
+        id=track.id,
+        name=track.name,
+        index=index,
+        attributes={attr: track.get_info_value(attr) for attr in ATTR_TRACK},
+        fxs=fxs,
+    )
+
+
+def take_project_snapshot(project) -> ProjectSnapshot:
+    """
+    Collect track attributes and every FX parameter of the project in one pass.
+
+    The walk runs inside REAPER: when called from the distant API, reapy holds the
+    connection for the whole function instead of paying one round trip per attribute.
+
+    Args:
+        project: The reapy project to read.
+
+    Returns:
+        ProjectSnapshot: Plain in-memory copy of the tracks, FX and parameters.
+    """
+    with daw.inside_reaper():
+        snapshot = ProjectSnapshot(name=project.name)
+        for index, track in enumerate(project.tracks):
+            track_snapshot = _snapshot_track(track, index)
+            snapshot.tracks[track_snapshot.name] = track_snapshot
+    return snapshot
+
+
+def take_track_snapshot(project, track_name: str) -> TrackSnapshot:
+    """
+    Collect the attributes and FX parameters of a single track in one pass.
+
+    Args:
+        project: The reapy project to read.
+        track_name (str): Name of the track to read.
+
+    Returns:
+        TrackSnapshot: Plain in-memory copy of the track.
+    """
+    with daw.inside_reaper():
+        track = project._get_track_by_name(track_name)
+        return _snapshot_track(track, track.index)
+
+
+class ProjectStateCache:
+    """
+    Server-side cache of track and FX state.
+
+    Tracks are invalidated one by one when our own write tools touch them, and the whole
+    cache is dropped when REAPER's project state change counter moves (edits made by hand,
+    undo, tracks added from the UI, ...). Reads of unchanged tracks cost no REAPER call
+    beyond the counter check.
+    """
+
+    def __init__(self, project):
+        self.project = project
+        self.version = None
+        self.generation = 0
+        self.hits = 0
+        self.misses = 0
+        self._name = None
+        self._tracks: dict[str, TrackSnapshot] = {}
+        self._complete = False
+        self._stale: set[str] = set()
+
+    def _state_change_count(self) -> int:
+        return daw.state_change_count(self.project)
+
+    def check_version(self) -> bool:
+        """
+        Drop the cache if REAPER's project state changed outside of our own writes.
+
+        Returns:
+            bool: True if the project changed since the last check.
+        """
+        version = self._state_change_count()
+        if version == self.version:
+            return False
+        self.clear()
+        self.version = version
+        self.generation += 1
+        return True
+
+    def clear(self):
+        """Drop every cached track."""
+        self._tracks = {}
+        self._complete = False
+        self._stale = set()
+
+    def invalidate_track(self, track_name: str):
+        """
+        Mark a track as modified by one of our own writes.
+
+        The state change counter is re-read so that our own edit does not also
+        drop the rest of the cache on the next read.
+
+        Args:
+            track_name (str): Name of the track that was written.
+        """
+        self.invalidate_tracks([track_name])
+
+    def invalidate_tracks(self, track_names, writes: Optional[int] = None):
+        """
+        Mark several tracks as modified by our own writes with a single counter read.
+
+        When `writes` is given and the counter moved by more than that, the project was
+        also edited by someone else in the meantime and the whole cache is dropped.
+
+        Args:
+            track_names: Names of the tracks that were written.
+            writes (int): Number of edits made since the counter was last read.
+        """
+        version = self._state_change_count()
+        if writes is not None and self.version is not None and version - self.version > writes:
+            self.clear()
+            self.generation += 1
+        else:
+            self._stale.update(track_names)
+        self.version = version
+
+    def get_track(self, track_name: str) -> TrackSnapshot:
+        """
+        Return the cached state of a track, reading it from REAPER only if needed.
+
+        Args:
+            track_name (str): Name of the track to read.
+
+        Returns:
+            TrackSnapshot: Current state of the track.
+        """
+        self.check_version()
+        if track_name in self._tracks and track_name not in self._stale:
+            self.hits += 1
+            record_cache(True)
+            return self._tracks[track_name]
+
+        self.misses += 1
+        record_cache(False)
+        track = take_track_snapshot(self.project, track_name)
+        self._tracks[track.name] = track
+        self._stale.discard(track_name)
+        return track
+
+    def get_project(self) -> ProjectSnapshot:
+        """
+        Return the cached state of the whole project, refreshing only stale tracks.
+
+        Returns:
+            ProjectSnapshot: Current state of every track of the project.
+        """
+        self.check_version()
+        if not self._complete:
+            self.misses += 1
+            record_cache(False)
+            snapshot = take_project_snapshot(self.project)
+            self._tracks = snapshot.tracks
+            self._complete = True
+            self._stale = set()
+            self._name = snapshot.name
+        elif self._stale:
+            for track_name in self._stale:
+                self.misses += 1
+                record_cache(False)
+                self._tracks[track_name] = take_track_snapshot(self.project, track_name)
+            self._stale = set()
+        else:
+            self.hits += 1
+            record_cache(True)
+
+        return ProjectSnapshot(name=self._name, tracks=dict(self._tracks))
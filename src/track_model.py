@@ -0,0 +1,121 @@
+import threading
+from typing import Optional
+
+import numpy as np
+import torch
+import torch.nn as nn
+
+from features import NB_FEATURES, extract_many, feature_matrix, stem_hash
+from knowledge import LRUCache
+
+# Outputs of the model, on a 0-10 scale
+DESCRIPTORS = (
+    "loudness", "harshness", "compression", "clarity", "bass", "muddiness",
+    "noise_distortion", "stereo_width", "brightness", "warmth",
+    "presence", "reverb_amount", "balance", "masking",
+)
+
+
+class Net(nn.Module):
+    def __init__(self, NB_FEATURES: int = NB_FEATURES):
+        super().__init__()
+        self.layer1 = nn.Linear(NB_FEATURES, 128)
+        self.layer2 = nn.Linear(128, 256)
+        self.layer3 = nn.Linear(256, 128)
+        self.output = nn.Linear(128, len(DESCRIPTORS))
+
+        self.act = nn.GELU()
+        self.dropout = nn.Dropout(0.1)
+
+    def forward(self, x):
+        x = self.act(self.layer1(x))
+        x = self.dropout(x)
+        x = self.act(self.layer2(x))
+        x = self.dropout(x)
+        x = self.act(self.layer3(x))
+        x = self.dropout(x)
+        last_hidden_states = x
+        out = self.output(x)
+
+        return out, last_hidden_states
+
+
+def load_stats(stats_path: str) -> tuple[torch.Tensor, torch.Tensor]:
+    """
+    Args:
+        stats_path (str): File saved by `torch.save` with the `global_mean` and
+            `global_std` tensors of the training features.
+
+    Returns:
+        tuple: (global_mean, global_std).
+    """
+    stats = torch.load(stats_path, map_location="cpu", weights_only=True)
+    return stats["global_mean"].float(), stats["global_std"].float()
+
+
+class TrackAnalyzer:
+    """
+    The track analysis model and its normalization stats, loaded once, with the predictions
+    cached by stem content hash.
+    """
+
+    def __init__(self, model_path: str, stats_path: str, cache_size: int = 1024, device: Optional[str] = None):
+        self.device = torch.device(device or ("cuda" if torch.cuda.is_available() else "cpu"))
+        self.net = Net()
+        self.net.load_state_dict(torch.load(model_path, map_location=self.device, weights_only=True))
+        self.net.to(self.device).eval()
+        mean, std = load_stats(stats_path)
+        self.mean = mean.to(self.device)
+        self.std = std.to(self.device)
+        self._cache = LRUCache(cache_size)
+        self._lock = threading.Lock()
+
+    def predict(self, features: np.ndarray) -> np.ndarray:
+        """
+        Score many stems in one forward pass.
+
+        Args:
+            features (np.ndarray): Raw features, shape (stems, NB_FEATURES).
+
+        Returns:
+            np.ndarray: Descriptors on a 0-10 scale, shape (stems, len(DESCRIPTORS)).
+        """
+        x = torch.as_tensor(features, dtype=torch.float32, device=self.device)
+        x = (x - self.mean) / (self.std + 1e-8)
+        with torch.no_grad():
+            out, _ = self.net(x)
+        # The regression head is unbounded, keep the scores on the scale of the labels
+        return out.clamp(0.0, 10.0).cpu().numpy()
+
+    def analyze(self, stems: dict[str, str]) -> dict[str, dict[str, float]]:
+        """
+        Describe the stems of many tracks, extracting features and running the model only
+        for stems whose content is not in the cache.
+
+        Args:
+            stems (dict[str, str]): Track name -> path of its rendered stem.
+
+        Returns:
+            dict[str, dict[str, float]]: Track name -> descriptor -> value (0-10).
+        """
+        hashes = {track: stem_hash(path) for track, path in stems.items()}
+        predictions = {}
+        with self._lock:
+            for track, content_hash in hashes.items():
+                cached = self._cache.get(content_hash)
+                if cached is not None:
+                    predictions[track] = cached
+
+        missing = {track: stems[track] for track in stems if track not in predictions}
+        if missing:
+            features = extract_many(list(dict.fromkeys(missing.values())))
+            scores = self.predict(feature_matrix({track: features[path] for track, path in missing.items()}))
+            with self._lock:
+                for track, row in zip(missing, scores):
+                    predictions[track] = {name: round(float(value), 1) for name, value in zip(DESCRIPTORS, row)}
+                    self._cache.put(hashes[track], predictions[track])
+
+        return {track: predictions[track] for track in stems}
+
+    def stats(self) -> dict:
+        return {"cached": len(self._cache), "hits": self._cache.hits, "misses": self._cache.misses}
@@ -0,0 +1,200 @@
+"""
+Train the track analysis model on a feature store (see feature_store.py).
+
+Batches are gathered from the memory-mapped store, so memory use does not grow with the
+dataset, and the model is only written when the validation loss improves.
+
+Usage:
+    python train.py STORE [--epochs 150] [--out best_model.pth] [--stats-out stats.pt]
+"""
+
+import argparse
+import math
+import os
+import time
+
+import numpy as np
+import torch
+import torch.nn as nn
+
+from feature_store import FeatureStore
+from track_model import DESCRIPTORS, Net
+
+# Rows read from the store at once when computing the normalization stats or evaluating
+CHUNK_SIZE = 65536
+
+
+def split_indices(n_samples: int, val_fraction: float, seed: int) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Deterministic train / validation split. The position of a sample only depends on the
+    seed, so samples already in the validation set stay there as the store grows.
+
+    Returns:
+        tuple: (train indices, validation indices), sorted.
+    """
+    rng = np.random.default_rng(seed)
+    # Draw from a fixed-size stream so the first samples keep their draw when more are added
+    draws = np.concatenate([rng.random(CHUNK_SIZE) for _ in range(math.ceil(n_samples / CHUNK_SIZE))])[:n_samples]
+    is_val = draws < val_fraction
+    return np.flatnonzero(~is_val), np.flatnonzero(is_val)
+
+
+def feature_stats(features: np.ndarray, indices: np.ndarray) -> tuple[torch.Tensor, torch.Tensor]:
+    """
+    Mean and standard deviation of the features over `indices`, read chunk by chunk.
+
+    Returns:
+        tuple: (global_mean, global_std), float32 tensors of shape (n_features,).
+    """
+    total = np.zeros(features.shape[1], dtype=np.float64)
+    total_sq = np.zeros(features.shape[1], dtype=np.float64)
+    for start in range(0, len(indices), CHUNK_SIZE):
+        chunk = features[indices[start:start + CHUNK_SIZE]].astype(np.float64)
+        total += chunk.sum(axis=0)
+        total_sq += np.square(chunk).sum(axis=0)
+    mean = total / len(indices)
+    std = np.sqrt(np.maximum(total_sq / len(indices) - np.square(mean), 0.0))
+    return torch.from_numpy(mean).float(), torch.from_numpy(std).float()
+
+
+def cosine_with_warmup(optimizer, warmup_steps: int, total_steps: int) -> torch.optim.lr_scheduler.LambdaLR:
+    """Linear warmup to the base learning rate, then cosine decay to 0."""
+
+    def factor(step: int) -> float:
+        if step < warmup_steps:
+            return step / max(1, warmup_steps)
+        progress = (step - warmup_steps) / max(1, total_steps - warmup_steps)
+        return max(0.0, 0.5 * (1.0 + math.cos(math.pi * progress)))
+
+    return torch.optim.lr_scheduler.LambdaLR(optimizer, factor)
+
+
+class Trainer:
+    def __init__(self, store: FeatureStore, batch_size: int, lr: float, val_fraction: float, seed: int, device: str):
+        if store.n_labels != len(DESCRIPTORS):
+            raise ValueError(f"The store has {store.n_labels} labels, the model predicts {len(DESCRIPTORS)}")
+        torch.manual_seed(seed)
+        self.device = torch.device(device)
+        self.features, self.labels = store.arrays()
+        self.train_idx, self.val_idx = split_indices(len(store), val_fraction, seed)
+        if not len(self.train_idx) or not len(self.val_idx):
+            raise ValueError(f"Not enough samples ({len(store)}) for a train / validation split")
+        self.mean, self.std = feature_stats(self.features, self.train_idx)
+        self._mean = self.mean.to(self.device)
+        self._scale = (self.std + 1e-8).to(self.device)
+        self.batch_size = batch_size
+        self.rng = np.random.default_rng(seed)
+
+        self.net = Net(store.n_features).to(self.device)
+        self.optim = torch.optim.AdamW(self.net.parameters(), lr=lr)
+        self.lossfn = nn.MSELoss()
+
+    def _batch(self, indices: np.ndarray) -> tuple[torch.Tensor, torch.Tensor]:
+        # Sorted indices turn the memmap gather into a forward scan of the file
+        indices = np.sort(indices)
+        x = torch.from_numpy(np.ascontiguousarray(self.features[indices])).to(self.device)
+        y = torch.from_numpy(np.ascontiguousarray(self.labels[indices])).to(self.device)
+        return (x - self._mean) / self._scale, y
+
+    def train_epoch(self, scheduler) -> float:
+        """
+        Returns:
+            float: Mean training loss of the epoch.
+        """
+        self.net.train()
+        order = self.rng.permutation(self.train_idx)
+        total = 0.0
+        for start in range(0, len(order), self.batch_size):
+            x, y = self._batch(order[start:start + self.batch_size])
+            self.optim.zero_grad(set_to_none=True)
+            out, _ = self.net(x)
+            loss = self.lossfn(out, y)
+            loss.backward()
+            self.optim.step()
+            scheduler.step()
+            total += loss.detach() * len(x)
+        return float(total) / len(order)
+
+    def evaluate(self) -> float:
+        """
+        Returns:
+            float: Mean validation loss, computed in large chunks without gradients.
+        """
+        self.net.eval()
+        total = 0.0
+        with torch.no_grad():
+            for start in range(0, len(self.val_idx), CHUNK_SIZE):
+                x, y = self._batch(self.val_idx[start:start + CHUNK_SIZE])
+                out, _ = self.net(x)
+                total += nn.functional.mse_loss(out, y, reduction="sum") / y.shape[1]
+        return float(total) / len(self.val_idx)
+
+    def steps_per_epoch(self) -> int:
+        return math.ceil(len(self.train_idx) / self.batch_size)
+
+
+def _save(obj, path: str):
+    with open(path + ".tmp", "wb") as f:
+        torch.save(obj, f)
+    os.replace(path + ".tmp", path)
+
+
+def train(store: FeatureStore, epochs: int, batch_size: int, lr: float, warmup_epochs: int, val_fraction: float,
+          seed: int, out: str, stats_out: str, device: str) -> float:
+    """
+    Train the model, writing it to `out` every time the validation loss improves and the
+    normalization stats of the training set to `stats_out`.
+
+    Returns:
+        float: Best validation loss.
+    """
+    trainer = Trainer(store, batch_size, lr, val_fraction, seed, device)
+    _save({"global_mean": trainer.mean, "global_std": trainer.std}, stats_out)
+    steps = trainer.steps_per_epoch()
+    scheduler = cosine_with_warmup(trainer.optim, warmup_epochs * steps, epochs * steps)
+    print(f"📦 {len(trainer.train_idx)} training / {len(trainer.val_idx)} validation samples, {steps} steps per epoch")
+
+    best_loss = float("inf")
+    for epoch in range(epochs):
+        start = time.perf_counter()
+        train_loss = trainer.train_epoch(scheduler)
+        train_time = time.perf_counter() - start
+        val_loss = trainer.evaluate()
+        epoch_time = time.perf_counter() - start
+
+        saved = ""
+        if val_loss < best_loss:
+            best_loss = val_loss
+            _save(trainer.net.state_dict(), out)
+            saved = " 💾"
+        print(
+            f"Epoch {epoch + 1}/{epochs}: train {train_loss:.4f}, val {val_loss:.4f}, "
+            f"{epoch_time:.2f}s, {len(trainer.train_idx) / train_time:,.0f} samples/s{saved}"
+        )
+
+    print(f"✅ Best validation loss {best_loss:.4f}, model saved to {out}")
+    return best_loss
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("store", help="Directory of the feature store")
+    parser.add_argument("--epochs", type=int, default=150)
+    parser.add_argument("--batch-size", type=int, default=256)
+    parser.add_argument("--lr", type=float, default=1e-3)
+    parser.add_argument("--warmup-epochs", type=int, default=5)
+    parser.add_argument("--val-fraction", type=float, default=0.2)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--out", default="best_model.pth")
+    parser.add_argument("--stats-out", default="stats.pt")
+    parser.add_argument("--device", default="cuda" if torch.cuda.is_available() else "cpu")
+    args = parser.parse_args()
+
+    train(
+        FeatureStore(args.store), args.epochs, args.batch_size, args.lr, args.warmup_epochs, args.val_fraction,
+        args.seed, args.out, args.stats_out, args.device,
+    )
+
+
+if __name__ == "__main__":
+    main()
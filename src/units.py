@@ -0,0 +1,283 @@
+import functools
+import logging
+import math
+import re
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Optional
+
+from model import FX_SETTINGS, FXSettings
+
+if TYPE_CHECKING:
+    import numpy as np
+
+logger = logging.getLogger("units")
+# (FX name, parameter name) -> whether its scale agrees with the values REAPER formats
+_scale_checks: dict[tuple[str, str], bool] = {}
+
+_FORMATTED_NUMBER = re.compile(r"^\s*([-+]?(?:\d+\.?\d*|\.\d+))\s*(k(?![a-z]))?", re.IGNORECASE)
+
+
+@dataclass(frozen=True)
+class UnitScale:
+    """Physical range of a parameter: normalized 0.0 maps to `low`, 1.0 to `high`."""
+
+    unit: str
+    low: float
+    high: float
+    log: bool = False
+
+
+HZ = UnitScale("Hz", 20.0, 20000.0, log=True)
+EQ_GAIN_DB = UnitScale("dB", -12.0, 12.0)
+
+# Settings fields given in physical units; the others (bandwidth, wet, dry, bypass, ...)
+# stay normalized between 0.0 and 1.0. The ranges are checked against the values REAPER
+# formats for the parameters (see `check_scale`), and not used for writes when they disagree
+FIELD_SCALES = {
+    "ReaEQ": {
+        "freq_low_shelf": HZ,
+        "gain_low_shelf": EQ_GAIN_DB,
+        "freq_band_2": HZ,
+        "gain_band_2": EQ_GAIN_DB,
+        "freq_band_3": HZ,
+        "gain_band_3": EQ_GAIN_DB,
+        "freq_high_shelf_4": HZ,
+        "gain_high_shelf_4": EQ_GAIN_DB,
+        "freq_high_pass_5": HZ,
+        "gain_high_pass_5": EQ_GAIN_DB,
+    },
+    "ReaComp": {
+        "threshold": UnitScale("dB", -60.0, 0.0),
+        "ratio": UnitScale("ratio", 1.0, 100.0, log=True),
+        "attack": UnitScale("ms", 0.0, 500.0),
+        "release": UnitScale("ms", 0.0, 5000.0),
+        "pre_comp": UnitScale("ms", 0.0, 250.0),
+        "lowpass": HZ,
+        "hipass": HZ,
+        "rms_size": UnitScale("ms", 0.0, 1000.0),
+        "knee": UnitScale("dB", 0.0, 24.0),
+    },
+    "ReaVerbate": {
+        "delay": UnitScale("ms", 0.0, 500.0),
+        "lowpass": HZ,
+        "hipass": HZ,
+    },
+    "ReaDelay": {
+        "length_time": UnitScale("ms", 0.0, 10000.0),
+        "lowpass": HZ,
+        "hipass": HZ,
+    },
+}
+
+
+@dataclass(frozen=True)
+class _ScaleTable:
+    """Scales of the fields of a settings model, as arrays aligned with its FIELDS."""
+
+    scaled: "np.ndarray"
+    log: "np.ndarray"
+    low: "np.ndarray"
+    high: "np.ndarray"
+
+
+@functools.lru_cache(maxsize=None)
+def _scale_table(fx_type: str) -> _ScaleTable:
+    import numpy as np
+
+    scales = FIELD_SCALES.get(fx_type, {})
+    # Unscaled fields get a harmless 1..2 range so the vectorized formulas stay finite
+    identity = UnitScale("", 1.0, 2.0)
+    columns = [scales.get(name, identity) for name in FX_SETTINGS[fx_type].FIELDS]
+    return _ScaleTable(
+        scaled=np.array([name in scales for name in FX_SETTINGS[fx_type].FIELDS]),
+        log=np.array([scale.log for scale in columns]),
+        low=np.array([scale.low for scale in columns], dtype=np.float64),
+        high=np.array([scale.high for scale in columns], dtype=np.float64),
+    )
+
+
+def to_normalized(fx_type: str, values):
+    """
+    Convert field values from physical units to normalized 0.0-1.0 values.
+
+    Args:
+        fx_type (str): FX plugin, a key of FX_SETTINGS.
+        values: Array of shape (..., len(FIELDS)) in the field order of the settings model,
+            NaN for unset fields.
+
+    Returns:
+        np.ndarray: The normalized values, clipped to 0.0-1.0 for the fields with a unit.
+    """
+    import numpy as np
+
+    table = _scale_table(fx_type)
+    values = np.asarray(values, dtype=np.float64)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        linear = (values - table.low) / (table.high - table.low)
+        logarithmic = np.log(np.maximum(values, table.low) / table.low) / np.log(table.high / table.low)
+    normalized = np.clip(np.where(table.log, logarithmic, linear), 0.0, 1.0)
+    return np.where(table.scaled, normalized, values)
+
+
+def from_normalized(fx_type: str, values):
+    """
+    Convert normalized field values back to physical units, the inverse of `to_normalized`.
+
+    Args:
+        fx_type (str): FX plugin, a key of FX_SETTINGS.
+        values: Array of shape (..., len(FIELDS)) of normalized values.
+
+    Returns:
+        np.ndarray: The values in physical units for the fields with a unit.
+    """
+    import numpy as np
+
+    table = _scale_table(fx_type)
+    values = np.asarray(values, dtype=np.float64)
+    linear = table.low + values * (table.high - table.low)
+    with np.errstate(divide="ignore", invalid="ignore", over="ignore"):
+        logarithmic = table.low * np.power(table.high / table.low, values)
+    return np.where(table.scaled, np.where(table.log, logarithmic, linear), values)
+
+
+def normalize_settings(fx_type: str, settings: list[FXSettings]) -> list[FXSettings]:
+    """
+    Convert many settings of the same FX type from physical units in one vectorized pass.
+
+    Args:
+        fx_type (str): FX plugin, a key of FX_SETTINGS.
+        settings (list[FXSettings]): Settings in physical units.
+
+    Returns:
+        list[FXSettings]: The same settings with normalized values.
+    """
+    import numpy as np
+
+    settings_cls = FX_SETTINGS[fx_type]
+    if not settings:
+        return []
+    normalized = to_normalized(fx_type, np.stack([values.to_vector() for values in settings]))
+    return [settings_cls.from_vector(row) for row in normalized]
+
+
+@functools.lru_cache(maxsize=None)
+def param_scales(fx_name: str) -> dict[str, UnitScale]:
+    """
+    Args:
+        fx_name (str): Full name of an FX plugin, e.g. "VST: ReaEQ (Cockos)".
+
+    Returns:
+        dict[str, UnitScale]: REAPER parameter name -> physical scale, for the parameters
+        of the plugin that have a unit.
+    """
+    fx_type = fx_settings_type(fx_name)
+    if fx_type is None:
+        return {}
+    settings_cls = FX_SETTINGS[fx_type]
+    return {settings_cls.FIELD_PARAMS[name]: scale for name, scale in FIELD_SCALES.get(fx_type, {}).items()}
+
+
+def fx_settings_type(fx_name: str) -> Optional[str]:
+    """The key of FX_SETTINGS matching a full or short FX name, if any."""
+    return next((fx_type for fx_type in FX_SETTINGS if fx_type in fx_name), None)
+
+
+def to_physical(scales: list[UnitScale], normalized):
+    """
+    Convert normalized parameter values to physical units, one scale per value.
+
+    Args:
+        scales (list[UnitScale]): Scale of each value.
+        normalized: Normalized values.
+
+    Returns:
+        np.ndarray: The values in the units of their scale.
+    """
+    import numpy as np
+
+    normalized = np.asarray(normalized, dtype=np.float64)
+    low = np.array([scale.low for scale in scales], dtype=np.float64)
+    high = np.array([scale.high for scale in scales], dtype=np.float64)
+    log = np.array([scale.log for scale in scales], dtype=bool)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        logarithmic = low * np.power(np.where(log, high / low, 1.0), normalized)
+    return np.where(log, logarithmic, low + normalized * (high - low))
+
+
+def parse_formatted(formatted: str) -> Optional[float]:
+    """
+    The number in a parameter value as REAPER formats it ("-6.0", "1000 Hz", "1.2k",
+    "4.0:1"), None when there is none ("-inf", "off", ...).
+    """
+    match = _FORMATTED_NUMBER.match(formatted or "")
+    if match is None:
+        return None
+    return float(match[1]) * (1000.0 if match[2] else 1.0)
+
+
+def scale_matches(scale: UnitScale, physical: float, formatted: str, tolerance: float = 0.02) -> bool:
+    """
+    Check a value converted with a scale against the value REAPER formats for the parameter.
+
+    Args:
+        scale (UnitScale): Scale the value was converted with.
+        physical (float): The converted value.
+        formatted (str): The parameter value as REAPER formats it.
+        tolerance (float): Allowed difference, as a fraction of the range of the scale
+            (of its logarithm for logarithmic scales).
+
+    Returns:
+        bool: False if the formatted value is a number that disagrees with the converted
+        one, True otherwise.
+    """
+    shown = parse_formatted(formatted)
+    if shown is None:
+        return True
+    if scale.log:
+        if shown <= 0 or physical <= 0:
+            return False
+        return abs(math.log(physical / shown)) <= tolerance * math.log(scale.high / scale.low)
+    return abs(physical - shown) <= tolerance * (scale.high - scale.low)
+
+
+def warn_scale_mismatch(fx_name: str, param_name: str, unit: str, physical: float, formatted: str):
+    """Remember that a scale of FIELD_SCALES disagrees with REAPER, and log it once."""
+    if _scale_checks.get((fx_name, param_name)) is False:
+        return
+    _scale_checks[(fx_name, param_name)] = False
+    logger.warning(
+        "%s / %s: the scale of FIELD_SCALES gives %.4g %s, REAPER shows %r",
+        fx_name, param_name, physical, unit, formatted,
+    )
+
+
+def check_scale(fx_name: str, param_name: str, scale: UnitScale, normalized: float, formatted: str) -> bool:
+    """
+    Check the scale of a parameter against a value REAPER formats for it, once per
+    parameter of each plugin: the verdict is remembered, including mismatches seen while
+    reporting values.
+
+    Args:
+        fx_name (str): Full name of the FX plugin.
+        param_name (str): REAPER parameter name.
+        scale (UnitScale): Scale of the parameter in FIELD_SCALES.
+        normalized (float): A normalized value of the parameter.
+        formatted (str): The same value as REAPER formats it.
+
+    Returns:
+        bool: False if the scale is known to disagree with REAPER, True otherwise,
+        including when `formatted` holds no number to check against.
+    """
+    key = (fx_name, param_name)
+    if key not in _scale_checks and parse_formatted(formatted) is not None:
+        physical = float(to_physical([scale], [normalized])[0])
+        if scale_matches(scale, physical, formatted):
+            _scale_checks[key] = True
+        else:
+            warn_scale_mismatch(fx_name, param_name, scale.unit, physical, formatted)
+    return _scale_checks.get(key, True)
+
+
+def known_scale_check(fx_name: str, param_name: str) -> Optional[bool]:
+    """The remembered verdict of `check_scale` for a parameter, None if not checked yet."""
+    return _scale_checks.get((fx_name, param_name))
@@ -0,0 +1,158 @@
+import contextvars
+import logging
+import threading
+from collections import deque
+from concurrent.futures import Future
+from dataclasses import dataclass, field
+from typing import Any, Callable, Hashable, Optional
+
+import daw
+
+logger = logging.getLogger("write_queue")
+
+
+@dataclass
+class _Write:
+    apply: Callable[[Any], Any]
+    value: Any
+    key: Optional[Hashable]
+    tracks: set
+    context: contextvars.Context
+    futures: list = field(default_factory=list)
+
+
+class WriteQueue:
+    """
+    Single writer thread applying DAW writes in the order they were submitted.
+
+    A write with a `key` (e.g. the volume of a track) is merged into a pending write with
+    the same key, as long as no write without a key was queued after it: the DAW sees
+    one write with the merged value, and every caller gets its result. Writes are drained
+    in batches, each run inside REAPER while holding `lock`, which is released between
+    batches so that reads can interleave with a long series of writes.
+    """
+
+    def __init__(
+        self,
+        lock,
+        prepare: Callable[[], None] = lambda: None,
+        on_batch: Callable[[set], None] = lambda tracks: None,
+        batch_size: int = 64,
+    ):
+        """
+        Args:
+            lock: Lock serializing every access to the DAW.
+            prepare: Called before each batch, with the lock held.
+            on_batch: Called after each batch with the tracks it wrote, with the lock held. Its
+                errors are logged, the writes of the batch keep their results.
+            batch_size (int): Maximum number of writes per batch.
+        """
+        self.lock = lock
+        self.prepare = prepare
+        self.on_batch = on_batch
+        self.batch_size = batch_size
+        self.submitted = 0
+        self.merged = 0
+        self.batches = 0
+        self._pending: deque[_Write] = deque()
+        self._mergeable: dict[Hashable, _Write] = {}
+        self._condition = threading.Condition()
+        self._thread = None
+
+    def submit(
+        self,
+        apply: Callable[[Any], Any],
+        value: Any = None,
+        key: Optional[Hashable] = None,
+        merge: Callable[[Any, Any], Any] = lambda old, new: new,
+        tracks=(),
+    ) -> Future:
+        """
+        Queue a write.
+
+        Args:
+            apply: Performs the write on the writer thread, called with the value.
+            value: Value of the write.
+            key: What the write targets; pending writes with the same key are merged.
+            merge: Combines the value of the pending write with the new one.
+            tracks: Names of the tracks the write touches.
+
+        Returns:
+            Future: Resolves to the result of `apply`.
+        """
+        future = Future()
+        with self._condition:
+            self.submitted += 1
+            pending = self._mergeable.get(key) if key is not None else None
+            if pending is not None:
+                pending.value = merge(pending.value, value)
+                pending.tracks.update(tracks)
+                pending.futures.append(future)
+                self.merged += 1
+                return future
+
+            write = _Write(apply, value, key, set(tracks), contextvars.copy_context(), [future])
+            self._pending.append(write)
+            if key is None:
+                # Later writes must not jump ahead of this one
+                self._mergeable.clear()
+            else:
+                self._mergeable[key] = write
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="daw-writer", daemon=True)
+                self._thread.start()
+            self._condition.notify()
+        return future
+
+    def _next_batch(self) -> list[_Write]:
+        with self._condition:
+            while not self._pending:
+                self._condition.wait()
+            batch = [self._pending.popleft() for _ in range(min(self.batch_size, len(self._pending)))]
+            for write in batch:
+                if write.key is not None and self._mergeable.get(write.key) is write:
+                    del self._mergeable[write.key]
+            return batch
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            results = []
+            with self.lock:
+                try:
+                    self.prepare()
+                    with daw.inside_reaper():
+                        for write in batch:
+                            try:
+                                results.append((write.context.run(write.apply, write.value), None))
+                            except Exception as e:
+                                results.append((None, e))
+                except Exception as e:
+                    if len(results) == len(batch):
+                        logger.exception("write batch: leaving REAPER failed after %d writes", len(batch))
+                    ran = len(results)
+                    # The writes that did not run fail with the batch
+                    results.extend([(None, e)] * (len(batch) - ran))
+                else:
+                    ran = len(batch)
+                if ran:
+                    try:
+                        self.on_batch(set().union(*(write.tracks for write in batch[:ran])))
+                    except Exception:
+                        logger.exception("write batch: on_batch failed after %d writes", ran)
+            self.batches += 1
+            for write, (result, error) in zip(batch, results):
+                for future in write.futures:
+                    if error is not None:
+                        future.set_exception(error)
+                    else:
+                        future.set_result(result)
+
+    def stats(self) -> dict:
+        with self._condition:
+            return {
+                "pending": len(self._pending),
+                "submitted": self.submitted,
+                "merged": self.merged,
+                "batches": self.batches,
+            }